@@ -0,0 +1,228 @@
+## version 1
+"""FBReelz archival transcode: re-encode cold cached reels to save space.
+
+Purpose
+- Cached reels keep the codec and bitrate Facebook served. Old reels that nobody
+  watches any more take up most of the cache.
+- A reel is cold when it was cached at least --min-age days ago and the NGINX
+  access log (current and rotated files) shows no /cache/ or /api/video/ request
+  for it in --idle days.
+- Cold .mp4 files are re-encoded with ffmpeg in a process pool. The workers run at
+  nice 10, and pool size x ffmpeg threads stays within the CPU count. Output is
+  H.264 at CRF 28 by default; --codec hevc or av1 saves more but not every browser
+  can play it.
+- The original is only replaced when:
+  - the new file passes the integrity check,
+  - its duration matches the original within 0.5 s (or 1%), and
+  - it is at least --min-saving smaller.
+  The swap is an atomic rename, so a player that has the old file open keeps
+  reading it. The cache manifest is then updated.
+- archive_state.json records every attempt: bytes before and after, codec, or why the
+  file was kept. Files that were already tried are not tried again. The total space
+  saved is printed after every run.
+
+Usage
+  python /app/fbreelz_archive.py --dry-run                     # list what is cold
+  python /app/fbreelz_archive.py --min-age 30 --idle 14 --max 50
+  python /app/fbreelz_archive.py --codec hevc --jobs 2
+"""
+
+from __future__ import annotations
+
+import argparse
+import gzip
+import json
+import os
+import re
+import subprocess
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, Iterator, List
+
+import fbreelz_cachelayout as cachelayout
+from fbreelz_governor import DEFAULT_ACCESS_LOG, _log_time
+from fbreelz_integrity import CACHE_FILE_NAME, IntegrityCache, _key, _probe
+
+
+DEFAULT_DATA_DIR = Path("/app/data")
+STATE_NAME = "archive_state.json"
+NICE = 10
+MIN_SAVING = 0.10
+CODECS: Dict[str, List[str]] = {
+    "h264": ["-c:v", "libx264", "-preset", "slow", "-crf", "28", "-pix_fmt", "yuv420p"],
+    "hevc": ["-c:v", "libx265", "-preset", "medium", "-crf", "30", "-tag:v", "hvc1", "-pix_fmt", "yuv420p"],
+    "av1": ["-c:v", "libsvtav1", "-preset", "8", "-crf", "38", "-pix_fmt", "yuv420p"],
+}
+AUDIO = ["-c:a", "aac", "-b:a", "96k"]
+
+_PLAY_RE = re.compile(r'\[([^\]]+)\] "(?:GET|HEAD) /(?:cache|api/video)/(?:[^ ?"]*/)?facebook_(\d+)\.')
+
+
+def _log_lines(path: Path) -> Iterator[str]:
+    """Lines of the access log and its rotated siblings (.1, .2.gz, ...)."""
+    for p in sorted(path.parent.glob(path.name + "*")):
+        try:
+            opener = gzip.open if p.suffix == ".gz" else open
+            with opener(p, "rt", encoding="utf-8", errors="replace") as f:
+                yield from f
+        except OSError:
+            continue
+
+
+def last_played(access_log: Path) -> Dict[str, float]:
+    """reel id -> unix time of the newest playback request in the logs."""
+    out: Dict[str, float] = {}
+    for line in _log_lines(access_log):
+        m = _PLAY_RE.search(line)
+        if not m:
+            continue
+        t = _log_time(m.group(1))
+        if t and t > out.get(m.group(2), 0.0):
+            out[m.group(2)] = t
+    return out
+
+
+def _nice() -> None:
+    try:
+        os.nice(NICE)
+    except OSError:
+        pass
+
+
+def _transcode(src: str, codec: str, threads: int, duration: float, min_saving: float) -> Dict[str, Any]:
+    """Pool worker: encode src next to itself, verify, and swap it in. Returns a state record."""
+    path = Path(src)
+    before = path.stat().st_size
+    tmp = path.with_name(path.name + ".archive.tmp")
+    rec: Dict[str, Any] = {"codec": codec, "bytes_before": before, "at": datetime.now(timezone.utc).isoformat()}
+    cmd = ["ffmpeg", "-v", "error", "-nostdin", "-y", "-i", str(path), "-map", "0:v:0?", "-map", "0:a:0?",
+           "-threads", str(threads), *CODECS[codec], *AUDIO, "-movflags", "+faststart", "-f", "mp4", str(tmp)]
+    t0 = time.monotonic()
+    try:
+        p = subprocess.run(cmd, capture_output=True, text=True)
+        rec["seconds"] = round(time.monotonic() - t0, 1)
+        if p.returncode != 0:
+            return dict(rec, result="failed", reason=(p.stderr or "ffmpeg failed").strip()[-300:])
+        after = tmp.stat().st_size
+        rec["bytes_after"] = after
+        res = _probe(tmp, after)
+        if not res.ok:
+            return dict(rec, result="failed", reason=f"output failed integrity check: {res.reason}")
+        if res.duration is None:
+            return dict(rec, result="failed", reason="output has no readable duration")
+        if abs(res.duration - duration) > max(0.5, 0.01 * duration):
+            return dict(rec, result="failed", reason=f"duration {res.duration:.2f}s != original {duration:.2f}s")
+        if after > before * (1 - min_saving):
+            return dict(rec, result="kept", reason=f"only {100 * (1 - after / before):.0f}% smaller")
+        os.replace(tmp, path)
+        return dict(rec, result="archived")
+    finally:
+        tmp.unlink(missing_ok=True)
+
+
+def _load_state(path: Path) -> Dict[str, Any]:
+    try:
+        data = json.loads(path.read_text(encoding="utf-8"))
+        if isinstance(data.get("items"), dict):
+            return data
+    except (OSError, ValueError):
+        pass
+    return {"items": {}, "bytes_saved": 0}
+
+
+def _save_state(path: Path, state: Dict[str, Any]) -> None:
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_text(json.dumps(state, indent=1, sort_keys=True), encoding="utf-8")
+    os.replace(tmp, path)
+
+
+def main() -> int:
+    cpus = os.cpu_count() or 1
+    ap = argparse.ArgumentParser(description="Re-encode cold FBReelz cache files to save space")
+    ap.add_argument("--data-dir", default=str(DEFAULT_DATA_DIR), help=f"Data directory (default: {DEFAULT_DATA_DIR})")
+    ap.add_argument("--access-log", default=str(DEFAULT_ACCESS_LOG), help=f"NGINX access log (default: {DEFAULT_ACCESS_LOG})")
+    ap.add_argument("--min-age", type=float, default=30.0, help="Days since the file was cached (default: 30)")
+    ap.add_argument("--idle", type=float, default=14.0, help="Days without a playback request (default: 14)")
+    ap.add_argument("--codec", choices=sorted(CODECS), default="h264", help="Target video codec (default: h264)")
+    ap.add_argument("--jobs", type=int, default=max(1, cpus // 2), help=f"Parallel encodes (default: {max(1, cpus // 2)}, max CPU count)")
+    ap.add_argument("--max", type=int, default=50, help="Max files to encode this run (default: 50)")
+    ap.add_argument("--min-saving", type=float, default=MIN_SAVING,
+                    help=f"Keep the original unless the new file is at least this much smaller (default: {MIN_SAVING})")
+    ap.add_argument("--dry-run", action="store_true", help="Only list the cold files")
+    args = ap.parse_args()
+
+    data_dir = Path(args.data_dir)
+    cache_dir = data_dir / "cache"
+    state_path = data_dir / STATE_NAME
+    state = _load_state(state_path)
+    played = last_played(Path(args.access_log))
+    ic = IntegrityCache(data_dir / CACHE_FILE_NAME)
+    now = time.time()
+
+    cold: List[tuple] = []
+    for p in cachelayout.iter_media(cache_dir, (".mp4",)):
+        mid = cachelayout.media_id(p)
+        if not mid:
+            continue
+        st = p.stat()
+        if state["items"].get(mid, {}).get("key") == _key(st):
+            continue  # already archived, kept or failed for this exact file
+        if now - st.st_mtime < args.min_age * 86400 or now - played.get(mid, 0.0) < args.idle * 86400:
+            continue
+        cold.append((st.st_size, mid, p))
+    cold.sort(reverse=True)  # biggest first: most to gain
+    cold = cold[: max(0, args.max)]
+    print(f"[OK] {len(cold)} cold file(s), {sum(c[0] for c in cold) / 1e6:.1f} MB"
+          f" (cached > {args.min_age:g} days, not played for {args.idle:g} days)")
+    if args.dry_run:
+        for size, mid, p in cold:
+            last = played.get(mid)
+            seen = datetime.fromtimestamp(last).date().isoformat() if last else "never"
+            print(f"  {size / 1e6:8.1f} MB  {p.name}  last played: {seen}")
+        return 0
+
+    jobs = max(1, min(args.jobs, cpus))
+    threads = max(1, cpus // jobs)
+    todo = []
+    for size, mid, p in cold:
+        res = ic.check(p)
+        if res.ok and res.duration:
+            todo.append((mid, p, res.duration))
+        else:
+            print(f"[WARN] Skipping {p.name}: {res.reason or 'unknown duration'}")
+    ic.save()
+
+    saved = 0
+    with ProcessPoolExecutor(max_workers=jobs, initializer=_nice) as pool:
+        futures = {pool.submit(_transcode, str(p), args.codec, threads, dur, args.min_saving): (mid, p) for mid, p, dur in todo}
+        for fut in as_completed(futures):
+            mid, p = futures[fut]
+            try:
+                rec = fut.result()
+            except Exception as e:  # worker died; leave the original alone
+                rec = {"result": "failed", "reason": f"{type(e).__name__}: {e}"}
+            if rec["result"] == "archived":
+                cachelayout.record(cache_dir, p)
+                gain = rec["bytes_before"] - rec["bytes_after"]
+                saved += gain
+                print(f"[OK] {p.name}: {rec['bytes_before'] / 1e6:.1f} -> {rec['bytes_after'] / 1e6:.1f} MB in {rec['seconds']}s")
+            else:
+                print(f"[{'INFO' if rec['result'] == 'kept' else 'WARN'}] {p.name}: {rec['result']} ({rec.get('reason', '')})")
+            try:
+                rec["key"] = _key(p.stat())
+            except OSError:
+                pass
+            state["items"][mid] = rec
+            _save_state(state_path, state)
+
+    state["bytes_saved"] = int(state.get("bytes_saved", 0)) + saved
+    state["updated_at_utc"] = datetime.now(timezone.utc).isoformat()
+    _save_state(state_path, state)
+    print(f"[OK] Saved {saved / 1e6:.1f} MB this run, {state['bytes_saved'] / 1e6:.1f} MB in total -> {state_path}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
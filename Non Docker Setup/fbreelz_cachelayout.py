@@ -0,0 +1,297 @@
+## version 1
+"""FBReelz cache layout: optional sharded cache/ directory plus a manifest.
+
+Purpose
+- Everything used to land flat in cache/ as facebook_<id>.<ext>. With thousands
+  of files, readdir/glob over that directory gets slow everywhere.
+- In the sharded layout each file lives in a 256-way bucket keyed by a hash of
+  its ID: cache/<xx>/facebook_<id>.<ext> (xx = first two hex chars of sha1(id)).
+- cache/manifest.json maps every ID to its relative path, size and sha256, so
+  lookups never need to list the directory.
+- The layout is recorded in cache/.layout; every tool (Phase 2, queue workers,
+  prefetch, playlist builders) follows whatever the cache says.
+- NGINX needs no change: /cache/ is an alias for the directory, so
+  /cache/<xx>/facebook_<id>.mp4 works like the flat URL did.
+
+Usage
+  python fbreelz_cachelayout.py --migrate sharded     # convert an existing flat cache (updates resolved_items.json)
+  python fbreelz_cachelayout.py --migrate flat        # and back
+  python fbreelz_cachelayout.py --rebuild-manifest    # re-scan files, re-hash changed ones
+  python fbreelz_cachelayout.py --verify              # check sizes/hashes against the manifest
+"""
+
+from __future__ import annotations
+
+import argparse
+import contextlib
+import fcntl
+import hashlib
+import json
+import os
+import re
+import sqlite3
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, Iterator, Optional
+
+
+DEFAULT_CACHE_DIR = Path("/app/data/cache")
+LAYOUT_FILE = ".layout"
+MANIFEST_NAME = "manifest.json"
+MEDIA_SUFFIXES = (".mp4", ".m4a", ".mov", ".webm", ".mkv")
+_PARTIAL_SUFFIXES = (".part", ".ytdl", ".tmp")
+_SHARD_RE = re.compile(r"^[0-9a-f]{2}$")
+_NAME_RE = re.compile(r"^facebook_([^.]+)\.")
+
+
+def layout(cache_dir: Path) -> str:
+    try:
+        return (cache_dir / LAYOUT_FILE).read_text(encoding="utf-8").strip() or "flat"
+    except OSError:
+        return "flat"
+
+
+def shard(media_id: str) -> str:
+    return hashlib.sha1(media_id.encode("utf-8")).hexdigest()[:2]
+
+
+def target_dir(cache_dir: Path, media_id: Optional[str]) -> Path:
+    """Where a new download for `media_id` goes under the cache's current layout."""
+    if media_id and layout(cache_dir) == "sharded":
+        return cache_dir / shard(media_id)
+    return cache_dir
+
+
+def rel_path(path: str) -> str:
+    """cache-relative URL path for a cached file: 'facebook_1.mp4' or 'ab/facebook_1.mp4'."""
+    p = Path(path)
+    return f"{p.parent.name}/{p.name}" if _SHARD_RE.match(p.parent.name) else p.name
+
+
+def media_id(path: Path) -> Optional[str]:
+    m = _NAME_RE.match(path.name)
+    return m.group(1) if m else None
+
+
+def iter_media(cache_dir: Path, suffixes=MEDIA_SUFFIXES) -> Iterator[Path]:
+    """Cached media files in either layout (skips head/, .quarantine/ and partial downloads)."""
+    dirs = [cache_dir]
+    try:
+        dirs += sorted(d for d in cache_dir.iterdir() if d.is_dir() and _SHARD_RE.match(d.name))
+    except OSError:
+        return
+    for d in dirs:
+        for p in d.glob("facebook_*"):
+            if p.is_file() and p.suffix.lower() in suffixes and not p.name.endswith(_PARTIAL_SUFFIXES):
+                yield p
+
+
+def _sha256(path: Path) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for buf in iter(lambda: f.read(1 << 20), b""):
+            h.update(buf)
+    return h.hexdigest()
+
+
+@contextlib.contextmanager
+def _locked(cache_dir: Path):
+    """Exclusive lock for manifest read-modify-write (queue workers may share the cache)."""
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    with open(cache_dir / (MANIFEST_NAME + ".lock"), "w") as lf:
+        fcntl.flock(lf, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lf, fcntl.LOCK_UN)
+
+
+def load_manifest(cache_dir: Path) -> Dict[str, Any]:
+    try:
+        data = json.loads((cache_dir / MANIFEST_NAME).read_text(encoding="utf-8"))
+        if isinstance(data.get("items"), dict):
+            return data
+    except (OSError, ValueError):
+        pass
+    return {"version": 1, "layout": layout(cache_dir), "items": {}}
+
+
+def _save_manifest(cache_dir: Path, manifest: Dict[str, Any]) -> None:
+    manifest["layout"] = layout(cache_dir)
+    manifest["updated_utc"] = datetime.now(timezone.utc).isoformat()
+    path = cache_dir / MANIFEST_NAME
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_text(json.dumps(manifest, indent=1, sort_keys=True), encoding="utf-8")
+    os.replace(tmp, path)
+
+
+def _entry(cache_dir: Path, path: Path, old: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    st = path.stat()
+    rel = path.relative_to(cache_dir).as_posix()
+    if old and old.get("size") == st.st_size and old.get("mtime_ns") == st.st_mtime_ns and old.get("sha256"):
+        return dict(old, path=rel)
+    return {"path": rel, "size": st.st_size, "mtime_ns": st.st_mtime_ns, "sha256": _sha256(path)}
+
+
+def record(cache_dir: Path, path: Path) -> None:
+    """Add/refresh one downloaded file in the manifest."""
+    mid = media_id(path)
+    if not mid:
+        return
+    entry = _entry(cache_dir, path)  # hash outside the lock
+    with _locked(cache_dir):
+        manifest = load_manifest(cache_dir)
+        manifest["items"][mid] = entry
+        _save_manifest(cache_dir, manifest)
+
+
+def forget(cache_dir: Path, mid: str) -> None:
+    with _locked(cache_dir):
+        manifest = load_manifest(cache_dir)
+        if manifest["items"].pop(mid, None) is not None:
+            _save_manifest(cache_dir, manifest)
+
+
+def find(cache_dir: Path, mid: str, manifest: Optional[Dict[str, Any]] = None) -> Optional[Path]:
+    """Cached file for an ID: manifest first, then the shard and flat locations."""
+    entry = (manifest or load_manifest(cache_dir))["items"].get(mid)
+    if entry:
+        p = cache_dir / entry["path"]
+        if p.is_file():
+            return p
+    for d in (cache_dir / shard(mid), cache_dir):
+        for p in d.glob(f"facebook_{mid}.*"):
+            if p.is_file() and not p.name.endswith(_PARTIAL_SUFFIXES) and p.suffix.lower() in MEDIA_SUFFIXES:
+                return p
+    return None
+
+
+def rebuild_manifest(cache_dir: Path) -> Dict[str, Any]:
+    with _locked(cache_dir):
+        old = load_manifest(cache_dir)["items"]
+        items: Dict[str, Any] = {}
+        for p in iter_media(cache_dir):
+            mid = media_id(p)
+            if mid:
+                items[mid] = _entry(cache_dir, p, old.get(mid))
+        manifest = {"version": 1, "items": items}
+        _save_manifest(cache_dir, manifest)
+    return manifest
+
+
+def _moved_path(old: Optional[str], moves: Dict[str, str]) -> Optional[str]:
+    """New location for a recorded downloaded_path, keeping its cache root.
+
+    Paths are matched by cache-relative name, so container paths (/app/data/cache/...)
+    are rewritten correctly when the migration runs on the host (/opt/fbreelz/data/cache/...).
+    """
+    if not old:
+        return None
+    old_rel = rel_path(old)
+    new_rel = moves.get(old_rel)
+    if new_rel is None or not old.endswith(old_rel):
+        return None
+    return old[: len(old) - len(old_rel)] + new_rel
+
+
+def _rewrite_paths(moves: Dict[str, str], resolved: Path, jobs_db: Path) -> None:
+    """Point downloaded_path at the new locations in resolved_items.json and the job queue."""
+    if not moves:
+        return
+    if resolved.exists():
+        data = json.loads(resolved.read_text(encoding="utf-8"))
+        n = 0
+        for it in data.get("items") or []:
+            new = _moved_path(it.get("downloaded_path"), moves) if isinstance(it, dict) else None
+            if new:
+                it["downloaded_path"] = new
+                n += 1
+        tmp = resolved.with_name(resolved.name + ".tmp")
+        tmp.write_text(json.dumps(data, indent=2, ensure_ascii=False), encoding="utf-8")
+        os.replace(tmp, resolved)
+        print(f"[OK] Updated {n} path(s) in {resolved}")
+    if jobs_db.exists():
+        db = sqlite3.connect(str(jobs_db), timeout=60)
+        with db:
+            for url, body in db.execute("SELECT url, data FROM items WHERE data IS NOT NULL").fetchall():
+                it = json.loads(body)
+                new = _moved_path(it.get("downloaded_path"), moves)
+                if new:
+                    it["downloaded_path"] = new
+                    db.execute("UPDATE items SET data = ? WHERE url = ?", (json.dumps(it, ensure_ascii=False), url))
+        db.close()
+        print(f"[OK] Updated paths in {jobs_db}")
+
+
+def migrate(cache_dir: Path, to: str, resolved: Path, jobs_db: Path) -> int:
+    """Move every cached file into the `to` layout; returns the number of files moved."""
+    (cache_dir / LAYOUT_FILE).write_text(to + "\n", encoding="utf-8")
+    moves: Dict[str, str] = {}  # old cache-relative path -> new one
+    for p in list(iter_media(cache_dir)):
+        mid = media_id(p)
+        if not mid:
+            continue
+        dest = target_dir(cache_dir, mid) / p.name
+        if dest == p:
+            continue
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        os.replace(p, dest)
+        moves[p.relative_to(cache_dir).as_posix()] = dest.relative_to(cache_dir).as_posix()
+    if to == "flat":
+        for d in cache_dir.iterdir():
+            if d.is_dir() and _SHARD_RE.match(d.name):
+                with contextlib.suppress(OSError):
+                    d.rmdir()
+    _rewrite_paths(moves, resolved, jobs_db)
+    rebuild_manifest(cache_dir)
+    return len(moves)
+
+
+def verify(cache_dir: Path) -> int:
+    bad = 0
+    manifest = load_manifest(cache_dir)
+    for mid, entry in sorted(manifest["items"].items()):
+        p = cache_dir / entry["path"]
+        if not p.is_file():
+            why = "missing"
+        elif p.stat().st_size != entry.get("size"):
+            why = "size mismatch"
+        elif entry.get("sha256") and _sha256(p) != entry["sha256"]:
+            why = "sha256 mismatch"
+        else:
+            continue
+        bad += 1
+        print(f"[BAD] {mid}: {entry['path']} ({why})")
+    print(f"[OK] Verified {len(manifest['items'])} manifest entries: {bad} bad")
+    return bad
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="FBReelz cache layout: sharded directories + manifest")
+    ap.add_argument("--cache-dir", default=str(DEFAULT_CACHE_DIR), help=f"Cache directory (default: {DEFAULT_CACHE_DIR})")
+    ap.add_argument("--resolved", default=None, help="resolved_items.json to update on migrate (default: <cache>/../resolved_items.json)")
+    ap.add_argument("--migrate", choices=("sharded", "flat"), default=None, help="Convert the cache to this layout")
+    ap.add_argument("--rebuild-manifest", action="store_true", help="Re-scan the cache and rewrite manifest.json")
+    ap.add_argument("--verify", action="store_true", help="Check files against manifest.json")
+    args = ap.parse_args()
+
+    cache_dir = Path(args.cache_dir)
+    if not cache_dir.exists():
+        raise SystemExit(f"[ERR] cache dir not found: {cache_dir}")
+
+    if args.migrate:
+        resolved = Path(args.resolved) if args.resolved else cache_dir.parent / "resolved_items.json"
+        n = migrate(cache_dir, args.migrate, resolved, cache_dir.parent / "jobs.sqlite")
+        print(f"[OK] Cache is now {args.migrate}: moved {n} file(s)")
+    elif args.rebuild_manifest:
+        manifest = rebuild_manifest(cache_dir)
+        print(f"[OK] Manifest: {len(manifest['items'])} item(s) ({layout(cache_dir)} layout)")
+    if args.verify:
+        return 1 if verify(cache_dir) else 0
+    if not (args.migrate or args.rebuild_manifest):
+        print(f"[INFO] Layout: {layout(cache_dir)}, manifest entries: {len(load_manifest(cache_dir)['items'])}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,356 @@
+## version 1
+"""FBReelz catalog service: indexed search over resolved_items.json.
+
+Purpose
+- The Node /api/videos endpoint lists a directory; there is no way to search
+  hundreds of reels by title or filter by duration.
+- This service keeps, in memory:
+  - an inverted index of title tokens (AND match; the last token matches as a prefix),
+  - sorted indexes on duration and save date (first_seen_utc, then Saved order),
+  and answers with cursor (keyset) pagination, so paging stays stable while
+  the catalog changes underneath.
+- resolved_items.json is re-checked at most every --reload-interval seconds;
+  when Phase 2 rewrites it only the added/changed/removed items are re-indexed.
+
+Endpoints
+  GET /api/catalog/search?q=dance&min_duration=10&max_duration=90&sort=saved|duration&order=desc&limit=50&cursor=...
+  GET /api/catalog/items/<id>
+  GET /api/catalog/health
+
+Usage (inside container)
+  python /app/fbreelz_catalog.py --port 8083
+"""
+
+from __future__ import annotations
+
+import argparse
+import base64
+import bisect
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Set, Tuple
+from urllib.parse import parse_qs, urlparse
+
+import fbreelz_phase2_resolve as phase2
+from fbreelz_jsonstream import iter_array
+from fbreelz_shards import entry
+
+
+DEFAULT_RESOLVED = Path("/app/data/resolved_items.json")
+MAX_LIMIT = 200
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+SortKey = Tuple[Any, ...]
+
+
+def _tokens(text: str) -> Set[str]:
+    return set(_TOKEN_RE.findall((text or "").lower()))
+
+
+def _item_id(it: Dict[str, Any]) -> Optional[str]:
+    return phase2._reel_id(it.get("source_url") or "")
+
+
+class SortedIndex:
+    """Sorted list of (key, id) supporting insert/remove and keyset pagination."""
+
+    def __init__(self) -> None:
+        self.rows: List[Tuple[SortKey, str]] = []
+
+    def add(self, key: SortKey, rid: str) -> None:
+        bisect.insort(self.rows, (key, rid))
+
+    def remove(self, key: SortKey, rid: str) -> None:
+        i = bisect.bisect_left(self.rows, (key, rid))
+        if i < len(self.rows) and self.rows[i] == (key, rid):
+            del self.rows[i]
+
+    def range_ids(self, lo: SortKey, hi: SortKey) -> Set[str]:
+        i = bisect.bisect_left(self.rows, (lo, ""))
+        j = bisect.bisect_right(self.rows, (hi, "￿"))
+        return {rid for _, rid in self.rows[i:j]}
+
+    def walk(self, desc: bool, after: Optional[Tuple[SortKey, str]]):
+        """Yield (key, id) in order, starting strictly after the cursor row."""
+        if desc:
+            i = (bisect.bisect_left(self.rows, after) if after else len(self.rows)) - 1
+            while i >= 0:
+                yield self.rows[i]
+                i -= 1
+        else:
+            i = bisect.bisect_right(self.rows, after) if after else 0
+            while i < len(self.rows):
+                yield self.rows[i]
+                i += 1
+
+
+class Catalog:
+    def __init__(self, path: Path, reload_interval: float = 5.0) -> None:
+        self.path = path
+        self.reload_interval = reload_interval
+        self.lock = threading.RLock()
+        self.items: Dict[str, Dict[str, Any]] = {}
+        self.keys: Dict[str, Dict[str, SortKey]] = {}
+        self.postings: Dict[str, Set[str]] = {}
+        self.vocab: List[str] = []
+        self.by_duration = SortedIndex()
+        self.by_saved = SortedIndex()
+        self._mtime: Optional[float] = None
+        self._checked = 0.0
+
+    # -- indexing ---------------------------------------------------------
+    def _index(self, rid: str, it: Dict[str, Any], pos: int) -> None:
+        dur = it.get("duration")
+        keys = {
+            "duration": (dur if isinstance(dur, (int, float)) else -1,),
+            # Saved order is newest first, so a lower position means newer.
+            "saved": (it.get("first_seen_utc") or "", -pos),
+        }
+        self.items[rid] = it
+        self.keys[rid] = keys
+        self.by_duration.add(keys["duration"], rid)
+        self.by_saved.add(keys["saved"], rid)
+        for tok in _tokens(it.get("title") or ""):
+            if tok not in self.postings:
+                self.postings[tok] = set()
+                bisect.insort(self.vocab, tok)
+            self.postings[tok].add(rid)
+
+    def _unindex(self, rid: str) -> None:
+        it = self.items.pop(rid)
+        keys = self.keys.pop(rid)
+        self.by_duration.remove(keys["duration"], rid)
+        self.by_saved.remove(keys["saved"], rid)
+        for tok in _tokens(it.get("title") or ""):
+            ids = self.postings.get(tok)
+            if ids is None:
+                continue
+            ids.discard(rid)
+            if not ids:
+                del self.postings[tok]
+                i = bisect.bisect_left(self.vocab, tok)
+                if i < len(self.vocab) and self.vocab[i] == tok:
+                    del self.vocab[i]
+
+    def maybe_reload(self) -> None:
+        now = time.monotonic()
+        if now - self._checked < self.reload_interval and self._mtime is not None:
+            return
+        self._checked = now
+        try:
+            mtime = self.path.stat().st_mtime
+        except OSError:
+            return
+        if mtime == self._mtime:
+            return
+
+        fresh: Dict[str, Tuple[Dict[str, Any], int]] = {}
+        try:
+            with self.path.open("r", encoding="utf-8") as f:
+                for pos, (_, it) in enumerate(iter_array(f, [("items",)])):
+                    rid = _item_id(it) if isinstance(it, dict) else None
+                    if rid and not (it.get("cleanup") or it.get("hidden")) and rid not in fresh:
+                        fresh[rid] = (it, pos)
+        except (OSError, ValueError) as e:
+            # Mid-write or otherwise unreadable: keep serving the previous index, retry next check.
+            print(f"[WARN] Catalog reload failed, keeping {len(self.items)} items: {type(e).__name__}: {e}")
+            return
+
+        with self.lock:
+            added = changed = removed = 0
+            for rid in list(self.items):
+                if rid not in fresh:
+                    self._unindex(rid)
+                    removed += 1
+            for rid, (it, pos) in fresh.items():
+                old = self.items.get(rid)
+                if old is not None:
+                    if old == it:
+                        # New items push the rest down the list: only the save-order key moves.
+                        key = self.keys[rid]["saved"]
+                        if key[1] != -pos:
+                            self.by_saved.remove(key, rid)
+                            self.keys[rid]["saved"] = (key[0], -pos)
+                            self.by_saved.add(self.keys[rid]["saved"], rid)
+                        continue
+                    self._unindex(rid)
+                    changed += 1
+                else:
+                    added += 1
+                self._index(rid, it, pos)
+            self._mtime = mtime
+        print(f"[OK] Catalog reloaded: {len(self.items)} items (+{added} ~{changed} -{removed})")
+
+    # -- queries ----------------------------------------------------------
+    def _match(self, q: str) -> Optional[Set[str]]:
+        toks = _TOKEN_RE.findall((q or "").lower())
+        if not toks:
+            return None
+        result: Optional[Set[str]] = None
+        for n, tok in enumerate(toks):
+            if n == len(toks) - 1:
+                # Last token matches as a prefix (search-as-you-type).
+                ids: Set[str] = set()
+                i = bisect.bisect_left(self.vocab, tok)
+                while i < len(self.vocab) and self.vocab[i].startswith(tok):
+                    ids |= self.postings[self.vocab[i]]
+                    i += 1
+            else:
+                ids = self.postings.get(tok, set())
+            result = ids if result is None else result & ids
+            if not result:
+                return set()
+        return result
+
+    def search(
+        self,
+        q: str = "",
+        min_duration: Optional[float] = None,
+        max_duration: Optional[float] = None,
+        sort: str = "saved",
+        desc: bool = True,
+        limit: int = 50,
+        cursor: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        with self.lock:
+            candidates = self._match(q)
+            if min_duration is not None or max_duration is not None:
+                lo = (min_duration if min_duration is not None else 0,)
+                hi = (max_duration if max_duration is not None else float("inf"),)
+                in_range = self.by_duration.range_ids(lo, hi)
+                candidates = in_range if candidates is None else candidates & in_range
+
+            sort = "duration" if sort == "duration" else "saved"
+            index = self.by_duration if sort == "duration" else self.by_saved
+            after = _decode_cursor(cursor, sort, desc)
+            page: List[Dict[str, Any]] = []
+            last: Optional[Tuple[SortKey, str]] = None
+            more = False
+            for key, rid in index.walk(desc, after):
+                if candidates is not None and rid not in candidates:
+                    continue
+                if len(page) >= limit:
+                    more = True
+                    break
+                page.append(entry(self.items[rid], rid))
+                last = (key, rid)
+
+            total = len(self.items) if candidates is None else len(candidates)
+            return {
+                "success": True,
+                "total": total,
+                "items": page,
+                "next_cursor": _encode_cursor(last, sort, desc) if more and last else None,
+            }
+
+    def get(self, rid: str) -> Optional[Dict[str, Any]]:
+        with self.lock:
+            it = self.items.get(rid)
+            return entry(it, rid) if it else None
+
+
+def _encode_cursor(row: Tuple[SortKey, str], sort: str, desc: bool) -> str:
+    # The sort and direction travel with the key: a cursor is only valid for the walk it came from.
+    raw = json.dumps([sort, "desc" if desc else "asc", list(row[0]), row[1]])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def _key_ok(sort: str, key: List[Any]) -> bool:
+    """Key shape of the sort's index: (duration,) or (first_seen_utc, -position)."""
+    def num(v: Any) -> bool:
+        return isinstance(v, (int, float)) and not isinstance(v, bool)
+
+    if sort == "duration":
+        return len(key) == 1 and num(key[0])
+    return len(key) == 2 and isinstance(key[0], str) and num(key[1])
+
+
+def _decode_cursor(cursor: Optional[str], sort: str, desc: bool) -> Optional[Tuple[SortKey, str]]:
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        c_sort, c_order, key, rid = json.loads(raw)
+    except (ValueError, TypeError):
+        raise ValueError("invalid cursor")
+    if c_sort != sort or c_order != ("desc" if desc else "asc") or not isinstance(key, list) or not _key_ok(sort, key):
+        raise ValueError("invalid cursor")
+    return tuple(key), str(rid)
+
+
+def _num(qs: Dict[str, List[str]], name: str) -> Optional[float]:
+    v = (qs.get(name) or [""])[0]
+    return float(v) if v else None
+
+
+def _make_handler(catalog: Catalog):
+    class Handler(BaseHTTPRequestHandler):
+        server_version = "FBReelzCatalog/1"
+
+        def _json(self, status: int, body: Dict[str, Any]) -> None:
+            data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(data)))
+            self.send_header("Cache-Control", "no-cache")
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self) -> None:  # noqa: N802
+            url = urlparse(self.path)
+            catalog.maybe_reload()
+            if url.path == "/api/catalog/health":
+                self._json(200, {"status": "ok", "items": len(catalog.items)})
+                return
+            if url.path.startswith("/api/catalog/items/"):
+                it = catalog.get(url.path.rsplit("/", 1)[1])
+                self._json(200 if it else 404, {"success": bool(it), "item": it})
+                return
+            if url.path != "/api/catalog/search":
+                self._json(404, {"success": False, "error": "not found"})
+                return
+            qs = parse_qs(url.query)
+            try:
+                res = catalog.search(
+                    q=(qs.get("q") or [""])[0],
+                    min_duration=_num(qs, "min_duration"),
+                    max_duration=_num(qs, "max_duration"),
+                    sort=(qs.get("sort") or ["saved"])[0],
+                    desc=(qs.get("order") or ["desc"])[0] != "asc",
+                    limit=max(1, min(MAX_LIMIT, int((qs.get("limit") or ["50"])[0]))),
+                    cursor=(qs.get("cursor") or [None])[0],
+                )
+            except ValueError as e:
+                self._json(400, {"success": False, "error": str(e)})
+                return
+            self._json(200, res)
+
+    return Handler
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="FBReelz catalog search API over resolved_items.json")
+    ap.add_argument("--bind", default="0.0.0.0", help="Bind address (default: 0.0.0.0)")
+    ap.add_argument("--port", type=int, default=8083, help="Port (default: 8083)")
+    ap.add_argument("--resolved", default=str(DEFAULT_RESOLVED), help=f"resolved_items.json (default: {DEFAULT_RESOLVED})")
+    ap.add_argument("--reload-interval", type=float, default=5.0, help="Seconds between change checks (default: 5)")
+    args = ap.parse_args()
+
+    catalog = Catalog(Path(args.resolved), args.reload_interval)
+    catalog.maybe_reload()
+    httpd = ThreadingHTTPServer((args.bind, args.port), _make_handler(catalog))
+    print(f"[OK] Catalog API on http://{args.bind}:{args.port}/api/catalog/search")
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,249 @@
+## version 1
+"""FBReelz cookies: one parsed cookie jar for Playwright, yt-dlp and HTTP, plus a session preflight.
+
+Purpose
+- Phase 1 parsed cookies.txt for Playwright and Phase 2 (and the daemons) copied it
+  for yt-dlp, each on its own; an expired session only showed up after a Chromium
+  launch ("You may need fresher cookies") or a run of yt-dlp failures.
+- load() parses a Netscape cookies.txt once per process and caches the normalized
+  jar keyed by the file's mtime/size, so a rewritten file is picked up on the next call.
+  The jar feeds:
+  - Playwright: Jar.playwright() (context.add_cookies),
+  - yt-dlp: runtime_file() writes a normalized, writable copy for --cookies,
+  - HTTP: Jar.header(url) / Jar.cookiejar() for urllib and http.client.
+- check() is the preflight: missing or expired c_user/xs fail offline at once;
+  otherwise one request to AUTH_CHECK_URL (no redirects, --timeout seconds) tells
+  a live session from a redirect to the login page. Network errors are reported
+  as unknown rather than dead.
+
+Usage
+  python fbreelz_cookies.py                       # check FBREELZ_COOKIES; exit 2 when the session is dead
+  python fbreelz_cookies.py --cookies /app/secrets/cookies.txt --offline
+  fbreelz_pipeline.py runs the same check before Phase 1 (--no-preflight to skip).
+"""
+
+from __future__ import annotations
+
+import argparse
+import http.client
+import http.cookiejar
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+
+DEFAULT_COOKIES = Path(os.environ.get("FBREELZ_COOKIES", "/opt/fbreelz/secrets/cookies.txt"))
+AUTH_COOKIES = ("c_user", "xs")
+AUTH_CHECK_URL = "https://m.facebook.com/me/"
+AUTH_TIMEOUT = 1.0
+DEFAULT_UA = "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
+
+_HTTPONLY_PREFIX = "#HttpOnly_"
+
+
+@dataclass(frozen=True)
+class Cookie:
+    name: str
+    value: str
+    domain: str
+    path: str = "/"
+    expires: int = -1  # unix time; -1 = session cookie
+    secure: bool = False
+    http_only: bool = False
+
+    def expired(self, now: Optional[float] = None) -> bool:
+        return self.expires > 0 and self.expires <= (time.time() if now is None else now)
+
+    def matches(self, host: str, path: str, https: bool) -> bool:
+        d = self.domain.lstrip(".").lower()
+        return (
+            (host == d or host.endswith("." + d))
+            and path.startswith(self.path)
+            and (https or not self.secure)
+        )
+
+
+@dataclass
+class Jar:
+    path: Path
+    mtime: Optional[float] = None
+    cookies: List[Cookie] = field(default_factory=list)
+
+    def __len__(self) -> int:
+        return len(self.cookies)
+
+    def playwright(self) -> List[Dict[str, Any]]:
+        """Cookies in the shape BrowserContext.add_cookies() takes."""
+        return [
+            {
+                "name": c.name,
+                "value": c.value,
+                "domain": c.domain,
+                "path": c.path,
+                "expires": c.expires,
+                "httpOnly": c.http_only,
+                "secure": c.secure,
+                "sameSite": "Lax",
+            }
+            for c in self.cookies
+        ]
+
+    def netscape(self) -> str:
+        lines = ["# Netscape HTTP Cookie File", f"# Normalized by fbreelz_cookies.py from {self.path}", ""]
+        for c in self.cookies:
+            domain = (_HTTPONLY_PREFIX if c.http_only else "") + c.domain
+            sub = "TRUE" if c.domain.startswith(".") else "FALSE"
+            secure = "TRUE" if c.secure else "FALSE"
+            lines.append("\t".join([domain, sub, c.path, secure, str(max(c.expires, 0)), c.name, c.value]))
+        return "\n".join(lines) + "\n"
+
+    def header(self, url: str, now: Optional[float] = None) -> str:
+        """Cookie header value for a request to `url` (unexpired, domain/path/secure matched)."""
+        u = urlsplit(url)
+        host, path, https = (u.hostname or "").lower(), u.path or "/", u.scheme == "https"
+        return "; ".join(f"{c.name}={c.value}" for c in self.cookies if c.matches(host, path, https) and not c.expired(now))
+
+    def cookiejar(self) -> http.cookiejar.CookieJar:
+        """A stdlib CookieJar, e.g. for urllib.request.HTTPCookieProcessor."""
+        jar = http.cookiejar.CookieJar()
+        for c in self.cookies:
+            jar.set_cookie(http.cookiejar.Cookie(
+                0, c.name, c.value, None, False, c.domain, True, c.domain.startswith("."), c.path, True,
+                c.secure, c.expires if c.expires > 0 else None, c.expires <= 0, None, None,
+                {"HttpOnly": None} if c.http_only else {},
+            ))
+        return jar
+
+    def missing_auth(self, now: Optional[float] = None) -> List[str]:
+        """Session cookies that are absent or expired (empty when the jar looks logged in)."""
+        have = {c.name for c in self.cookies if "facebook.com" in c.domain and not c.expired(now)}
+        return [n for n in AUTH_COOKIES if n not in have]
+
+
+def _parse(text: str) -> List[Cookie]:
+    out: List[Cookie] = []
+    for line in text.splitlines():
+        http_only = line.startswith(_HTTPONLY_PREFIX)
+        if http_only:
+            line = line[len(_HTTPONLY_PREFIX):]
+        if not line.strip() or line.startswith("#"):
+            continue
+        parts = line.rstrip("\r\n").split("\t")
+        if len(parts) != 7:
+            continue
+        domain, _, cookie_path, secure, expires, name, value = parts
+        exp = int(expires) if expires.strip().isdigit() else -1
+        out.append(Cookie(
+            name=name,
+            value=value,
+            domain=domain.strip(),
+            path=cookie_path or "/",
+            expires=exp if exp > 0 else -1,
+            secure=secure.upper() == "TRUE",
+            http_only=http_only,
+        ))
+    return out
+
+
+_cache: Dict[Path, Tuple[Tuple[int, int], Jar]] = {}
+_cache_lock = threading.Lock()
+
+
+def load(path: Path) -> Jar:
+    """Parsed jar for `path`; reparsed only when the file's mtime or size changes."""
+    path = Path(path)
+    try:
+        st = path.stat()
+    except OSError:
+        return Jar(path=path)
+    key = (st.st_mtime_ns, st.st_size)
+    with _cache_lock:
+        hit = _cache.get(path)
+        if hit and hit[0] == key:
+            return hit[1]
+    jar = Jar(path=path, mtime=st.st_mtime, cookies=_parse(path.read_text(encoding="utf-8", errors="ignore")))
+    with _cache_lock:
+        _cache[path] = (key, jar)
+    return jar
+
+
+def runtime_file(source: Path, runtime: Path) -> Optional[Path]:
+    """Writable cookies file for yt-dlp --cookies (it saves cookies back on exit).
+
+    Rewritten from the parsed jar when missing or older than `source`, so cookies
+    yt-dlp refreshed are kept until cookies.txt itself changes. Returns None when
+    `source` does not exist, and `source` itself if the copy cannot be written.
+    """
+    jar = load(source)
+    if jar.mtime is None:
+        return None
+    try:
+        if runtime.exists() and runtime.stat().st_mtime >= jar.mtime:
+            return runtime
+        runtime.parent.mkdir(parents=True, exist_ok=True)
+        tmp = runtime.with_name(runtime.name + ".tmp")
+        tmp.write_text(jar.netscape(), encoding="utf-8")
+        os.chmod(tmp, 0o600)
+        os.replace(tmp, runtime)
+        return runtime
+    except OSError:
+        return source
+
+
+def check(
+    path: Path, url: str = AUTH_CHECK_URL, timeout: float = AUTH_TIMEOUT, online: bool = True
+) -> Tuple[Optional[bool], str]:
+    """Session preflight: (True, why) alive, (False, why) dead, (None, why) could not tell."""
+    jar = load(path)
+    if jar.mtime is None:
+        return False, f"{path} not found"
+    missing = jar.missing_auth()
+    if missing:
+        return False, f"{', '.join(missing)} missing or expired in {path}"
+    if not online:
+        return True, "session cookies present (offline check)"
+
+    u = urlsplit(url)
+    cls = http.client.HTTPSConnection if u.scheme == "https" else http.client.HTTPConnection
+    conn = cls(u.netloc, timeout=timeout)
+    t0 = time.monotonic()
+    try:
+        conn.request("GET", u.path or "/", headers={"Cookie": jar.header(url), "User-Agent": DEFAULT_UA})
+        resp = conn.getresponse()
+        status, location = resp.status, resp.getheader("Location") or ""
+    except (OSError, http.client.HTTPException) as e:
+        return None, f"auth check failed after {time.monotonic() - t0:.1f}s: {type(e).__name__}: {e}"
+    finally:
+        conn.close()
+    took = f"{(time.monotonic() - t0) * 1000:.0f} ms"
+    if status in (301, 302, 303, 307, 308) and ("login" in location or "checkpoint" in location):
+        return False, f"redirected to {location.split('?')[0]} ({took})"
+    if status in (200, 301, 302, 303, 307, 308):
+        return True, f"HTTP {status} ({took})"
+    return None, f"unexpected HTTP {status} ({took})"
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="Check that a Facebook cookies.txt still holds a live session")
+    ap.add_argument("--cookies", type=Path, default=DEFAULT_COOKIES, help=f"cookies.txt (default: {DEFAULT_COOKIES})")
+    ap.add_argument("--offline", action="store_true", help="Only check that c_user/xs are present and unexpired")
+    ap.add_argument("--timeout", type=float, default=AUTH_TIMEOUT, help=f"Auth request timeout in seconds (default: {AUTH_TIMEOUT})")
+    args = ap.parse_args()
+
+    ok, why = check(args.cookies, timeout=args.timeout, online=not args.offline)
+    if ok is False:
+        print(f"[ERR] Session is dead: {why}. Export fresh cookies.")
+        return 2
+    if ok is None:
+        print(f"[WARN] Session state unknown: {why}")
+        return 0
+    print(f"[OK] Session looks alive: {why} ({len(load(args.cookies))} cookies)")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
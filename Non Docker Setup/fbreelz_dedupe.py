@@ -0,0 +1,454 @@
+## version 1
+"""FBReelz near-duplicate finder: perceptual hashes of sampled frames, multi-index Hamming lookup.
+
+Purpose
+- The same clip is often re-uploaded under another reel ID. Exact hashes (the cache
+  manifest, replica sha256) miss these copies, so the cache stores them and the
+  playlists list them more than once.
+- For every cached video, ffmpeg decodes --frames frames at the centres of equal
+  slices of the video, scaled to 32x32 grey. NumPy computes a 64-bit DCT
+  perceptual hash for each frame in one batched matrix product. Hashes are cached
+  in phash_cache.json by (device, inode, size, mtime), the same key as the
+  integrity cache, so a file is only decoded once.
+- Lookup uses multi-index hashing, not pairwise comparison. Each 64-bit hash is
+  split into four 16-bit parts, with one sorted table per part. Two hashes within
+  --threshold bits agree within threshold//4 bits on at least one part, so a query
+  only probes those neighbouring buckets (np.searchsorted). The candidates it finds
+  are then verified with vectorized popcounts.
+- Two videos are near-duplicates when at least 60% of the informative frames of
+  each one have a match within --threshold bits in the other, and their durations
+  agree (2 s or 10%). Near-uniform frames (black, fades) do not count.
+- In each group one reel is kept: one listed in resolved_items.json, and the largest
+  file among those. The others get "duplicate_of": "<kept id>" in resolved_items.json.
+  - --hide adds "hidden": true, which every playlist and the catalog skip.
+  - --delete also removes their cached files (implies --hide).
+  Both rewrite the playlists and the catalog through Phase 2's writers straight
+  away (title, bases and chunk size are read back from the existing files).
+- duplicates.json lists the groups. Phase 2 reads it so that a full run keeps the
+  flags and does not download deleted copies again.
+
+Usage
+  python /app/fbreelz_dedupe.py                    # flag only
+  python /app/fbreelz_dedupe.py --hide --threshold 8
+  python /app/fbreelz_dedupe.py --delete --jobs 4
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import math
+import os
+import re
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+import fbreelz_phase2_resolve as phase2
+from fbreelz_cachelayout import forget, media_id
+from fbreelz_integrity import CACHE_FILE_NAME, IntegrityCache, _key, media_files
+
+
+DEFAULT_DATA_DIR = Path("/app/data")
+PHASH_CACHE_NAME = "phash_cache.json"
+DUPLICATES_NAME = "duplicates.json"
+DEFAULT_FRAMES = 5
+DEFAULT_THRESHOLD = 10  # bits out of 64
+SIDE = 32
+LOW = 8
+MIN_STD = 4.0  # frames flatter than this (grey levels) carry no signal
+MATCH_SHARE = 0.6
+PARTS = 4
+PART_BITS = 64 // PARTS
+
+_POP8 = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+
+def _dct_matrix(n: int) -> np.ndarray:
+    k = np.arange(n)[:, None]
+    i = np.arange(n)[None, :]
+    m = np.sqrt(2.0 / n) * np.cos(np.pi * (2 * i + 1) * k / (2 * n))
+    m[0] /= np.sqrt(2.0)
+    return m.astype(np.float32)
+
+
+_DCT = _dct_matrix(SIDE)
+
+
+def phash(frames: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """(uint64 hashes, informative mask) for a (n, 32, 32) stack of grey frames."""
+    f = frames.astype(np.float32)
+    coeffs = _DCT @ f @ _DCT.T  # batched 2-D DCT-II
+    low = coeffs[:, :LOW, :LOW].reshape(len(f), LOW * LOW)
+    med = np.median(low[:, 1:], axis=1, keepdims=True)  # DC term excluded, as in pHash
+    bits = np.packbits(low > med, axis=1)  # (n, 8) uint8, most significant bit first
+    hashes = bits.view(">u8").ravel().astype(np.uint64)
+    return hashes, f.reshape(len(f), -1).std(axis=1) >= MIN_STD
+
+
+def popcount(x: np.ndarray) -> np.ndarray:
+    x = np.ascontiguousarray(x, dtype=np.uint64)
+    return _POP8[x.view(np.uint8)].reshape(x.shape + (8,)).sum(axis=-1, dtype=np.int64)
+
+
+class HammingIndex:
+    """Multi-index hashing over 64-bit codes: one sorted 16-bit table per part."""
+
+    def __init__(self, codes: np.ndarray, radius: int) -> None:
+        self.codes = np.ascontiguousarray(codes, dtype=np.uint64)
+        self.radius = radius
+        sub_radius = radius // PARTS
+        all_keys = np.arange(1 << PART_BITS, dtype=np.uint32)
+        self.masks = all_keys[popcount(all_keys.astype(np.uint64)) <= sub_radius].astype(np.uint16)
+        self.order: List[np.ndarray] = []
+        self.sorted: List[np.ndarray] = []
+        for j in range(PARTS):
+            part = self._part(self.codes, j)
+            order = np.argsort(part, kind="stable")
+            self.order.append(order)
+            self.sorted.append(part[order])
+
+    @staticmethod
+    def _part(codes: np.ndarray, j: int) -> np.ndarray:
+        return ((codes >> np.uint64(PART_BITS * j)) & np.uint64(0xFFFF)).astype(np.uint16)
+
+    def query(self, q: np.ndarray) -> np.ndarray:
+        """Indices of codes within `radius` bits of any code in q."""
+        q = np.ascontiguousarray(q, dtype=np.uint64)
+        found: List[np.ndarray] = []
+        for j in range(PARTS):
+            keys = np.unique((self._part(q, j)[:, None] ^ self.masks[None, :]).ravel())
+            lo = np.searchsorted(self.sorted[j], keys, side="left")
+            hi = np.searchsorted(self.sorted[j], keys, side="right")
+            lens = hi - lo
+            total = int(lens.sum())
+            if not total:
+                continue
+            # Expand the [lo, hi) runs into one position array without a Python loop.
+            pos = np.repeat(lo - np.cumsum(lens) + lens, lens) + np.arange(total)
+            found.append(self.order[j][pos])
+        if not found:
+            return np.empty(0, dtype=np.int64)
+        cand = np.unique(np.concatenate(found))
+        dist = popcount(self.codes[cand][:, None] ^ q[None, :]).min(axis=1)
+        return cand[dist <= self.radius]
+
+
+def _sample_frames(path: Path, duration: Optional[float], n: int) -> Optional[np.ndarray]:
+    """n grey SIDE x SIDE frames from the centres of n equal slices, or None."""
+    if not duration or duration <= 0:
+        return None
+    step = duration / n
+    cmd = [
+        "ffmpeg", "-v", "error", "-nostdin", "-ss", f"{step / 2:.3f}", "-i", str(path),
+        "-vf", f"fps={n}/{duration:.3f},scale={SIDE}:{SIDE}:flags=area,format=gray",
+        "-frames:v", str(n), "-f", "rawvideo", "-",
+    ]
+    try:
+        p = subprocess.run(cmd, capture_output=True, timeout=120)
+    except (OSError, subprocess.TimeoutExpired):
+        return None
+    got = len(p.stdout) // (SIDE * SIDE)
+    if p.returncode != 0 or not got:
+        return None
+    return np.frombuffer(p.stdout[: got * SIDE * SIDE], dtype=np.uint8).reshape(got, SIDE, SIDE)
+
+
+class HashCache:
+    """Frame hashes keyed like the integrity cache; persisted next to the cache dir."""
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self._dirty = False
+        try:
+            self._data: Dict[str, Dict[str, Any]] = json.loads(path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            self._data = {}
+
+    def get(self, key: str, frames: int) -> Optional[Dict[str, Any]]:
+        hit = self._data.get(key)
+        return hit if hit and hit.get("frames") == frames else None
+
+    def put(self, key: str, path: Path, frames: int, hashes: List[Optional[str]], duration: float) -> None:
+        self._data[key] = {"path": str(path.resolve()), "frames": frames, "hashes": hashes, "duration": duration}
+        self._dirty = True
+
+    def save(self) -> None:
+        if not self._dirty:
+            return
+        live = {}
+        for k, v in self._data.items():
+            try:
+                if _key(Path(v["path"]).stat()) == k:
+                    live[k] = v
+            except (OSError, KeyError):
+                pass
+        tmp = self.path.with_name(self.path.name + ".tmp")
+        tmp.write_text(json.dumps(live, indent=1), encoding="utf-8")
+        os.replace(tmp, self.path)
+        self._dirty = False
+
+
+def fingerprint(cache_dir: Path, frames: int = DEFAULT_FRAMES, jobs: int = 0) -> Dict[str, Dict[str, Any]]:
+    """reel id -> {"path", "size", "duration", "hashes": uint64[frames], "valid": bool[frames]}."""
+    ic = IntegrityCache(cache_dir.parent / CACHE_FILE_NAME)
+    hc = HashCache(cache_dir.parent / PHASH_CACHE_NAME)
+    files = [p for p in media_files(cache_dir) if media_id(p)]
+    todo: List[Tuple[Path, str, Optional[float]]] = []
+    out: Dict[str, Dict[str, Any]] = {}
+
+    def add(mid: str, path: Path, size: int, duration: float, hexes: List[Optional[str]]) -> None:
+        hashes = np.array([int(h, 16) if h else 0 for h in hexes], dtype=np.uint64)
+        valid = np.array([h is not None for h in hexes], dtype=bool)
+        out[mid] = {"path": path, "size": size, "duration": duration, "hashes": hashes, "valid": valid}
+
+    for p in files:
+        try:
+            st = p.stat()
+        except OSError:
+            continue
+        key = _key(st)
+        hit = hc.get(key, frames)
+        if hit:
+            add(media_id(p), p, st.st_size, hit["duration"], hit["hashes"])
+            continue
+        res = ic.check(p)
+        if res.ok:
+            todo.append((p, key, res.duration))
+    ic.save()
+
+    if todo:
+        print(f"[INFO] Hashing {len(todo)} new file(s) ({len(files) - len(todo)} cached)")
+        with ThreadPoolExecutor(max_workers=jobs or min(8, os.cpu_count() or 1)) as pool:
+            sampled = list(pool.map(lambda t: _sample_frames(t[0], t[2], frames), todo))
+        for (p, key, duration), stack in zip(todo, sampled):
+            if stack is None:
+                print(f"[WARN] Could not sample frames from {p.name}")
+                continue
+            hashes, valid = phash(stack)
+            hexes = [f"{int(h):016x}" if ok else None for h, ok in zip(hashes, valid)]
+            hexes += [None] * (frames - len(hexes))
+            hc.put(key, p, frames, hexes, float(duration or 0))
+            add(media_id(p), p, p.stat().st_size, float(duration or 0), hexes)
+    hc.save()
+    return out
+
+
+def _same_length(a: float, b: float) -> bool:
+    return not a or not b or abs(a - b) <= max(2.0, 0.1 * max(a, b))
+
+
+def find_groups(prints: Dict[str, Dict[str, Any]], threshold: int = DEFAULT_THRESHOLD) -> List[List[str]]:
+    """Groups of reel ids (each of size >= 2) whose sampled frames match."""
+    ids = [mid for mid, fp in prints.items() if fp["valid"].sum() >= 2]
+    if len(ids) < 2:
+        return []
+    frames = len(prints[ids[0]]["hashes"])
+    sig = np.stack([prints[mid]["hashes"] for mid in ids])  # (V, F)
+    valid = np.stack([prints[mid]["valid"] for mid in ids])
+    owner = np.repeat(np.arange(len(ids)), frames)
+    flat_valid = valid.ravel()
+    index = HammingIndex(sig.ravel()[flat_valid], threshold)
+    owner = owner[flat_valid]
+
+    parent = list(range(len(ids)))
+
+    def root(i: int) -> int:
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    for v in range(len(ids)):
+        cand = np.unique(owner[index.query(sig[v][valid[v]])])
+        cand = cand[cand > v]
+        if not len(cand):
+            continue
+        # (C, F, F) frame distance matrices for every candidate at once.
+        d = popcount(sig[v][None, :, None] ^ sig[cand][:, None, :])
+        close = (d <= threshold) & valid[v][None, :, None] & valid[cand][:, None, :]
+        need_v = math.ceil(MATCH_SHARE * valid[v].sum())
+        need_c = np.ceil(MATCH_SHARE * valid[cand].sum(axis=1))
+        hit = (close.any(axis=2).sum(axis=1) >= need_v) & (close.any(axis=1).sum(axis=1) >= need_c)
+        for c in cand[hit]:
+            if _same_length(prints[ids[v]]["duration"], prints[ids[c]]["duration"]):
+                parent[root(int(c))] = root(v)
+
+    groups: Dict[int, List[str]] = {}
+    for i, mid in enumerate(ids):
+        groups.setdefault(root(i), []).append(mid)
+    return [g for g in groups.values() if len(g) > 1]
+
+
+def _write_json_atomic(path: Path, data: Any, indent: Optional[int] = 2) -> None:
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_text(json.dumps(data, indent=indent, ensure_ascii=False), encoding="utf-8")
+    os.replace(tmp, path)
+
+
+def _playlist_head(path: Path) -> Tuple[Optional[str], Optional[str]]:
+    """(#PLAYLIST title, first entry URI) of an existing M3U, or (None, None)."""
+    title = uri = None
+    try:
+        with path.open("r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if line.startswith("#PLAYLIST:"):
+                    title = line[len("#PLAYLIST:"):]
+                elif line and not line.startswith("#"):
+                    uri = line
+                    break
+    except OSError:
+        pass
+    return title, uri
+
+
+def _republish(items: List[Dict[str, Any]], data_dir: Path, cache_dir: Path, http_base: Optional[str]) -> None:
+    """Rewrite the playlists and catalog the way Phase 2 last wrote them, minus hidden items.
+
+    Title, resolve-on-play base, HTTP base and chunk size are read back from the
+    existing files, so a dedupe run does not change anything else about them.
+    """
+    m3u, cache_m3u, http_m3u = data_dir / "fbreelz.m3u", data_dir / "fbreelz_cache.m3u", data_dir / "fbreelz_cache_http.m3u"
+    title, first = _playlist_head(m3u)
+    title = title or "FBReelz"
+    m = re.match(r"^(https?://.+)/r/\d+$", first or "")
+    resolve_base = m.group(1) if m else None
+    if not http_base:
+        m = re.match(r"^(https?://.+?)/(?:cache|m)/", _playlist_head(http_m3u)[1] or "")
+        http_base = m.group(1) if m else None
+    chunk = 0
+    part = data_dir / "fbreelz.part-0001.m3u"
+    if (data_dir / "fbreelz.index.m3u").exists() and part.exists():
+        chunk = part.read_text(encoding="utf-8").count("#EXTINF")
+    catalog_dir = data_dir / "catalog"
+    try:
+        page_size = int(json.loads((catalog_dir / "index.json").read_text(encoding="utf-8")).get("page_size") or 0)
+    except (OSError, ValueError):
+        page_size = 0
+
+    fields = set(phase2.ItemOut.__dataclass_fields__)
+    rows = [phase2.ItemOut(**{k: v for k, v in it.items() if k in fields}) for it in items if it.get("source_url")]
+    phase2._publish(
+        rows,
+        m3u_path=m3u,
+        cache_m3u_path=cache_m3u,
+        http_m3u_path=http_m3u,
+        playlist_title=title,
+        download=cache_m3u.exists(),
+        http_base=http_base,
+        cache_dir=cache_dir,
+        resolve_base=resolve_base,
+        catalog_dir=catalog_dir if catalog_dir.exists() else None,
+        catalog_page_size=page_size or phase2.DEFAULT_PAGE_SIZE,
+        playlist_chunk=chunk,
+    )
+    if http_m3u.exists() and not http_base:
+        print(f"[WARN] {http_m3u.name} not rewritten (no HTTP base found); pass --http-base")
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="Flag near-duplicate reels in the FBReelz cache")
+    ap.add_argument("--data-dir", default=str(DEFAULT_DATA_DIR), help=f"Data directory (default: {DEFAULT_DATA_DIR})")
+    ap.add_argument("--frames", type=int, default=DEFAULT_FRAMES, help=f"Frames sampled per video (default: {DEFAULT_FRAMES})")
+    ap.add_argument("--threshold", type=int, default=DEFAULT_THRESHOLD,
+                    help=f"Max differing bits (of 64) for two frames to match (default: {DEFAULT_THRESHOLD})")
+    ap.add_argument("--jobs", type=int, default=0, help="Parallel ffmpeg decoders (default: CPU count, max 8)")
+    ap.add_argument("--hide", action="store_true", help="Leave duplicates out of playlists and the catalog")
+    ap.add_argument("--delete", action="store_true", help="Also delete the duplicates' cached files (implies --hide)")
+    ap.add_argument("--http-base", default=None,
+                    help="Base URL of fbreelz_cache_http.m3u (default: read back from the existing playlist)")
+    args = ap.parse_args()
+
+    data_dir = Path(args.data_dir)
+    cache_dir = data_dir / "cache"
+    resolved_path = data_dir / "resolved_items.json"
+    if not resolved_path.exists():
+        raise SystemExit(f"[ERR] resolved file not found: {resolved_path}")
+    hide = args.hide or args.delete
+
+    prints = fingerprint(cache_dir, frames=max(2, args.frames), jobs=args.jobs)
+    groups = find_groups(prints, threshold=args.threshold)
+
+    payload = json.loads(resolved_path.read_text(encoding="utf-8"))
+    items = [it for it in payload.get("items") or [] if isinstance(it, dict)]
+    by_id: Dict[str, Dict[str, Any]] = {}
+    for it in items:
+        mid = media_id(Path(it.get("downloaded_path") or "")) if it.get("downloaded_path") else None
+        if mid:
+            by_id.setdefault(mid, it)
+
+    report: List[Dict[str, Any]] = []
+    dup_of: Dict[str, str] = {}
+    for g in groups:
+        # Keep a listed item, then the biggest file: re-uploads are usually re-encoded smaller.
+        keep = max(g, key=lambda mid: (mid in by_id, prints[mid]["size"]))
+        dupes = sorted(mid for mid in g if mid != keep)
+        for mid in dupes:
+            dup_of[mid] = keep
+        report.append({"keep": keep, "duplicates": [{"id": mid, "deleted": False} for mid in dupes]})
+
+    flagged = deleted = freed = 0
+    for it in items:
+        mid = media_id(Path(it.get("downloaded_path") or "")) if it.get("downloaded_path") else None
+        if mid is None and it.get("duplicate_of"):
+            continue  # file already deleted by an earlier --delete run; keep its flags
+        keep = dup_of.get(mid or "")
+        it["duplicate_of"] = keep
+        it["hidden"] = bool(keep) and hide
+        flagged += bool(keep)
+
+    if args.delete:
+        for entry in report:
+            for d in entry["duplicates"]:
+                fp = prints[d["id"]]
+                try:
+                    fp["path"].unlink()
+                except OSError as e:
+                    print(f"[WARN] Could not delete {fp['path']}: {e}")
+                    continue
+                forget(cache_dir, d["id"])
+                d["deleted"] = True
+                deleted += 1
+                freed += fp["size"]
+                it = by_id.get(d["id"])
+                if it is not None:
+                    it["downloaded_path"] = None
+
+    # Earlier deletions stay listed so Phase 2 keeps skipping those downloads.
+    try:
+        old = json.loads((data_dir / DUPLICATES_NAME).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        old = {}
+    seen = {d["id"] for e in report for d in e["duplicates"]}
+    for e in old.get("groups") or []:
+        gone = [d for d in e.get("duplicates") or [] if d.get("deleted") and d.get("id") not in seen]
+        if gone:
+            report.append({"keep": e.get("keep"), "duplicates": gone})
+
+    _write_json_atomic(data_dir / DUPLICATES_NAME, {
+        "generated_at_utc": datetime.now(timezone.utc).isoformat(),
+        "threshold": args.threshold,
+        "frames": args.frames,
+        "hidden": hide,
+        "groups": report,
+    })
+    _write_json_atomic(resolved_path, payload)
+    if hide:
+        # Hidden and deleted copies leave the playlists and the catalog now, not on the next Phase 2 run.
+        _republish(items, data_dir, cache_dir, args.http_base)
+
+    print(f"[OK] {len(prints)} file(s) fingerprinted; {len(groups)} duplicate group(s), {flagged} item(s) flagged"
+          + (" and hidden" if hide else ""))
+    if args.delete:
+        print(f"[OK] Deleted {deleted} duplicate file(s), freed {freed / 1e6:.1f} MB")
+    print(f"[OK] Wrote {data_dir / DUPLICATES_NAME}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,215 @@
+## version 1
+"""FBReelz bandwidth governor: background downloads back off while someone is watching.
+
+Purpose
+- Phase 2, prefetch, the queue workers and replica pulls used to share the uplink
+  with /cache/ playback on equal terms, so a background fill could make a player
+  buffer.
+- Playback is detected from the NGINX access log: a /cache/, /m/ or /api/video/
+  request in the last WINDOW seconds means someone is watching.
+- While playback is active, background transfers are held to --bg-kbps in total.
+  The rate is split evenly between the downloader processes that are active at the
+  time (lease files in the temp dir, kept fresh by lease() while a download runs).
+  Once playback stops, the limit doubles every RAMP_STEP seconds and is removed
+  after a few steps. This avoids a burst of traffic right after a single pause.
+- yt-dlp gets the current limit as --limit-rate when each download starts. A reel
+  that started unthrottled finishes that way. Python transfers (replica pulls) go
+  through a token bucket that follows the limit continuously.
+- Without a readable access log, or with --bg-kbps 0, downloads run at full speed as before.
+
+Limitations
+- NGINX writes an access log line when a request finishes, not when it starts.
+  A player that streams a long reel over one open-ended request is invisible
+  until that request ends; players that fetch in Range chunks, or move on to the
+  next item, are seen within a request. The access log is all the container can
+  see of the host NGINX, so there is no view of open connections.
+- --limit-rate is fixed when yt-dlp starts. A download that started before
+  playback was detected keeps its rate until it finishes. Only Python transfers
+  (throttle()) adjust mid-transfer.
+
+Configuration
+  FBREELZ_ACCESS_LOG (default /var/log/nginx/fbreelz_access.log; mounted in docker-compose.yml)
+  FBREELZ_BG_KBPS    (default 2000 kbit/s while watching; 0 = off)
+  python /app/fbreelz_phase2_resolve.py --download --bg-kbps 1500
+  python fbreelz_governor.py            # show what the governor sees right now
+"""
+
+from __future__ import annotations
+
+import contextlib
+import os
+import re
+import tempfile
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Iterator, List, Optional
+
+
+DEFAULT_ACCESS_LOG = Path(os.environ.get("FBREELZ_ACCESS_LOG", "/var/log/nginx/fbreelz_access.log"))
+DEFAULT_BG_KBPS = float(os.environ.get("FBREELZ_BG_KBPS", "2000"))
+WINDOW = 45.0  # seconds after the last playback request that still count as watching
+RAMP_STEP = 10.0  # limit doubles every RAMP_STEP seconds once playback stops
+RAMP_STEPS = 4  # ... and is lifted after this many doublings
+POLL = 1.0
+TAIL_BYTES = 256 << 10
+LEASE_TTL = 15.0
+LEASE_DIR = Path(tempfile.gettempdir()) / "fbreelz_governor"
+
+_LINE_RE = re.compile(r'\[([^\]]+)\] "(?:GET|HEAD) (/cache/|/m/|/api/video/)\S* [^"]*" (\d{3})')
+
+
+def _log_time(stamp: str) -> Optional[float]:
+    try:
+        return datetime.strptime(stamp, "%d/%b/%Y:%H:%M:%S %z").timestamp()
+    except ValueError:
+        return None
+
+
+class Governor:
+    """Process-wide limit for background transfers; safe to share between threads."""
+
+    def __init__(self, access_log: Path = DEFAULT_ACCESS_LOG, bg_kbps: float = DEFAULT_BG_KBPS) -> None:
+        self._lock = threading.Lock()
+        self.configure(access_log, bg_kbps)
+
+    def configure(self, access_log: Optional[Path] = None, bg_kbps: Optional[float] = None) -> None:
+        with self._lock:
+            if access_log is not None:
+                self.access_log = Path(access_log)
+                self._inode: Optional[int] = None
+                self._offset = 0
+                self._last_play = 0.0
+                self._polled = 0.0
+            if bg_kbps is not None:
+                self.bg_kbps = max(0.0, float(bg_kbps))
+            self._tokens = 0.0
+            self._filled = time.monotonic()
+
+    def _poll(self) -> None:
+        """Read what NGINX appended since the last poll (at most once per POLL seconds)."""
+        now = time.monotonic()
+        if now - self._polled < POLL:
+            return
+        self._polled = now
+        try:
+            st = self.access_log.stat()
+            if st.st_ino != self._inode or st.st_size < self._offset:
+                # First look or rotated: only the tail can hold recent requests.
+                self._inode, self._offset = st.st_ino, max(0, st.st_size - TAIL_BYTES)
+            if st.st_size == self._offset:
+                return
+            with self.access_log.open("rb") as f:
+                f.seek(self._offset)
+                data = f.read(st.st_size - self._offset)
+        except OSError:
+            return
+        end = data.rfind(b"\n") + 1
+        self._offset += end
+        for m in _LINE_RE.finditer(data[:end].decode("utf-8", "replace")):
+            if m.group(3) in ("200", "206"):
+                t = _log_time(m.group(1))
+                if t and t > self._last_play:
+                    self._last_play = t
+
+    def playing(self) -> bool:
+        with self._lock:
+            self._poll()
+            return time.time() - self._last_play < WINDOW
+
+    def rate(self) -> Optional[float]:
+        """Current background limit in bytes/s for this process, or None for no limit."""
+        if not self.bg_kbps:
+            return None
+        with self._lock:
+            self._poll()
+            idle = time.time() - self._last_play - WINDOW
+        if idle >= RAMP_STEP * RAMP_STEPS:
+            return None
+        factor = 2 ** (max(0.0, idle) // RAMP_STEP)
+        return self.bg_kbps * 1000 / 8 * factor / _active_leases()
+
+    def ytdlp_args(self) -> List[str]:
+        """--limit-rate for a yt-dlp download starting now (empty when unthrottled)."""
+        _touch_lease()
+        r = self.rate()
+        return [] if r is None else ["--limit-rate", f"{max(1, int(r / 1024))}K"]
+
+    def throttle(self, nbytes: int) -> None:
+        """Token bucket: call after moving nbytes; sleeps as long as the current limit requires."""
+        r = self.rate()
+        if r is None:
+            return
+        _touch_lease()
+        with self._lock:
+            now = time.monotonic()
+            # Half a second of burst keeps reads smooth without overshooting the limit.
+            self._tokens = min(r * 0.5, self._tokens + (now - self._filled) * r) - nbytes
+            self._filled = now
+            wait = -self._tokens / r if self._tokens < 0 else 0.0
+        if wait > 0:
+            time.sleep(wait)
+
+
+@contextlib.contextmanager
+def lease() -> Iterator[None]:
+    """Keep this process counted as an active downloader for the whole block.
+
+    ytdlp_args() only touches the lease when a download starts; a yt-dlp run longer than
+    LEASE_TTL would otherwise drop out of _active_leases() and other processes would
+    split the budget between too few writers.
+    """
+    stop = threading.Event()
+
+    def beat() -> None:
+        while not stop.wait(LEASE_TTL / 3):
+            _touch_lease()
+
+    _touch_lease()
+    t = threading.Thread(target=beat, name="fbreelz-lease", daemon=True)
+    t.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        t.join()
+
+
+def _touch_lease() -> None:
+    try:
+        LEASE_DIR.mkdir(parents=True, exist_ok=True)
+        (LEASE_DIR / str(os.getpid())).touch()
+    except OSError:
+        pass
+
+
+def _active_leases() -> int:
+    """Downloader processes that moved data in the last LEASE_TTL seconds (at least 1)."""
+    now = time.time()
+    n = 0
+    try:
+        for p in LEASE_DIR.iterdir():
+            try:
+                if now - p.stat().st_mtime < LEASE_TTL:
+                    n += 1
+                else:
+                    p.unlink(missing_ok=True)
+            except OSError:
+                continue
+    except OSError:
+        pass
+    return max(1, n)
+
+
+GOVERNOR = Governor()
+configure = GOVERNOR.configure
+ytdlp_args = GOVERNOR.ytdlp_args
+throttle = GOVERNOR.throttle
+
+
+if __name__ == "__main__":
+    r = GOVERNOR.rate()
+    print(f"[INFO] access log: {GOVERNOR.access_log} ({'readable' if os.access(GOVERNOR.access_log, os.R_OK) else 'not readable'})")
+    print(f"[INFO] playback active: {GOVERNOR.playing()}; background limit: "
+          + ("none" if r is None else f"{r * 8 / 1000:.0f} kbit/s"))
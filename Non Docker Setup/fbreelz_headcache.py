@@ -0,0 +1,278 @@
+## version 1
+"""FBReelz head-of-file cache: keep the first few seconds of every reel on disk.
+
+Purpose
+- A cold reel normally has to download completely before the cache playlist
+  lists it. In head-cache mode Phase 2 only stores the first --head-bytes of
+  each reel (plus the moov box when the upstream file is not faststart), so
+  every item in the library starts near-instantly from local disk.
+- The rest is fetched on demand while the reel plays: the resolve server's
+  /m/<reel-id> endpoint serves ranges from this cache and fills gaps from the
+  signed CDN URL, writing what it fetches back into the cache.
+
+On-disk layout (under <cache>/head/)
+- facebook_<id>.mp4          sparse file, only the cached byte ranges are written
+- facebook_<id>.ranges.json  {"size": N, "ranges": [[start, end), ...], "faststart": bool}
+"""
+
+from __future__ import annotations
+
+import json
+import os
+import struct
+import threading
+import urllib.error
+import urllib.request
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+
+DEFAULT_HEAD_BYTES = 2 * 1024 * 1024
+CHUNK = 256 * 1024
+UA = "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
+
+
+class UpstreamExpired(RuntimeError):
+    """The signed URL was rejected (403/410); the caller should re-resolve and retry."""
+
+
+class UpstreamChanged(RuntimeError):
+    """Upstream reports a different total size than ranges.json; the cached bytes are stale."""
+
+
+def _add_range(ranges: List[List[int]], start: int, end: int) -> List[List[int]]:
+    """Insert [start, end) into a sorted list of disjoint ranges, merging neighbours."""
+    out: List[List[int]] = []
+    for s, e in sorted(ranges + [[start, end]]):
+        if out and s <= out[-1][1]:
+            out[-1][1] = max(out[-1][1], e)
+        else:
+            out.append([s, e])
+    return out
+
+
+def _segments(ranges: List[List[int]], start: int, end: int) -> Iterator[Tuple[int, int, bool]]:
+    """Split [start, end) into (s, e, is_cached) pieces."""
+    pos = start
+    for s, e in ranges:
+        if e <= pos:
+            continue
+        if s >= end:
+            break
+        if s > pos:
+            yield pos, s, False
+        yield max(pos, s), min(e, end), True
+        pos = min(e, end)
+        if pos >= end:
+            return
+    if pos < end:
+        yield pos, end, False
+
+
+def _top_level_boxes(head: bytes) -> List[Tuple[bytes, int, int]]:
+    """(type, offset, size) for the ISO-BMFF boxes whose headers fall inside `head`."""
+    out: List[Tuple[bytes, int, int]] = []
+    off = 0
+    while off + 8 <= len(head):
+        size, kind = struct.unpack(">I4s", head[off : off + 8])
+        if size == 1:
+            if off + 16 > len(head):
+                break
+            size = struct.unpack(">Q", head[off + 8 : off + 16])[0]
+        out.append((kind, off, size))
+        if size < 8:  # 0 = "to end of file"; anything else is malformed
+            break
+        off += size
+    return out
+
+
+def _fetch(url: str, start: int, end: Optional[int], user_agent: str = UA):
+    """Open an upstream Range request for [start, end) (end=None: to EOF)."""
+    rng = f"bytes={start}-" if end is None else f"bytes={start}-{end - 1}"
+    req = urllib.request.Request(url, headers={"Range": rng, "User-Agent": user_agent})
+    try:
+        resp = urllib.request.urlopen(req, timeout=30)
+    except urllib.error.HTTPError as e:
+        if e.code in (403, 410):
+            raise UpstreamExpired(f"upstream returned {e.code}") from e
+        raise
+    if start > 0 and resp.status != 206:
+        resp.close()
+        raise RuntimeError("upstream ignored the Range request")
+    return resp
+
+
+def _total_size(resp) -> Optional[int]:
+    cr = resp.headers.get("Content-Range") or ""
+    if "/" in cr and cr.rsplit("/", 1)[1].isdigit():
+        return int(cr.rsplit("/", 1)[1])
+    cl = resp.headers.get("Content-Length")
+    return int(cl) if resp.status == 200 and cl and cl.isdigit() else None
+
+
+class HeadCache:
+    def __init__(self, root: Path, user_agent: str = UA) -> None:
+        self.root = root
+        self.user_agent = user_agent
+        self._locks: Dict[str, threading.Lock] = {}
+        self._guard = threading.Lock()
+
+    def media_path(self, reel_id: str) -> Path:
+        return self.root / f"facebook_{reel_id}.mp4"
+
+    def meta_path(self, reel_id: str) -> Path:
+        return self.root / f"facebook_{reel_id}.ranges.json"
+
+    def _lock(self, reel_id: str) -> threading.Lock:
+        with self._guard:
+            return self._locks.setdefault(reel_id, threading.Lock())
+
+    def meta(self, reel_id: str) -> Optional[Dict[str, Any]]:
+        try:
+            return json.loads(self.meta_path(reel_id).read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return None
+
+    def _save_meta(self, reel_id: str, meta: Dict[str, Any]) -> None:
+        self.root.mkdir(parents=True, exist_ok=True)
+        tmp = self.meta_path(reel_id).with_suffix(".json.tmp")
+        tmp.write_text(json.dumps(meta), encoding="utf-8")
+        os.replace(tmp, self.meta_path(reel_id))
+
+    def _record(self, reel_id: str, start: int, end: int, size: Optional[int] = None) -> None:
+        with self._lock(reel_id):
+            meta = self.meta(reel_id) or {"size": size, "ranges": []}
+            if size and not meta.get("size"):
+                meta["size"] = size
+            if end > start:
+                meta["ranges"] = _add_range(meta.get("ranges") or [], start, end)
+            self._save_meta(reel_id, meta)
+
+    def _write_stream(
+        self,
+        reel_id: str,
+        resp,
+        start: int,
+        sink: Optional[Callable[[bytes], None]] = None,
+        limit: Optional[int] = None,
+    ) -> int:
+        """Copy an upstream body into the sparse file at `start` (and to `sink`); returns bytes written."""
+        path = self.media_path(reel_id)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        written = 0
+        try:
+            os.close(os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644))
+        except FileExistsError:
+            pass  # never truncate: another request may be filling a different range
+        with open(path, "r+b") as f:
+            f.seek(start)
+            try:
+                while limit is None or written < limit:
+                    buf = resp.read(CHUNK if limit is None else min(CHUNK, limit - written))
+                    if not buf:
+                        break
+                    f.write(buf)
+                    written += len(buf)
+                    if sink:
+                        sink(buf)
+            finally:
+                # Whatever made it to disk is usable, even if the client went away.
+                self._record(reel_id, start, start + written)
+        return written
+
+    def prime(self, reel_id: str, url: str, head_bytes: int = DEFAULT_HEAD_BYTES) -> Dict[str, Any]:
+        """Cache the head of a reel (and its moov box if it sits after mdat)."""
+        with _fetch(url, 0, head_bytes, self.user_agent) as resp:
+            size = _total_size(resp)
+            self._record(reel_id, 0, 0, size)
+            self._write_stream(reel_id, resp, 0, limit=head_bytes)
+
+        with open(self.media_path(reel_id), "rb") as f:
+            head = f.read(head_bytes)
+        boxes = _top_level_boxes(head)
+        kinds = [k for k, _, _ in boxes]
+        faststart = b"moov" in kinds and (b"mdat" not in kinds or kinds.index(b"moov") < kinds.index(b"mdat"))
+        if not faststart and b"mdat" in kinds and size:
+            _, off, bsize = boxes[kinds.index(b"mdat")]
+            moov_at = off + bsize if bsize >= 8 else None
+            if moov_at and moov_at < size:
+                with _fetch(url, moov_at, None, self.user_agent) as resp:
+                    self._write_stream(reel_id, resp, moov_at)
+
+        with self._lock(reel_id):
+            meta = self.meta(reel_id) or {"ranges": []}
+            meta["size"] = meta.get("size") or size
+            meta["faststart"] = faststart
+            self._save_meta(reel_id, meta)
+        return meta
+
+    def drop(self, reel_id: str) -> None:
+        """Forget everything cached for a reel; the next request primes it again."""
+        with self._lock(reel_id):
+            for path in (self.meta_path(reel_id), self.media_path(reel_id)):
+                try:
+                    path.unlink()
+                except FileNotFoundError:
+                    pass
+
+    def _open(self, reel_id: str, s: int, e: int, url_for: Callable[[bool], str], size: Optional[int]):
+        """Upstream response for [s, e), re-resolving once on expiry; checks the total size against `size`."""
+        for attempt in (False, True):
+            try:
+                resp = _fetch(url_for(attempt), s, e, self.user_agent)
+                break
+            except UpstreamExpired:
+                if attempt:
+                    raise
+        total = _total_size(resp)
+        if size and total and total != size:
+            resp.close()
+            self.drop(reel_id)
+            raise UpstreamChanged(f"upstream size {total} != cached size {size}")
+        return resp
+
+    def serve(
+        self,
+        reel_id: str,
+        start: int,
+        end: int,
+        url_for: Callable[[bool], str],
+        sink: Callable[[bytes], None],
+        begin: Optional[Callable[[], None]] = None,
+    ) -> None:
+        """Send [start, end) to `sink`, from disk where cached, upstream (and into the cache) otherwise.
+
+        url_for(refresh) returns the signed upstream URL; refresh=True asks for a re-resolve.
+        The first upstream request is made before begin() is called (i.e. before the caller
+        sends headers), so a changed upstream file raises UpstreamChanged while the caller
+        can still answer with a redirect. Later mismatches or short upstream reads raise
+        once bytes are out; the caller can only drop the connection then.
+        """
+        meta = self.meta(reel_id) or {"ranges": []}
+        size = meta.get("size")
+        segments = list(_segments(meta.get("ranges") or [], start, end))
+        gaps = [(s, e) for s, e, cached in segments if not cached]
+        pending = self._open(reel_id, *gaps[0], url_for, size) if gaps else None
+        try:
+            if begin:
+                begin()
+            for s, e, cached in segments:
+                if cached:
+                    with open(self.media_path(reel_id), "rb") as f:
+                        f.seek(s)
+                        left = e - s
+                        while left > 0:
+                            buf = f.read(min(CHUNK, left))
+                            if not buf:
+                                raise RuntimeError("cached range shorter than recorded")
+                            sink(buf)
+                            left -= len(buf)
+                    continue
+                resp, pending = pending or self._open(reel_id, s, e, url_for, size), None
+                with resp:
+                    written = self._write_stream(reel_id, resp, s, sink, limit=e - s)
+                if written < e - s:
+                    raise RuntimeError(f"upstream ended after {written} of {e - s} bytes at offset {s}")
+        finally:
+            if pending:
+                pending.close()
@@ -0,0 +1,230 @@
+## version 1
+"""FBReelz cache integrity scanner: keep truncated/corrupt media out of playlists.
+
+Purpose
+- Interrupted yt-dlp runs can leave truncated or corrupt MP4s in cache/, and the
+  playlist builders only checked that a file exists.
+- Each file is checked for container consistency (top-level ISO-BMFF boxes must
+  tile the file exactly, which catches truncation) and with ffprobe (streams +
+  a positive duration).
+- Without ffprobe only the container check runs; the duration then comes from the
+  moov box (fbreelz_mp4info.py).
+- Results are cached in integrity_cache.json keyed by device, inode, size and
+  mtime, so unchanged files are never probed twice.
+- Bad files are moved to cache/.quarantine/ (unless --no-quarantine).
+
+Usage
+  python fbreelz_integrity.py                      # scan /app/data/cache, quarantine bad files
+  python fbreelz_integrity.py --jobs 8 --no-quarantine
+
+Phase 2 and make_cache_playlist.py call validate() so only validated media is listed.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import shutil
+import struct
+import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Dict, Iterable, Optional
+
+from fbreelz_cachelayout import forget, iter_media, media_id
+from fbreelz_mp4info import probe as mp4_probe
+
+
+DEFAULT_CACHE_DIR = Path("/app/data/cache")
+CACHE_FILE_NAME = "integrity_cache.json"
+QUARANTINE_DIR_NAME = ".quarantine"
+MEDIA_SUFFIXES = (".mp4", ".m4a", ".mov", ".webm", ".mkv")
+
+
+@dataclass
+class Result:
+    ok: bool
+    duration: Optional[float] = None
+    reason: str = ""
+
+
+def _key(st: os.stat_result) -> str:
+    return f"{st.st_dev}:{st.st_ino}:{st.st_size}:{st.st_mtime_ns}"
+
+
+def _ffprobe_exists() -> bool:
+    return shutil.which("ffprobe") is not None
+
+
+def _boxes_tile_file(path: Path, size: int) -> Optional[str]:
+    """None if the top-level boxes exactly cover the file, else a reason string."""
+    if path.suffix.lower() not in (".mp4", ".m4a", ".mov"):
+        return None
+    off = 0
+    kinds = set()
+    with open(path, "rb") as f:
+        while off < size:
+            f.seek(off)
+            hdr = f.read(16)
+            if len(hdr) < 8:
+                return f"truncated box header at {off}"
+            bsize, kind = struct.unpack(">I4s", hdr[:8])
+            if bsize == 1:
+                if len(hdr) < 16:
+                    return f"truncated box header at {off}"
+                bsize = struct.unpack(">Q", hdr[8:16])[0]
+            elif bsize == 0:
+                bsize = size - off
+            if bsize < 8:
+                return f"invalid box size at {off}"
+            if off + bsize > size:
+                return f"{kind.decode('latin-1')} box runs past end of file (truncated)"
+            kinds.add(kind)
+            off += bsize
+    if b"moov" not in kinds:
+        return "no moov box"
+    return None
+
+
+def _probe(path: Path, size: int) -> Result:
+    if size == 0:
+        return Result(False, reason="empty file")
+    try:
+        why = _boxes_tile_file(path, size)
+    except OSError as e:
+        return Result(False, reason=str(e))
+    if why:
+        return Result(False, reason=why)
+    if not _ffprobe_exists():
+        info = mp4_probe(path)
+        return Result(True, info.duration if info else None, reason="container ok (ffprobe not available)")
+
+    cmd = ["ffprobe", "-v", "error", "-show_entries", "format=duration:stream=codec_type", "-of", "json", str(path)]
+    p = subprocess.run(cmd, capture_output=True, text=True)
+    if p.returncode != 0:
+        return Result(False, reason=(p.stderr or "ffprobe failed").strip()[:300])
+    try:
+        data = json.loads(p.stdout or "{}")
+    except ValueError:
+        return Result(False, reason="unreadable ffprobe output")
+    if not any(s.get("codec_type") in ("video", "audio") for s in data.get("streams") or []):
+        return Result(False, reason="no audio/video streams")
+    try:
+        duration = float((data.get("format") or {}).get("duration") or 0)
+    except ValueError:
+        duration = 0.0
+    if duration <= 0:
+        return Result(False, reason="zero or unknown duration")
+    if p.stderr.strip():
+        return Result(False, duration, reason=p.stderr.strip()[:300])
+    return Result(True, duration)
+
+
+class IntegrityCache:
+    """Probe results keyed by (dev, inode, size, mtime); persisted next to the cache dir."""
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self._lock = threading.Lock()
+        self._dirty = False
+        try:
+            self._data: Dict[str, Dict] = json.loads(path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            self._data = {}
+
+    def check(self, media: Path) -> Result:
+        try:
+            st = media.stat()
+        except OSError as e:
+            return Result(False, reason=str(e))
+        key = _key(st)
+        with self._lock:
+            hit = self._data.get(key)
+        if hit:
+            return Result(hit["ok"], hit.get("duration"), hit.get("reason", ""))
+        res = _probe(media, st.st_size)
+        if res.ok and not _ffprobe_exists():
+            return res  # not fully checked; probe again once ffprobe is available
+        with self._lock:
+            self._data[key] = dict(asdict(res), path=str(media.resolve()))
+            self._dirty = True
+        return res
+
+    def scan(self, paths: Iterable[Path], jobs: int = 0) -> Dict[Path, Result]:
+        paths = list(paths)
+        with ThreadPoolExecutor(max_workers=jobs or min(8, os.cpu_count() or 1)) as pool:
+            return dict(zip(paths, pool.map(self.check, paths)))
+
+    def save(self) -> None:
+        with self._lock:
+            if not self._dirty:
+                return
+            live = {}
+            for k, v in self._data.items():
+                # Drop entries whose file is gone or changed.
+                try:
+                    if _key(Path(v["path"]).stat()) == k:
+                        live[k] = v
+                except (OSError, KeyError):
+                    pass
+            tmp = self.path.with_name(self.path.name + ".tmp")
+            tmp.write_text(json.dumps(live, indent=1), encoding="utf-8")
+            os.replace(tmp, self.path)
+            self._data = live
+            self._dirty = False
+
+
+def quarantine(media: Path, cache_dir: Path) -> Path:
+    qdir = cache_dir / QUARANTINE_DIR_NAME
+    qdir.mkdir(parents=True, exist_ok=True)
+    dest = qdir / media.name
+    os.replace(media, dest)
+    return dest
+
+
+def media_files(cache_dir: Path) -> Iterable[Path]:
+    return iter_media(cache_dir, MEDIA_SUFFIXES)
+
+
+def validate(paths: Iterable[Path], cache_dir: Path, quarantine_bad: bool = True, jobs: int = 0) -> Dict[Path, Result]:
+    """Check `paths` (cached results reused), optionally quarantining failures. Returns all results."""
+    ic = IntegrityCache(cache_dir.parent / CACHE_FILE_NAME)
+    results = ic.scan(paths, jobs=jobs)
+    ic.save()
+    if quarantine_bad:
+        for p, res in results.items():
+            if not res.ok and p.exists():
+                dest = quarantine(p, cache_dir)
+                if media_id(p):
+                    forget(cache_dir, media_id(p))
+                print(f"[WARN] Quarantined {p.name}: {res.reason} -> {dest}")
+    return results
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="Validate cached FBReelz media and quarantine bad files")
+    ap.add_argument("--cache-dir", default=str(DEFAULT_CACHE_DIR), help=f"Cache directory (default: {DEFAULT_CACHE_DIR})")
+    ap.add_argument("--jobs", type=int, default=0, help="Parallel probes (default: min(8, CPUs))")
+    ap.add_argument("--no-quarantine", action="store_true", help="Only report bad files")
+    args = ap.parse_args()
+
+    cache_dir = Path(args.cache_dir)
+    if not cache_dir.exists():
+        raise SystemExit(f"[ERR] cache dir not found: {cache_dir}")
+    if not _ffprobe_exists():
+        print("[WARN] ffprobe not available; checking container structure only.")
+
+    results = validate(media_files(cache_dir), cache_dir, quarantine_bad=not args.no_quarantine, jobs=args.jobs)
+    bad = [p for p, r in results.items() if not r.ok]
+    for p in bad:
+        if args.no_quarantine:
+            print(f"[BAD] {p.name}: {results[p].reason}")
+    print(f"[OK] Scanned {len(results)} file(s): {len(results) - len(bad)} ok, {len(bad)} bad")
+    return 1 if bad and args.no_quarantine else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,194 @@
+## version 1
+"""FBReelz streaming JSON reader (stdlib only).
+
+Purpose
+- Phase-1 payloads (especially debug-sized GraphQL dumps) and resolved_items.json
+  grow with the library; json.load() holds the whole document in memory.
+- This module walks the document incrementally and yields the elements of one
+  array (e.g. data.viewer.saver_info.all_saves.edges or items) one at a time.
+  Everything outside that array is skipped without being materialised, so peak
+  memory is bounded by the largest single element, not the file.
+
+Usage
+  from fbreelz_jsonstream import iter_array, iter_saved_rows
+
+  for fmt, row in iter_saved_rows(Path("saved_items.json")):
+      ...
+
+  with path.open("r", encoding="utf-8") as f:
+      for _, item in iter_array(f, [("items",)]):
+          ...
+"""
+
+from __future__ import annotations
+
+import json
+import re
+from pathlib import Path
+from typing import Any, Iterator, List, Optional, Sequence, TextIO, Tuple
+
+
+CHUNK_SIZE = 1 << 16
+
+GRAPHQL_EDGES_PATH = ("data", "viewer", "saver_info", "all_saves", "edges")
+MBASIC_ITEMS_PATH = ("items",)
+
+_WS = re.compile(r"[ \t\r\n]*")
+_STR_BODY = re.compile(r'[^"\\]*(?:\\.[^"\\]*)*', re.S)
+_STRUCT = re.compile(r'["\[\]{}]')
+_SCALAR = re.compile(r"[^,\]}\s]*")
+
+
+class _Scanner:
+    """Chunked cursor over a text stream; drops consumed input unless a value is being captured."""
+
+    def __init__(self, fp: TextIO, chunk_size: int = CHUNK_SIZE) -> None:
+        self.fp = fp
+        self.chunk_size = chunk_size
+        self.buf = ""
+        self.pos = 0
+        self.mark: Optional[int] = None
+        self.eof = False
+
+    def _fill(self) -> bool:
+        if self.eof:
+            return False
+        data = self.fp.read(self.chunk_size)
+        if not data:
+            self.eof = True
+            return False
+        cut = self.pos if self.mark is None else self.mark
+        if cut:
+            self.buf = self.buf[cut:]
+            self.pos -= cut
+            if self.mark is not None:
+                self.mark -= cut
+        self.buf += data
+        return True
+
+    def peek(self) -> str:
+        """Skip whitespace and return the next character ('' at end of input)."""
+        while True:
+            self.pos = _WS.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not self._fill():
+                return ""
+
+    def expect(self, ch: str) -> None:
+        got = self.peek()
+        if got != ch:
+            raise ValueError(f"expected {ch!r} but found {got or 'end of input'!r}")
+        self.pos += 1
+
+    def _skip_string(self) -> None:
+        self.pos += 1  # opening quote
+        while True:
+            self.pos = _STR_BODY.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf) and self.buf[self.pos] == '"':
+                self.pos += 1
+                return
+            # Either the buffer ran out or it ends on a lone backslash: read on.
+            if not self._fill():
+                raise ValueError("unterminated string")
+
+    def skip_value(self) -> None:
+        c = self.peek()
+        if c == '"':
+            self._skip_string()
+            return
+        if c in ("{", "["):
+            depth = 0
+            while True:
+                m = _STRUCT.search(self.buf, self.pos)
+                if not m:
+                    self.pos = len(self.buf)
+                    if not self._fill():
+                        raise ValueError("unexpected end of input")
+                    continue
+                self.pos = m.start()
+                ch = m.group()
+                if ch == '"':
+                    self._skip_string()
+                    continue
+                self.pos += 1
+                depth += 1 if ch in "[{" else -1
+                if depth == 0:
+                    return
+        if not c:
+            raise ValueError("unexpected end of input")
+        while True:
+            self.pos = _SCALAR.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf) or not self._fill():
+                return
+
+    def read_value(self) -> Any:
+        """Decode the next value; only this value is held in memory."""
+        self.peek()
+        self.mark = self.pos
+        try:
+            self.skip_value()
+            return json.loads(self.buf[self.mark:self.pos])
+        finally:
+            self.mark = None
+
+
+def _walk(sc: _Scanner, paths: List[Tuple[str, ...]], depth: int) -> Iterator[Tuple[Tuple[str, ...], Any]]:
+    """Walk the object at the cursor, descending only into keys that lead to a wanted array."""
+    sc.expect("{")
+    if sc.peek() == "}":
+        sc.pos += 1
+        return
+    while True:
+        if sc.peek() != '"':
+            raise ValueError("expected object key")
+        key = sc.read_value()
+        sc.expect(":")
+
+        here = [p for p in paths if len(p) > depth and p[depth] == key]
+        target = next((p for p in here if len(p) == depth + 1), None)
+        nxt = sc.peek()
+        if target is not None and nxt == "[":
+            sc.pos += 1
+            if sc.peek() == "]":
+                sc.pos += 1
+            else:
+                while True:
+                    yield target, sc.read_value()
+                    c = sc.peek()
+                    sc.pos += 1
+                    if c == "]":
+                        break
+                    if c != ",":
+                        raise ValueError(f"expected ',' or ']' in array, found {c!r}")
+        elif here and nxt == "{":
+            yield from _walk(sc, here, depth + 1)
+        else:
+            sc.skip_value()
+
+        c = sc.peek()
+        sc.pos += 1
+        if c == "}":
+            return
+        if c != ",":
+            raise ValueError(f"expected ',' or '}}' in object, found {c!r}")
+
+
+def iter_array(fp: TextIO, paths: Sequence[Tuple[str, ...]], chunk_size: int = CHUNK_SIZE) -> Iterator[Tuple[Tuple[str, ...], Any]]:
+    """Yield (path, element) for every element of the array(s) at the given key paths."""
+    sc = _Scanner(fp, chunk_size)
+    if sc.peek() != "{":
+        return
+    yield from _walk(sc, list(paths), 0)
+
+
+def iter_saved_rows(path: Path) -> Iterator[Tuple[str, Any]]:
+    """Yield (detected_format, row) from a Phase-1 payload: graphql_edges or mbasic_items."""
+    formats = {GRAPHQL_EDGES_PATH: "graphql_edges", MBASIC_ITEMS_PATH: "mbasic_items"}
+    first: Optional[Tuple[str, ...]] = None
+    with path.open("r", encoding="utf-8") as f:
+        for p, row in iter_array(f, list(formats)):
+            # Only one layout per payload; ignore a second matching array if present.
+            first = first or p
+            if p == first:
+                yield formats[p], row
@@ -0,0 +1,269 @@
+## version 1
+"""FBReelz playback load generator: how many viewers can a serving backend take?
+
+Purpose
+- Nobody knew how many simultaneous players NGINX /cache/, the Node
+  /api/video/:filename range handler or http.server sustain before seeks stall.
+- Reads a generated M3U and runs N simulated players against it. Each player
+  keeps one connection and, per reel:
+  - opens it with a first range request (like a player reading the moov/first frames),
+  - reads on sequentially in --chunk ranges, paced to --kbps when set,
+  - seeks to a random offset with --seek-prob and skips to another reel with --skip-prob.
+  A failed or unusable start (refused, error status, unknown size) backs off
+  BACKOFF_MIN..BACKOFF_MAX seconds before the next reel, so a dead backend is not busy-looped.
+- Reports time-to-first-byte and per-request throughput percentiles plus error
+  counts per request kind, so backends and configurations can be compared on the
+  same data.
+
+Usage
+  python fbreelz_loadtest.py --playlist http://YOUR_SERVER_IP/fbreelz_cache_http.m3u --players 20 --duration 60
+  python fbreelz_loadtest.py --playlist /app/data/fbreelz_cache.m3u --base http://127.0.0.1:8081/ --players 50 --kbps 2500
+  python fbreelz_loadtest.py ... --json report.json       # machine-readable, for comparing runs
+
+Compare backends with the same --seed: the players then pick the same reels and seeks.
+"""
+
+from __future__ import annotations
+
+import argparse
+import http.client
+import json
+import random
+import re
+import threading
+import time
+import urllib.request
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import urljoin, urlsplit
+
+
+DEFAULT_CHUNK = 1 << 20
+STALL_MS = 1000.0
+BACKOFF_MIN = 0.05  # seconds after a failed or unusable reel start; doubles per failure in a row
+BACKOFF_MAX = 1.0
+
+_CONTENT_RANGE_RE = re.compile(r"bytes (\d+)-(\d+)/(\d+|\*)")
+
+
+@dataclass
+class Sample:
+    kind: str  # start | seq | seek
+    ttfb: float  # seconds to response headers
+    seconds: float  # whole request
+    nbytes: int
+    error: Optional[str] = None
+
+
+def load_playlist(source: str, base: Optional[str]) -> List[str]:
+    """Absolute media URLs from an M3U (file path or URL); relative entries resolve against base."""
+    if re.match(r"^https?://", source):
+        with urllib.request.urlopen(source, timeout=30) as resp:
+            text = resp.read().decode("utf-8", "replace")
+        base = base or source
+    else:
+        text = Path(source).read_text(encoding="utf-8")
+    urls: List[str] = []
+    for line in text.splitlines():
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        if re.match(r"^https?://", line):
+            urls.append(line)
+        elif base:
+            urls.append(urljoin(base, line))
+    return urls
+
+
+def _pct(values: List[float], p: float) -> float:
+    if not values:
+        return 0.0
+    s = sorted(values)
+    return s[min(len(s) - 1, int(round(p / 100 * (len(s) - 1))))]
+
+
+class Player:
+    """One simulated viewer: a persistent connection and a watch/seek/skip loop."""
+
+    def __init__(self, n: int, urls: List[str], args: argparse.Namespace, until: float, seed: Optional[int]) -> None:
+        self.n = n
+        self.urls = urls
+        self.args = args
+        self.until = until
+        self.rng = random.Random(None if seed is None else seed + n)
+        self.samples: List[Sample] = []
+        self._conn: Optional[http.client.HTTPConnection] = None
+        self._origin: Optional[Tuple[str, str]] = None
+
+    def _connection(self, url: str) -> Tuple[http.client.HTTPConnection, str]:
+        u = urlsplit(url)
+        origin = (u.scheme, u.netloc)
+        if self._conn is None or self._origin != origin:
+            self._close()
+            cls = http.client.HTTPSConnection if u.scheme == "https" else http.client.HTTPConnection
+            self._conn = cls(u.netloc, timeout=self.args.timeout)
+            self._origin = origin
+        return self._conn, (u.path or "/") + (f"?{u.query}" if u.query else "")
+
+    def _close(self) -> None:
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def _get(self, url: str, kind: str, start: int, length: int) -> Tuple[Optional[int], int]:
+        """One range request; returns (total size if known, bytes read)."""
+        t0 = time.monotonic()
+        total: Optional[int] = None
+        nbytes = 0
+        try:
+            conn, path = self._connection(url)
+            conn.request("GET", path, headers={"Range": f"bytes={start}-{start + length - 1}", "User-Agent": "FBReelzLoadTest/1"})
+            resp = conn.getresponse()
+            ttfb = time.monotonic() - t0
+            if resp.status == 206:
+                m = _CONTENT_RANGE_RE.match(resp.getheader("Content-Range") or "")
+                if m and m.group(3) != "*":
+                    total = int(m.group(3))
+            elif resp.status == 200:
+                # No Range support: the body is the whole file; read our share and drop the connection.
+                body = resp.read(length)
+                self._close()
+                self.samples.append(Sample(kind, ttfb, time.monotonic() - t0, len(body), "no range support (200)"))
+                return int(resp.getheader("Content-Length") or 0) or None, len(body)
+            else:
+                resp.read()
+                self.samples.append(Sample(kind, ttfb, time.monotonic() - t0, 0, f"HTTP {resp.status}"))
+                return None, 0
+            while True:
+                buf = resp.read(64 << 10)
+                if not buf:
+                    break
+                nbytes += len(buf)
+            self.samples.append(Sample(kind, ttfb, time.monotonic() - t0, nbytes))
+            return total, nbytes
+        except (OSError, http.client.HTTPException) as e:
+            self._close()
+            self.samples.append(Sample(kind, time.monotonic() - t0, time.monotonic() - t0, nbytes, type(e).__name__))
+            return None, nbytes
+
+    def run(self) -> None:
+        a = self.args
+        rate = a.kbps * 1000 / 8 if a.kbps else 0.0
+        backoff = BACKOFF_MIN
+        while time.monotonic() < self.until:
+            url = self.rng.choice(self.urls)
+            size, got = self._get(url, "start", 0, a.chunk)
+            if not size or not got:
+                # Refused, an error status or no usable size: a real player would not hammer
+                # the server, and retrying at once would only measure this loop.
+                time.sleep(min(backoff, max(0.0, self.until - time.monotonic())))
+                backoff = min(backoff * 2, BACKOFF_MAX)
+                continue
+            backoff = BACKOFF_MIN
+            pos = got
+            played = time.monotonic()
+            while pos < size and time.monotonic() < self.until:
+                r = self.rng.random()
+                if r < a.skip_prob:
+                    break
+                kind = "seq"
+                if r < a.skip_prob + a.seek_prob:
+                    kind, pos = "seek", self.rng.randrange(0, size)
+                    played = time.monotonic()
+                _, got = self._get(url, kind, pos, min(a.chunk, size - pos))
+                if not got:
+                    break
+                pos += got
+                if rate:
+                    # A player only asks for more once its buffer drains.
+                    ahead = got / rate - (time.monotonic() - played)
+                    if ahead > 0:
+                        time.sleep(min(ahead, max(0.0, self.until - time.monotonic())))
+                    played = time.monotonic()
+        self._close()
+
+
+def report(samples: List[Sample], wall: float, players: int, stall_ms: float) -> Dict[str, Any]:
+    out: Dict[str, Any] = {
+        "players": players,
+        "seconds": round(wall, 2),
+        "requests": len(samples),
+        "bytes": sum(s.nbytes for s in samples),
+        "kinds": {},
+        "errors": {},
+    }
+    out["mb_per_s"] = round(out["bytes"] / 1e6 / max(wall, 1e-6), 2)
+    for kind in ("start", "seq", "seek"):
+        ks = [s for s in samples if s.kind == kind]
+        ok = [s for s in ks if not s.error]
+        ttfb = [s.ttfb * 1000 for s in ok]
+        mbps = [s.nbytes / 1e6 / max(s.seconds, 1e-6) for s in ok if s.nbytes]
+        out["kinds"][kind] = {
+            "requests": len(ks),
+            "errors": len(ks) - len(ok),
+            "ttfb_ms": {f"p{p}": round(_pct(ttfb, p), 1) for p in (50, 90, 99)} | {"max": round(max(ttfb, default=0), 1)},
+            # Throughput matters at the slow end: p10 is the slowest tenth of transfers.
+            "mb_per_s": {f"p{p}": round(_pct(mbps, p), 2) for p in (10, 50, 90)},
+            "stalls": sum(1 for t in ttfb if t > stall_ms),
+        }
+    for s in samples:
+        if s.error:
+            out["errors"][s.error] = out["errors"].get(s.error, 0) + 1
+    return out
+
+
+def _print_report(r: Dict[str, Any], stall_ms: float) -> None:
+    print(f"[OK] {r['players']} player(s), {r['seconds']}s: {r['requests']} requests, "
+          f"{r['bytes'] / 1e6:.1f} MB ({r['mb_per_s']} MB/s aggregate)")
+    print(f"{'kind':<6} {'reqs':>6} {'errs':>5} {'ttfb p50':>9} {'p90':>7} {'p99':>7} {'max':>7} {'MB/s p50':>9} {'p10':>6} {'stalls':>7}")
+    for kind, k in r["kinds"].items():
+        t, m = k["ttfb_ms"], k["mb_per_s"]
+        print(f"{kind:<6} {k['requests']:>6} {k['errors']:>5} {t['p50']:>8.0f}ms {t['p90']:>5.0f}ms {t['p99']:>5.0f}ms "
+              f"{t['max']:>5.0f}ms {m['p50']:>9.2f} {m['p10']:>6.2f} {k['stalls']:>7}")
+    print(f"(stalls = TTFB over {stall_ms:.0f} ms)")
+    for err, n in sorted(r["errors"].items(), key=lambda kv: -kv[1]):
+        print(f"[WARN] {n} x {err}")
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="Simulate concurrent FBReelz players against a serving backend")
+    ap.add_argument("--playlist", required=True, help="M3U file or URL (fbreelz_cache_http.m3u, fbreelz_cache.m3u, ...)")
+    ap.add_argument("--base", default=None, help="Base URL for relative playlist entries, e.g. http://127.0.0.1:8081/")
+    ap.add_argument("--players", type=int, default=10, help="Concurrent players (default: 10)")
+    ap.add_argument("--duration", type=float, default=30.0, help="Seconds to run (default: 30)")
+    ap.add_argument("--chunk", type=int, default=DEFAULT_CHUNK, help=f"Bytes per range request (default: {DEFAULT_CHUNK})")
+    ap.add_argument("--kbps", type=float, default=0.0, help="Pace each player to this bitrate (default: 0 = as fast as possible)")
+    ap.add_argument("--seek-prob", type=float, default=0.15, help="Chance a request is a random seek (default: 0.15)")
+    ap.add_argument("--skip-prob", type=float, default=0.05, help="Chance a player skips to another reel (default: 0.05)")
+    ap.add_argument("--timeout", type=float, default=15.0, help="Per-request socket timeout in seconds (default: 15)")
+    ap.add_argument("--stall-ms", type=float, default=STALL_MS, help=f"TTFB counted as a stall (default: {STALL_MS:.0f})")
+    ap.add_argument("--seed", type=int, default=None, help="Random seed, to replay the same workload against another backend")
+    ap.add_argument("--json", default=None, help="Also write the report as JSON here")
+    args = ap.parse_args()
+
+    urls = load_playlist(args.playlist, args.base)
+    if not urls:
+        raise SystemExit("[ERR] no playable entries (relative entries need --base)")
+    print(f"[OK] {len(urls)} entries; {args.players} player(s) for {args.duration:.0f}s")
+
+    start = time.monotonic()
+    until = start + args.duration
+    players = [Player(n, urls, args, until, args.seed) for n in range(max(1, args.players))]
+    threads = [threading.Thread(target=p.run, daemon=True) for p in players]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wall = time.monotonic() - start
+
+    r = report([s for p in players for s in p.samples], wall, len(players), args.stall_ms)
+    _print_report(r, args.stall_ms)
+    if args.json:
+        Path(args.json).write_text(json.dumps(r, indent=2), encoding="utf-8")
+        print(f"[OK] Wrote report to {args.json}")
+    return 1 if r["errors"] else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
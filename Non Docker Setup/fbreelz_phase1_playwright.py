@@ -21,66 +21,103 @@ Usage
   # headed (requires a display or Xvfb)
   python fbreelz_phase1_playwright_v2.py --max 30 --headed
 
+  # several accounts / collections at once (one Chromium, one context per profile)
+  python fbreelz_phase1_playwright_v2.py --max 30 \
+      --profile alice=/opt/fbreelz/secrets/alice_cookies.txt \
+      --profile bob=/opt/fbreelz/secrets/bob_cookies.txt \
+      --collection https://www.facebook.com/saved/?list_id=123
+
+  # where does the time go? navigation/extraction spans per page + Python profile
+  python fbreelz_phase1_playwright_v2.py --max 30 --trace /opt/fbreelz/data/trace_phase1.json --cprofile /opt/fbreelz/data/phase1.prof
+
 Outputs
 - /opt/fbreelz/data/saved_items.json (Phase-1 JSON compatible with Phase-2)
+- /opt/fbreelz/data/saved_delta.json (added/removed since the previous run; Phase-2 --delta)
+- /opt/fbreelz/data/saved_index.json (compact index of every item seen so far)
 - /opt/fbreelz/data/debug_playwright_saved.html (HTML snapshot for debugging)
+- /opt/fbreelz/data/saved_endpoint.json (last working Saved endpoint per profile)
+- with --enqueue: resolve jobs in /opt/fbreelz/data/jobs.sqlite (see fbreelz_queue.py)
+
+Saved endpoints
+- The candidate Saved URLs load at the same time, one page each; the first one that
+  is not the interstitial and lists items wins, the others are closed.
+- The winner is remembered per profile in saved_endpoint.json (--endpoint-ttl hours)
+  and tried alone first on the next run.
+
+Early termination
+- Scanning a Saved list stops once --known-run consecutive items are already in
+  saved_index.json; everything below that point is carried over from the index.
 """
 
 from __future__ import annotations
 
 import argparse
+import asyncio
 import json
 import os
 import re
+import time
+from dataclasses import dataclass, field
 from datetime import datetime, timezone
 from pathlib import Path
-from typing import Any, Dict, List, Optional
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+from playwright.async_api import async_playwright, TimeoutError as PWTimeoutError
 
-from playwright.sync_api import sync_playwright, TimeoutError as PWTimeoutError
+import fbreelz_cookies as fbcookies
+import fbreelz_trace as trace
 
 
 DATA_DIR = Path(os.environ.get("FBREELZ_DATA_DIR", "/opt/fbreelz/data"))
 OUT_JSON = DATA_DIR / "saved_items.json"
+DELTA_JSON = DATA_DIR / "saved_delta.json"
+INDEX_JSON = DATA_DIR / "saved_index.json"
 DEBUG_HTML = DATA_DIR / "debug_playwright_saved.html"
+ENDPOINT_JSON = DATA_DIR / "saved_endpoint.json"
+ENDPOINT_TTL_HOURS = 24.0
+INTERSTITIAL = "Facebook is not available on this browser"
 
 SAVED_URLS = [
     "https://www.facebook.com/saved/",
     "https://m.facebook.com/saved/",
 ]
 
+DEFAULT_COOKIES = fbcookies.DEFAULT_COOKIES
+DEFAULT_UA = "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
 
-def _load_cookies_netscape(path: Path) -> List[Dict[str, Any]]:
-    """Load Netscape cookies.txt (like exported from browser extensions)."""
-    cookies: List[Dict[str, Any]] = []
-    if not path.exists():
-        return cookies
 
-    for line in path.read_text(encoding="utf-8", errors="ignore").splitlines():
-        if not line or line.startswith("#"):
-            continue
-        parts = line.split("\t")
-        if len(parts) != 7:
-            continue
-        domain, flag, cookie_path, secure, expires, name, value = parts
-        # Playwright expects domain without leading dot is fine; keep as-is.
-        cookies.append(
-            {
-                "name": name,
-                "value": value,
-                "domain": domain,
-                "path": cookie_path or "/",
-                "expires": int(expires) if expires.isdigit() else -1,
-                "httpOnly": False,
-                "secure": secure.upper() == "TRUE",
-                "sameSite": "Lax",
-            }
-        )
-    return cookies
+@dataclass
+class Profile:
+    name: str
+    cookies_path: Path
+
+
+@dataclass
+class ScrapeResult:
+    profile: str
+    collection: str
+    url: Optional[str] = None
+    html: Optional[str] = None
+    links: List[str] = field(default_factory=list)
+    stop_reason: str = "end"  # end | max | known
+
+    @property
+    def key(self) -> str:
+        return f"{self.profile}|{self.collection}"
+
+
+def _parse_profile(spec: str) -> Profile:
+    """Parse a --profile value: "name=/path/cookies.txt" or just "/path/cookies.txt"."""
+    name, sep, path = spec.partition("=")
+    if not sep:
+        path = name
+        name = Path(path).stem
+    return Profile(name=name.strip() or "default", cookies_path=Path(path.strip()))
 
 
 def _extract_saved_links(html: str) -> List[str]:
     # Grab common reel/video patterns
-    hrefs = set(re.findall(r'href=\"([^\"]+)\"', html))
+    hrefs = re.findall(r'href=\"([^\"]+)\"', html)
     out: List[str] = []
     for h in hrefs:
         # Normalize
@@ -91,16 +128,435 @@ def _extract_saved_links(html: str) -> List[str]:
             h = re.sub(r"([?&])(fbclid|__cft__|__tn__|ref|refid|__xts__|_rdr)=[^&]+", r"\1", h)
             h = re.sub(r"[?&]+$", "", h)
             out.append(h)
-    # Stable order
-    out = sorted(set(out))
+    # Stable order: first occurrence in the page, i.e. Saved order (newest first)
+    out = list(dict.fromkeys(out))
     return out
 
 
-def main(max_items: int, headed: bool) -> int:
+async def _collect_links(
+    page,
+    max_items: int,
+    stop_at: Optional[Callable[[str], bool]] = None,
+    max_scrolls: int = 10,
+    track: Optional[str] = None,
+) -> Tuple[List[str], str]:
+    """Scroll the loaded Saved page, collecting links in Saved order.
+
+    Stops at max_items ("max"), as soon as stop_at(link) is true ("known"; the
+    triggering link is included), or when scrolling yields nothing new ("end").
+    Returns (links, stop_reason).
+    """
+    links: List[str] = []
+    seen = set()
+    for n in range(max_scrolls + 1):
+        fresh = 0
+        with trace.span("page content", track=track, scroll=n):
+            html = await page.content()
+        with trace.span("extract links", track=track, scroll=n):
+            found = _extract_saved_links(html)
+        for u in found:
+            if u in seen:
+                continue
+            seen.add(u)
+            fresh += 1
+            links.append(u)
+            if stop_at and stop_at(u):
+                return links, "known"
+            if len(links) >= max_items:
+                return links, "max"
+        if fresh == 0:
+            break
+        if n == max_scrolls:
+            return links, "max"
+        with trace.span("scroll", track=track, scroll=n):
+            await page.mouse.wheel(0, 4000)
+            await page.wait_for_timeout(1000)
+    return links, "end"
+
+
+def _known_run_stopper(known: Set[str], run: int) -> Optional[Callable[[str], bool]]:
+    """Predicate that fires after `run` consecutive already-known links (0 disables)."""
+    if run <= 0 or not known:
+        return None
+    streak = 0
+
+    def stop_at(u: str) -> bool:
+        nonlocal streak
+        streak = streak + 1 if u in known else 0
+        return streak >= run
+
+    return stop_at
+
+
+def _load_index(path: Path) -> Dict[str, Any]:
+    """Compact seen-index: Saved order plus first-seen time and sources per URL."""
+    try:
+        data = json.loads(path.read_text(encoding="utf-8"))
+        if isinstance(data.get("order"), list) and isinstance(data.get("items"), dict):
+            return data
+    except (OSError, ValueError):
+        pass
+    return {"order": [], "items": {}}
+
+
+def _write_json_atomic(path: Path, data: Dict[str, Any]) -> None:
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    tmp.write_text(json.dumps(data, indent=2, ensure_ascii=False), encoding="utf-8")
+    os.replace(tmp, path)
+
+
+def _save_index(path: Path, index: Dict[str, Any]) -> None:
+    index["updated_at_utc"] = datetime.now(timezone.utc).isoformat()
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    tmp.write_text(json.dumps(index, separators=(",", ":"), ensure_ascii=False), encoding="utf-8")
+    os.replace(tmp, path)
+
+
+def _diff_snapshot(index: Dict[str, Any], results: List[ScrapeResult]) -> Tuple[List[str], Dict[str, List[str]], List[str], List[str]]:
+    """Work out the full snapshot and the added/removed delta against the index.
+
+    For each scraped list (loaded and yielding links), previously-indexed items of that list that sit above
+    the deepest item reached this time but were not seen are removed; items
+    below it were not re-scanned (early stop / --max) and are carried over.
+    Returns (snapshot_order, sources_by_url, added, removed).
+    """
+    prev_order: List[str] = index.get("order", [])
+    prev_items: Dict[str, Any] = index.get("items", {})
+
+    sources: Dict[str, List[str]] = {}
+    scanned: List[str] = []
+    for res in results:
+        for u in res.links:
+            sources.setdefault(u, [])
+            if res.key not in sources[u]:
+                sources[u].append(res.key)
+            scanned.append(u)
+    scanned = list(dict.fromkeys(scanned))
+
+    # Only a list that yielded links counts as scraped. A page that loaded but listed
+    # nothing (login wall, checkpoint, layout change) says nothing about its items.
+    scraped = [res for res in results if res.html and res.links]
+    scraped_keys = {res.key for res in scraped}
+    removed_candidates: Set[str] = set()
+    carried: List[str] = []
+    for u in prev_order:
+        if u in sources:
+            continue
+        prev_sources = (prev_items.get(u) or {}).get("sources") or []
+        # Lists not scraped this run keep their items untouched.
+        if not prev_sources or any(k not in scraped_keys for k in prev_sources):
+            carried.append(u)
+
+    for res in scraped:
+        prev_seq = [u for u in prev_order if res.key in ((prev_items.get(u) or {}).get("sources") or [])]
+        if res.stop_reason == "end":
+            depth = len(prev_seq)
+        else:
+            positions = {u: i for i, u in enumerate(prev_seq)}
+            reached = [positions[u] for u in res.links if u in positions]
+            depth = (max(reached) + 1) if reached else 0
+        for u in prev_seq[:depth]:
+            if u not in sources:
+                removed_candidates.add(u)
+        for u in prev_seq[depth:]:
+            if u not in sources and u not in carried:
+                carried.append(u)
+
+    carried_set = set(carried)
+    removed = [u for u in prev_order if u in removed_candidates and u not in carried_set]
+    for u in carried:
+        sources[u] = list((prev_items.get(u) or {}).get("sources") or [])
+
+    added = [u for u in scanned if u not in prev_items]
+    carried_order = [u for u in prev_order if u in carried_set]
+    return scanned + carried_order, sources, added, removed
+
+
+async def _load_saved_page(page, urls: List[str], profile: str, collection: str, track: Optional[str] = None) -> ScrapeResult:
+    """Try each URL in turn until one loads without the interstitial."""
+    res = ScrapeResult(profile=profile, collection=collection)
+    track = track or f"{profile}: {collection}"
+
+    for url in urls:
+        try:
+            res.url = url
+            with trace.span("navigate", track=track, url=url):
+                await page.goto(url, wait_until="domcontentloaded", timeout=60000)
+                await page.wait_for_timeout(1500)
+            with trace.span("page content", track=track):
+                res.html = await page.content()
+            # If we got the "not available" interstitial, try next URL
+            if res.html and INTERSTITIAL in res.html:
+                print(f"[WARN] [{profile}] Interstitial on {url} - trying alternate endpoint...")
+                continue
+            break
+        except PWTimeoutError:
+            print(f"[WARN] [{profile}] Timeout loading {url} - trying next...")
+            continue
+
+    return res
+
+
+def _remembered_endpoint(profile: str, ttl_hours: float) -> Optional[str]:
+    if ttl_hours <= 0:
+        return None
+    try:
+        entry = json.loads(ENDPOINT_JSON.read_text(encoding="utf-8")).get(profile) or {}
+    except (OSError, ValueError):
+        return None
+    if time.time() - float(entry.get("at") or 0) > ttl_hours * 3600:
+        return None
+    return entry.get("url")
+
+
+def _remember_endpoint(profile: str, url: str) -> None:
+    try:
+        data = json.loads(ENDPOINT_JSON.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        data = {}
+    data[profile] = {"url": url, "at": time.time(), "saved_at_utc": datetime.now(timezone.utc).isoformat()}
+    tmp = ENDPOINT_JSON.with_suffix(ENDPOINT_JSON.suffix + ".tmp")
+    tmp.write_text(json.dumps(data, indent=2), encoding="utf-8")
+    os.replace(tmp, ENDPOINT_JSON)
+
+
+def _usable(res: ScrapeResult) -> bool:
+    """A real Saved page: loaded, not the interstitial, and listing at least one item."""
+    return bool(res.html) and INTERSTITIAL not in res.html and bool(_extract_saved_links(res.html))
+
+
+async def _race_saved_pages(context, urls: List[str], profile: str, ttl_hours: float) -> Tuple[Any, ScrapeResult]:
+    """Load the candidate Saved endpoints at once, one page each; the first usable page wins.
+
+    The winner is remembered for ttl_hours and tried alone first next time. Returns
+    the winning page (still open, for scrolling) and its result.
+    """
+    remembered = _remembered_endpoint(profile, ttl_hours)
+    if remembered in urls:
+        page = await context.new_page()
+        res = await _load_saved_page(page, [remembered], profile, "saved")
+        if _usable(res):
+            # Not re-stamped: once the TTL runs out the endpoints are raced again.
+            print(f"[OK] [{profile}] Remembered endpoint still works: {remembered}")
+            return page, res
+        await page.close()
+        print(f"[WARN] [{profile}] Remembered endpoint {remembered} failed - racing the others")
+        urls = [u for u in urls if u != remembered] or urls
+
+    pages = [await context.new_page() for _ in urls]
+    tasks = {
+        asyncio.ensure_future(_load_saved_page(pg, [u], profile, "saved", track=f"{profile}: race {u}")): (pg, u)
+        for pg, u in zip(pages, urls)
+    }
+    winner = fallback = None
+    pending = set(tasks)
+    with trace.span("race endpoints", track=f"{profile}: saved", candidates=len(urls)):
+        while pending and winner is None:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for t in done:
+                res = t.result() if not t.exception() else None
+                if res is None:
+                    continue
+                if winner is None and _usable(res):
+                    winner = t
+                elif fallback is None and res.html and INTERSTITIAL not in res.html:
+                    fallback = t  # loaded but empty: fine if nothing better turns up
+        for t in pending:
+            t.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+
+    chosen = winner or fallback or next(iter(tasks))
+    page, url = tasks[chosen]
+    for pg, _ in tasks.values():
+        if pg is not page:
+            await pg.close()
+    res = chosen.result() if chosen.done() and not chosen.cancelled() and not chosen.exception() else ScrapeResult(profile, "saved")
+    if winner is not None:
+        print(f"[OK] [{profile}] Fastest working endpoint: {url}")
+        if ttl_hours > 0:
+            _remember_endpoint(profile, url)
+    return page, res
+
+
+async def _scrape_profile(
+    browser,
+    profile: Profile,
+    targets: List[List[str]],
+    max_items: int,
+    known: Set[str],
+    known_run: int,
+    endpoint_ttl: float = ENDPOINT_TTL_HOURS,
+) -> List[ScrapeResult]:
+    """Scrape every target for one profile in its own browser context (pages run concurrently)."""
+    with trace.span("new context", track="browser", profile=profile.name):
+        context = await browser.new_context(user_agent=os.environ.get("FBREELZ_UA", DEFAULT_UA))
+    try:
+        jar = fbcookies.load(profile.cookies_path)
+        if jar.cookies:
+            await context.add_cookies(jar.playwright())
+            print(f"[OK] [{profile.name}] Loaded {len(jar)} cookies from {profile.cookies_path}")
+            missing = jar.missing_auth()
+            if missing:
+                print(f"[WARN] [{profile.name}] {', '.join(missing)} missing or expired; expect the login page")
+        else:
+            print(f"[WARN] [{profile.name}] No cookies loaded from {profile.cookies_path}")
+
+        async def one(urls: List[str]) -> ScrapeResult:
+            collection = urls[0] if len(urls) == 1 else "saved"
+            if len(urls) > 1:
+                page, res = await _race_saved_pages(context, urls, profile.name, endpoint_ttl)
+            else:
+                page = await context.new_page()
+            try:
+                if len(urls) == 1:
+                    res = await _load_saved_page(page, urls, profile.name, collection)
+                if res.html:
+                    stop_at = _known_run_stopper(known, known_run)
+                    res.links, res.stop_reason = await _collect_links(
+                        page, max_items, stop_at=stop_at, track=f"{profile.name}: {collection}"
+                    )
+            finally:
+                await page.close()
+            return res
+
+        return list(await asyncio.gather(*(one(urls) for urls in targets)))
+    finally:
+        await context.close()
+
+
+def _make_edges(order: List[str], sources: Dict[str, List[str]], first_seen: Dict[str, str]) -> List[Dict[str, Any]]:
+    """Build deduplicated graphql_edges, keeping which profiles/collections each item came from."""
+    # Create a Phase-1-ish structure compatible with Phase-2 (graphql_edges style)
+    edges = []
+    for u in order:
+        profiles: List[str] = []
+        collections: List[str] = []
+        for key in sources.get(u, []):
+            prof, _, coll = key.partition("|")
+            if prof not in profiles:
+                profiles.append(prof)
+            if coll not in collections:
+                collections.append(coll)
+        edges.append(
+            {
+                "node": {"savable": {"__typename": "Video", "savable_permalink": u}},
+                "profiles": profiles,
+                "collections": collections,
+                "first_seen_utc": first_seen.get(u),
+            }
+        )
+    return edges
+
+
+def _debug_html_path(res: ScrapeResult, index: int, total: int) -> Path:
+    if total == 1:
+        return DEBUG_HTML
+    safe = re.sub(r"[^A-Za-z0-9_.-]+", "_", res.profile)
+    return DEBUG_HTML.with_name(f"{DEBUG_HTML.stem}_{safe}_{index}{DEBUG_HTML.suffix}")
+
+
+def _enqueue(delta: Dict[str, Any], order: List[str], first_seen: Dict[str, str]) -> None:
+    """Hand the added/removed saves to the job queue (fbreelz_queue.py workers do the rest)."""
+    import fbreelz_phase2_resolve as phase2
+    import fbreelz_queue
+
+    q = fbreelz_queue.JobQueue(DATA_DIR / fbreelz_queue.DB_NAME)
+    rows = phase2._extract_source_urls("graphql_edges", delta["added"])
+    n = fbreelz_queue.enqueue_snapshot(q, rows, first_seen, order=order, removed=delta["removed"])
+    print(f"[OK] Queued {n} resolve job(s) in {q.path}")
+
+
+async def _run(
+    profiles: List[Profile],
+    targets: List[List[str]],
+    max_items: int,
+    headless: bool,
+    known_run: int,
+    enqueue: bool = False,
+    endpoint_ttl: float = ENDPOINT_TTL_HOURS,
+) -> int:
+    index = _load_index(INDEX_JSON)
+    known = set(index["items"])
+
+    async with async_playwright() as p:
+        with trace.span("launch browser", track="browser"):
+            browser = await p.chromium.launch(headless=headless)
+        try:
+            per_profile = await asyncio.gather(
+                *(_scrape_profile(browser, prof, targets, max_items, known, known_run, endpoint_ttl) for prof in profiles)
+            )
+        finally:
+            await browser.close()
+
+    results = [r for rs in per_profile for r in rs]
+
+    loaded = [r for r in results if r.html]
+    if not loaded:
+        print("[ERR] Could not load Saved page with Playwright.")
+        return 2
+
+    for i, res in enumerate(loaded, 1):
+        debug_path = _debug_html_path(res, i, len(loaded))
+        debug_path.write_text(res.html or "", encoding="utf-8")
+        print(
+            f"[OK] [{res.profile}] Wrote HTML debug to {debug_path} "
+            f"({len(res.links)} links from {res.url}, stopped: {res.stop_reason})"
+        )
+
+    if not any(r.links for r in results):
+        print("[ERR] No reel/video links found in HTML. You may need fresher cookies.")
+        return 3
+
+    now = datetime.now(timezone.utc).isoformat()
+    order, sources, added, removed = _diff_snapshot(index, results)
+
+    items: Dict[str, Any] = {}
+    for u in order:
+        prev = index["items"].get(u) or {}
+        items[u] = {"first_seen_utc": prev.get("first_seen_utc") or now, "sources": sources.get(u, [])}
+    first_seen = {u: v["first_seen_utc"] for u, v in items.items()}
+
+    edges = _make_edges(order, sources, first_seen)
+    payload = {
+        "generated_at_utc": now,
+        "detected_format": "graphql_edges",
+        "profiles": [prof.name for prof in profiles],
+        "data": {"viewer": {"saver_info": {"all_saves": {"edges": edges}}}},
+    }
+    delta = {
+        "generated_at_utc": now,
+        "snapshot": str(OUT_JSON),
+        "added": _make_edges(added, sources, first_seen),
+        "removed": removed,
+    }
+
+    # Atomic: the pipeline runner may stop Phase 1 at its deadline at any moment.
+    with trace.span("write outputs"):
+        _write_json_atomic(OUT_JSON, payload)
+        _write_json_atomic(DELTA_JSON, delta)
+        _save_index(INDEX_JSON, {"order": order, "items": items})
+    print(f"[OK] Wrote Phase-1 JSON to {OUT_JSON}")
+    print(f"[OK] Wrote delta to {DELTA_JSON} (added={len(added)}, removed={len(removed)})")
+    print(f"[OK] Items: {len(edges)} (max={max_items} per profile/collection, profiles={len(profiles)})")
+    if enqueue:
+        _enqueue(delta, order, first_seen)
+    return 0
+
+
+def main(
+    max_items: int,
+    headed: bool,
+    profiles: Optional[List[Profile]] = None,
+    collections: Optional[List[str]] = None,
+    known_run: int = 5,
+    enqueue: bool = False,
+    endpoint_ttl: float = ENDPOINT_TTL_HOURS,
+) -> int:
     DATA_DIR.mkdir(parents=True, exist_ok=True)
 
-    cookies_path = Path(os.environ.get("FBREELZ_COOKIES", "/opt/fbreelz/secrets/cookies.txt"))
-    cookies = _load_cookies_netscape(cookies_path)
+    profiles = profiles or [Profile(name="default", cookies_path=DEFAULT_COOKIES)]
+    # No explicit collections: the Saved page, with the mobile endpoint as fallback.
+    targets = [[u] for u in collections] if collections else [list(SAVED_URLS)]
 
     # Headless by default (server-friendly)
     headless = not headed
@@ -110,78 +566,45 @@ def main(max_items: int, headed: bool) -> int:
         print("[WARN] --headed requested but DISPLAY is not set. On headless servers, use headless (default) or run via Xvfb.")
         print("       Example: xvfb-run -a python fbreelz_phase1_playwright_v2.py --headed --max 30")
 
-    with sync_playwright() as p:
-        browser = p.chromium.launch(headless=headless)
-        context = browser.new_context(
-            user_agent=os.environ.get(
-                "FBREELZ_UA",
-                "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
-            )
-        )
-
-        if cookies:
-            # Playwright requires the domain without leading dot for some cookies;
-            # but typically accepts both. We'll add as-is.
-            context.add_cookies(cookies)
-            print(f"[OK] Loaded {len(cookies)} cookies from {cookies_path}")
-
-        page = context.new_page()
-
-        last_html: Optional[str] = None
-        last_url: Optional[str] = None
-
-        for url in SAVED_URLS:
-            try:
-                last_url = url
-                page.goto(url, wait_until="domcontentloaded", timeout=60000)
-                page.wait_for_timeout(1500)
-                last_html = page.content()
-                # If we got the "not available" interstitial, try next URL
-                if last_html and "Facebook is not available on this browser" in last_html:
-                    print(f"[WARN] Interstitial on {url} - trying alternate endpoint...")
-                    continue
-                break
-            except PWTimeoutError:
-                print(f"[WARN] Timeout loading {url} - trying next...")
-                continue
-
-        if not last_html:
-            print("[ERR] Could not load Saved page with Playwright.")
-            browser.close()
-            return 2
-
-        DEBUG_HTML.write_text(last_html, encoding="utf-8")
-        print(f"[OK] Wrote HTML debug to {DEBUG_HTML}")
-
-        links = _extract_saved_links(last_html)
-        if not links:
-            print("[ERR] No reel/video links found in HTML. You may need fresher cookies.")
-            browser.close()
-            return 3
-
-        links = links[:max_items]
-        # Create a Phase-1-ish structure compatible with Phase-2 (graphql_edges style)
-        edges = []
-        for u in links:
-            edges.append({"node": {"savable": {"__typename": "Video", "savable_permalink": u}}})
-
-        payload = {
-            "generated_at_utc": datetime.now(timezone.utc).isoformat(),
-            "detected_format": "graphql_edges",
-            "data": {"viewer": {"saver_info": {"all_saves": {"edges": edges}}}},
-        }
-
-        OUT_JSON.write_text(json.dumps(payload, indent=2, ensure_ascii=False), encoding="utf-8")
-        print(f"[OK] Wrote Phase-1 JSON to {OUT_JSON}")
-        print(f"[OK] Items: {len(edges)} (max={max_items})")
-
-        browser.close()
-        return 0
+    return asyncio.run(_run(profiles, targets, max_items, headless, known_run, enqueue, endpoint_ttl))
 
 
 if __name__ == "__main__":
     ap = argparse.ArgumentParser(description="FBReelz Phase 1 via Playwright (Saved items)")
-    ap.add_argument("--max", type=int, default=30, help="Max saved items to capture (default: 30)")
+    ap.add_argument("--max", type=int, default=30, help="Max saved items to capture per profile/collection (default: 30)")
     ap.add_argument("--headed", action="store_true", help="Run with a visible browser (requires DISPLAY or Xvfb)")
+    ap.add_argument("--profile", action="append", default=[], metavar="NAME=COOKIES",
+                    help="Account profile as name=/path/cookies.txt (repeatable; default: FBREELZ_COOKIES)")
+    ap.add_argument("--collection", action="append", default=[], metavar="URL",
+                    help="Saved collection URL to scrape for every profile (repeatable; default: the Saved page)")
+    ap.add_argument("--known-run", type=int, default=5,
+                    help="Stop scanning a list after this many consecutive already-indexed items (0 = full scan; default: 5)")
+    ap.add_argument("--enqueue", action="store_true",
+                    help="Also queue resolve jobs for added saves in jobs.sqlite (drained by fbreelz_queue.py workers)")
+    ap.add_argument("--endpoint-ttl", type=float, default=ENDPOINT_TTL_HOURS, metavar="HOURS",
+                    help=f"Try the last working Saved endpoint alone for this long before racing all of them again "
+                         f"(0 = always race; default: {ENDPOINT_TTL_HOURS:g})")
+    ap.add_argument("--trace", default=None, metavar="PATH",
+                    help="Record navigation/extraction spans as a Chrome/Perfetto trace JSON (see fbreelz_trace.py)")
+    ap.add_argument("--cprofile", default=None, metavar="PATH", help="Dump cProfile stats of the Python side here")
     args = ap.parse_args()
-    raise SystemExit(main(args.max, args.headed))
+    if args.trace:
+        trace.TRACER.enable()
+    trace.PROFILER.enabled = bool(args.cprofile)
+    try:
+        with trace.profiled():
+            rc = main(
+                args.max,
+                args.headed,
+                [_parse_profile(x) for x in args.profile],
+                args.collection,
+                args.known_run,
+                args.enqueue,
+                args.endpoint_ttl,
+            )
+    finally:
+        if args.trace:
+            trace.TRACER.write(Path(args.trace))
+        if args.cprofile:
+            trace.PROFILER.save(Path(args.cprofile))
+    raise SystemExit(rc)
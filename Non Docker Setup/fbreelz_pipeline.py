@@ -0,0 +1,133 @@
+## version 1
+"""FBReelz pipeline runner: Phase 1 -> Phase 2 -> cache playlist under one time/byte budget.
+
+Purpose
+- The nightly oneshot chained the three steps with && and had no time budget,
+  so a slow night could run into the morning and compete with playback.
+- One --deadline covers the whole run:
+  - Phase 1 is stopped if it is still scraping when only --reserve seconds are left
+    (Phase 2 then works from the previous saved_items.json),
+  - Phase 2 gets the same absolute deadline and --byte-budget: it stops starting
+    downloads that will not fit, lets the current one finish, writes consistent
+    playlists and leaves phase2_resume.json so the next run continues from there,
+  - the cache playlist is always rebuilt at the end.
+- Before anything starts, the session preflight (fbreelz_cookies.check) looks at
+  --cookies; a dead session aborts the run with exit 2 instead of failing later in
+  Chromium or yt-dlp. An unreachable check URL only warns.
+
+Usage
+  python fbreelz_pipeline.py --max 30 --download --deadline 06:30 --byte-budget 20G \\
+      --base-url http://YOUR_SERVER_IP/cache/ --out /opt/fbreelz/data/fbreelz_cache_http.m3u
+
+Arguments after "--" are passed to Phase 2 unchanged, e.g. -- --order shortest.
+"""
+
+from __future__ import annotations
+
+import argparse
+import subprocess
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import List, Optional
+
+import fbreelz_cookies as fbcookies
+from fbreelz_phase2_resolve import _parse_bytes, _parse_deadline
+
+
+HERE = Path(__file__).resolve().parent
+PHASE1 = HERE / "fbreelz_phase1_playwright.py"
+PHASE2 = HERE / "fbreelz_phase2_resolve.py"
+# Next to this script in Docker (/app) and "Non Docker Setup"; at the repo root beside scripts/.
+CACHE_PLAYLIST = next(
+    (d / "make_cache_playlist.py" for d in (HERE, HERE.parent) if (d / "make_cache_playlist.py").exists()),
+    HERE / "make_cache_playlist.py",
+)
+DEFAULT_RESERVE = 600
+
+
+def _run(name: str, cmd: List[str], deadline: Optional[float] = None) -> Optional[int]:
+    """Run one step; returns its exit code, or None if it was stopped at `deadline`."""
+    timeout = None if deadline is None else max(1.0, deadline - time.time())
+    print(f"[INFO] {name}: {' '.join(cmd[1:])}", flush=True)
+    t0 = time.monotonic()
+    try:
+        rc = subprocess.run(cmd, timeout=timeout).returncode
+    except subprocess.TimeoutExpired:
+        # subprocess.run kills the child; Phase 1 replaces its outputs atomically, so they stay whole.
+        print(f"[WARN] {name} stopped after {time.monotonic() - t0:.0f}s to keep the time budget")
+        return None
+    level = "OK" if rc == 0 else "ERR"
+    print(f"[{level}] {name} finished in {time.monotonic() - t0:.0f}s (exit {rc})")
+    return rc
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="Run FBReelz Phase 1, Phase 2 and the cache playlist under one budget")
+    ap.add_argument("--deadline", type=_parse_deadline, default=None,
+                    help="Whole-run deadline: 90m, 2h, 06:30 or an ISO timestamp")
+    ap.add_argument("--byte-budget", default=None, help="Phase 2 download budget for this run, e.g. 20G")
+    ap.add_argument("--reserve", type=int, default=DEFAULT_RESERVE,
+                    help=f"Seconds kept for Phase 2 when Phase 1 runs long (default: {DEFAULT_RESERVE})")
+    ap.add_argument("--max", type=int, default=30, help="Phase 1: max saved items per profile/collection (default: 30)")
+    ap.add_argument("--cookies", type=Path, default=fbcookies.DEFAULT_COOKIES,
+                    help=f"cookies.txt for the session preflight (default: {fbcookies.DEFAULT_COOKIES})")
+    ap.add_argument("--no-preflight", action="store_true", help="Skip the session preflight")
+    ap.add_argument("--skip-phase1", action="store_true", help="Reuse the existing saved_items.json")
+    ap.add_argument("--download", action="store_true", help="Phase 2: download media to the cache")
+    ap.add_argument("--http-base", default=None, help="Phase 2: base URL for the HTTP cache playlist")
+    ap.add_argument("--base-url", default=None, help="make_cache_playlist.py --base-url (skipped when not set)")
+    ap.add_argument("--out", default=None, help="make_cache_playlist.py --output")
+    ap.add_argument("phase2_args", nargs=argparse.REMAINDER, help="Extra Phase 2 arguments after --")
+    args = ap.parse_args()
+
+    if args.byte_budget is not None:
+        _parse_bytes(args.byte_budget)  # fail here rather than after Phase 1
+    if args.deadline is not None:
+        print(f"[OK] Deadline: {datetime.fromtimestamp(args.deadline).astimezone().isoformat(timespec='minutes')}")
+
+    if not args.no_preflight:
+        ok, why = fbcookies.check(args.cookies)
+        if ok is False:
+            print(f"[ERR] Session is dead: {why}. Export fresh cookies; nothing was run.")
+            return 2
+        print(f"[{'OK' if ok else 'WARN'}] Session preflight: {why}")
+
+    if not args.skip_phase1:
+        phase1_deadline = None if args.deadline is None else args.deadline - args.reserve
+        if phase1_deadline is not None and phase1_deadline <= time.time():
+            print("[WARN] Not enough time left for Phase 1; using the existing saved_items.json")
+        else:
+            rc = _run("Phase 1", [sys.executable, str(PHASE1), "--max", str(args.max)], phase1_deadline)
+            if rc not in (0, None):
+                return rc
+
+    cmd = [sys.executable, str(PHASE2)]
+    if args.download:
+        cmd.append("--download")
+    if args.http_base:
+        cmd += ["--http-base", args.http_base]
+    if args.deadline is not None:
+        cmd += ["--deadline", datetime.fromtimestamp(args.deadline).astimezone().isoformat()]
+    if args.byte_budget is not None:
+        cmd += ["--byte-budget", args.byte_budget]
+    extra = args.phase2_args[1:] if args.phase2_args[:1] == ["--"] else args.phase2_args
+    # No timeout: Phase 2 enforces the deadline itself and always writes its outputs.
+    rc = _run("Phase 2", cmd + extra)
+    if rc:
+        return rc
+
+    if args.base_url:
+        if not CACHE_PLAYLIST.exists():
+            print(f"[WARN] {CACHE_PLAYLIST} not found; skipping cache playlist")
+            return 0
+        cmd = [sys.executable, str(CACHE_PLAYLIST), "--base-url", args.base_url]
+        if args.out:
+            cmd += ["--output", args.out]
+        return _run("Cache playlist", cmd) or 0
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,139 @@
+## version 1
+"""FBReelz playlist sets: small chunked M3U files next to the full playlist.
+
+Purpose
+- One M3U with thousands of entries takes VLC and TV players a long time to open.
+- write_set() writes these files next to <name>.m3u:
+  - <name>.part-0001.m3u ...: --playlist-chunk entries each, numbered from the
+    oldest save, so new saves only change the newest part. Older parts stay
+    byte-identical and are not rewritten,
+  - <name>.index.m3u: master playlist of the files below (open this one),
+  - <name>.new-YYYY-MM-DD.m3u: saves first seen on that UTC day (last DEFAULT_DAYS days),
+  - <name>.shuffle.m3u: one chunk of a shuffle seeded with today's UTC date (or
+    make_cache_playlist.py --shuffle-seed). Every client gets the same mix, and it
+    changes once a day.
+- A file is only replaced when its content changed. Parts, days and the shuffle are
+  all written before the index. Files that are no longer referenced (including the
+  shuffle once the list is empty) are removed.
+- Entry URIs are written as given. The set sits in the same directory as the full
+  playlist, so relative entries (cache/...) still resolve.
+
+Usage
+  python /app/fbreelz_phase2_resolve.py --download --http-base http://YOUR_SERVER_IP --playlist-chunk 500
+  python make_cache_playlist.py --base-url http://YOUR_SERVER_IP/ --playlist-chunk 500
+  VLC: http://YOUR_SERVER_IP/fbreelz_cache_http.index.m3u
+"""
+
+from __future__ import annotations
+
+import os
+import random
+import re
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+
+DEFAULT_DAYS = 7
+
+
+@dataclass
+class Entry:
+    title: str  # already one line
+    duration: int  # seconds, -1 = unknown
+    uri: str
+    first_seen_utc: Optional[str] = None
+
+
+def render(title: str, entries: List[Entry]) -> str:
+    lines: List[str] = ["#EXTM3U", f"#PLAYLIST:{title}"]
+    for e in entries:
+        lines.append(f"#EXTINF:{e.duration},{e.title}")
+        lines.append(e.uri)
+    return "\n".join(lines) + "\n"
+
+
+def _write_if_changed(path: Path, text: str) -> bool:
+    """Atomically replace `path` unless it already holds `text`; True if written."""
+    data = text.encode("utf-8")
+    try:
+        if path.stat().st_size == len(data) and path.read_bytes() == data:
+            return False
+    except OSError:
+        pass
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_bytes(data)
+    os.replace(tmp, path)
+    return True
+
+
+def _day(e: Entry) -> Optional[str]:
+    return (e.first_seen_utc or "")[:10] or None
+
+
+def _span(entries: List[Entry]) -> str:
+    days = sorted(d for d in map(_day, entries) if d)
+    return f"{days[0]} .. {days[-1]}" if days else ""
+
+
+def write_set(
+    path: Path,
+    title: str,
+    entries: List[Entry],
+    chunk: int,
+    days: int = DEFAULT_DAYS,
+    seed: Optional[str] = None,
+    now: Optional[datetime] = None,
+) -> Tuple[int, int]:
+    """Write the chunked set for the playlist at `path`; entries are newest first.
+
+    Returns (files written, files in the set).
+    """
+    stem = path.name[: -len(path.suffix)] if path.suffix else path.name
+    parent = path.parent
+    now = now or datetime.now(timezone.utc)
+    files: Dict[str, str] = {}
+    index: List[Entry] = []
+
+    # Day playlists first in the index: that is what people open it for.
+    cutoff = (now - timedelta(days=max(0, days - 1))).date().isoformat()
+    by_day: Dict[str, List[Entry]] = {}
+    for e in entries:
+        d = _day(e)
+        if d and d >= cutoff:
+            by_day.setdefault(d, []).append(e)
+    for d in sorted(by_day, reverse=True):
+        name = f"{stem}.new-{d}.m3u"
+        files[name] = render(f"{title} - new {d}", by_day[d])
+        index.append(Entry(f"New saves {d} ({len(by_day[d])})", -1, name))
+
+    if entries:
+        seed = seed if seed is not None else now.date().isoformat()
+        mix = list(entries)
+        random.Random(seed).shuffle(mix)
+        name = f"{stem}.shuffle.m3u"
+        files[name] = render(f"{title} - shuffle {seed}", mix[:chunk])
+        index.append(Entry(f"Shuffle ({min(chunk, len(mix))}, seed {seed})", -1, name))
+
+    # Parts are cut from the oldest end so a new save only touches the last one.
+    oldest_first = entries[::-1]
+    parts: List[Entry] = []
+    for n, start in enumerate(range(0, len(oldest_first), max(1, chunk)), 1):
+        part = oldest_first[start : start + chunk][::-1]
+        name = f"{stem}.part-{n:04d}.m3u"
+        label = f"{title} - part {n}"
+        files[name] = render(label, part)
+        span = _span(part)
+        parts.append(Entry(f"Part {n}: {len(part)} reels" + (f", {span}" if span else ""), -1, name))
+    index.extend(reversed(parts))
+
+    written = sum(_write_if_changed(parent / name, text) for name, text in files.items())
+    index_name = f"{stem}.index.m3u"
+    written += _write_if_changed(parent / index_name, render(f"{title} - index", index))
+
+    ours = re.compile(rf"^{re.escape(stem)}\.(?:part-\d{{4}}|new-\d{{4}}-\d{{2}}-\d{{2}}|shuffle)\.m3u$")
+    for p in parent.iterdir():
+        if ours.match(p.name) and p.name not in files:
+            p.unlink(missing_ok=True)
+    return written, len(files) + 1
@@ -0,0 +1,288 @@
+## version 1
+"""FBReelz prefetch scheduler: keep the next few playlist items cached, stream the rest.
+
+Purpose
+- Downloading everything costs disk; downloading nothing makes every item a
+  cold network stream. This follows where each viewer is in the playlist and
+  keeps a sliding window of the next --window items fully downloaded.
+- Playback position is inferred from the NGINX access log: requests for
+  /cache/facebook_<id>.*, /api/video/facebook_<id>.* and /r/<id> tell us which
+  item a client (by IP) is on.
+- With --evict, files this scheduler fetched that are outside every active
+  viewer's window are deleted, so bytes on disk track what people are about to
+  watch. Phase 2's downloads (downloaded_path in resolved_items.json) and any
+  other cached file are never evicted; the fetched IDs are kept in
+  prefetch_owned.json across restarts.
+- fbreelz_prefetch.m3u lists cached items via /cache/ and everything else via
+  the resolve-on-play server (/r/<id>), so the whole library stays playable.
+
+Usage
+  python fbreelz_prefetch.py --base-url http://YOUR_SERVER_IP --window 5 --evict
+  python fbreelz_prefetch.py --access-log /var/log/nginx/fbreelz_access.log --from-start
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Set
+
+import fbreelz_cachelayout as cachelayout
+import fbreelz_cookies as fbcookies
+import fbreelz_governor as governor
+import fbreelz_phase2_resolve as phase2
+
+
+DEFAULT_DATA_DIR = Path("/app/data")
+DEFAULT_ACCESS_LOG = Path("/var/log/nginx/fbreelz_access.log")
+OWNED_FILE_NAME = "prefetch_owned.json"
+
+_REQ_RE = re.compile(r'^(\S+) .*?"(?:GET|HEAD) (\S+)')
+_PLAY_RES = (
+    re.compile(r"^/cache/(?:[^?]*/)?facebook_(\d+)\.[A-Za-z0-9]+"),
+    re.compile(r"^/api/video/(?:[^?]*/)?facebook_(\d+)\.[A-Za-z0-9]+"),
+    re.compile(r"^/r/(\d+)"),
+)
+
+
+@dataclass
+class Entry:
+    reel_id: str
+    source_url: str
+    title: str
+    duration: Optional[int]
+    downloaded: bool = False  # Phase 2 keeps a permanent copy; never evicted
+
+
+def _parse_access_line(line: str) -> Optional[tuple]:
+    """(client, reel_id) for a playback request in an NGINX combined-format line."""
+    m = _REQ_RE.match(line)
+    if not m:
+        return None
+    path = m.group(2).replace("%5F", "_").replace("%5f", "_")
+    for rx in _PLAY_RES:
+        pm = rx.match(path)
+        if pm:
+            return m.group(1), pm.group(1)
+    return None
+
+
+def _follow(path: Path, from_start: bool, poll: float = 0.5) -> Iterator[str]:
+    """tail -F: yield appended lines, reopening the file when it is rotated."""
+    f = None
+    inode = None
+    while True:
+        if f is None:
+            try:
+                f = path.open("r", encoding="utf-8", errors="replace")
+                inode = os.fstat(f.fileno()).st_ino
+                if not from_start:
+                    f.seek(0, os.SEEK_END)
+                from_start = True  # rotated files are read from the top
+            except OSError:
+                time.sleep(poll * 4)
+                continue
+        line = f.readline()
+        if line:
+            yield line
+            continue
+        try:
+            if path.stat().st_ino != inode:
+                f.close()
+                f = None
+                continue
+        except OSError:
+            pass
+        time.sleep(poll)
+
+
+def _cached_file(cache_dir: Path, reel_id: str, manifest: Optional[dict] = None) -> Optional[Path]:
+    return cachelayout.find(cache_dir, reel_id, manifest)
+
+
+def _load_entries(resolved: Path) -> List[Entry]:
+    out: List[Entry] = []
+    for it in phase2._load_items(resolved):
+        rid = phase2._reel_id(it.source_url)
+        if rid and not (it.cleanup or it.hidden):
+            out.append(Entry(rid, it.source_url, it.title, it.duration, bool(it.downloaded_path)))
+    return out
+
+
+class Prefetcher:
+    def __init__(self, args: argparse.Namespace) -> None:
+        self.args = args
+        self.data_dir = Path(args.data_dir)
+        self.cache_dir = self.data_dir / "cache"
+        self.resolved = self.data_dir / "resolved_items.json"
+        self.lock = threading.Lock()
+        self.entries: List[Entry] = []
+        self.pos_by_id: Dict[str, int] = {}
+        self.resolved_mtime: Optional[float] = None
+        self.viewers: Dict[str, tuple] = {}  # client -> (position, last_seen)
+        self.pending: Set[str] = set()
+        self.owned_path = self.data_dir / OWNED_FILE_NAME
+        self.owned = self._load_owned()  # reel IDs this scheduler downloaded (eviction candidates)
+        self.pool = ThreadPoolExecutor(max_workers=max(1, args.workers))
+        self.cookies = fbcookies.runtime_file(phase2.DEFAULT_SECRETS_COOKIES, phase2.DEFAULT_RUNTIME_COOKIES)
+
+    def _load_owned(self) -> Set[str]:
+        try:
+            return set(json.loads(self.owned_path.read_text(encoding="utf-8")).get("ids") or [])
+        except (OSError, ValueError, AttributeError):
+            return set()
+
+    def _save_owned(self) -> None:
+        tmp = self.owned_path.with_name(self.owned_path.name + ".tmp")
+        tmp.write_text(json.dumps({"ids": sorted(self.owned)}), encoding="utf-8")
+        os.replace(tmp, self.owned_path)
+
+    def _reload(self) -> None:
+        try:
+            mtime = self.resolved.stat().st_mtime
+        except OSError:
+            return
+        if mtime != self.resolved_mtime:
+            self.entries = _load_entries(self.resolved)
+            self.pos_by_id = {e.reel_id: i for i, e in enumerate(self.entries)}
+            self.resolved_mtime = mtime
+            print(f"[OK] Playlist order: {len(self.entries)} items")
+
+    def wanted(self, now: float) -> Set[str]:
+        """IDs inside any active viewer's window (a little behind, --window ahead)."""
+        keep: Set[str] = set()
+        for client, (pos, seen) in list(self.viewers.items()):
+            if now - seen > self.args.idle:
+                del self.viewers[client]
+                continue
+            lo = max(0, pos - self.args.behind)
+            for e in self.entries[lo : pos + 1 + self.args.window]:
+                keep.add(e.reel_id)
+        return keep
+
+    def on_play(self, client: str, reel_id: str) -> None:
+        with self.lock:
+            self._reload()
+            pos = self.pos_by_id.get(reel_id)
+            if pos is None:
+                return
+            prev = self.viewers.get(client)
+            self.viewers[client] = (pos, time.time())
+            if prev and prev[0] == pos:
+                return
+            print(f"[PLAY] {client} at {pos + 1} / {len(self.entries)} ({reel_id})")
+            self._reconcile()
+
+    def _reconcile(self) -> None:
+        keep = self.wanted(time.time())
+        # Fetch nearest-first so the very next item lands before the viewer does.
+        order = sorted(keep, key=lambda rid: min(
+            (self.pos_by_id[rid] - p for p, _ in self.viewers.values() if self.pos_by_id[rid] >= p), default=1 << 30
+        ))
+        for rid in order:
+            if rid in self.pending or _cached_file(self.cache_dir, rid):
+                continue
+            self.pending.add(rid)
+            self.pool.submit(self._fetch, self.entries[self.pos_by_id[rid]])
+
+        if self.args.evict and self.viewers:
+            freed = 0
+            permanent = {e.reel_id for e in self.entries if e.downloaded}
+            for rid in sorted(self.owned - keep - self.pending):
+                if rid in permanent:
+                    self.owned.discard(rid)  # Phase 2 now lists it; hands off
+                    continue
+                p = _cached_file(self.cache_dir, rid)
+                if p:
+                    try:
+                        size = p.stat().st_size
+                        p.unlink()
+                    except OSError:  # already gone (Phase 2, quarantine) or not ours to remove
+                        continue
+                    freed += size
+                    cachelayout.forget(self.cache_dir, rid)
+                self.owned.discard(rid)
+            self._save_owned()
+            if freed:
+                print(f"[EVICT] Freed {freed / 1e6:.1f} MB outside the active windows")
+        self._write_playlist()
+
+    def _fetch(self, e: Entry) -> None:
+        try:
+            print(f"[DL] Prefetching {e.reel_id}: {e.title or e.source_url}")
+            phase2._yt_dlp_download(e.source_url, cache_dir=self.cache_dir, cookies=self.cookies, user_agent=self.args.user_agent)
+            with self.lock:
+                self.owned.add(e.reel_id)
+                self._save_owned()
+            print(f"[OK] Prefetched {e.reel_id}")
+        except Exception as ex:
+            print(f"[WARN] Prefetch failed for {e.reel_id}: {str(ex)[:300]}")
+        finally:
+            with self.lock:
+                self.pending.discard(e.reel_id)
+                self._write_playlist()
+
+    def _write_playlist(self) -> None:
+        if not self.args.base_url:
+            return
+        base = self.args.base_url.rstrip("/")
+        lines: List[str] = ["#EXTM3U", f"#PLAYLIST:{self.args.playlist_title}"]
+        manifest = cachelayout.load_manifest(self.cache_dir)
+        for e in self.entries:
+            t = phase2._strip_newlines(e.title) or e.source_url
+            dur = e.duration if isinstance(e.duration, int) else -1
+            lines.append(f"#EXTINF:{dur},{t}")
+            cached = _cached_file(self.cache_dir, e.reel_id, manifest)
+            lines.append(f"{base}/cache/{cachelayout.rel_path(str(cached))}" if cached else f"{base}/r/{e.reel_id}")
+        out = self.data_dir / "fbreelz_prefetch.m3u"
+        tmp = out.with_name(out.name + ".tmp")
+        tmp.write_text("\n".join(lines) + "\n", encoding="utf-8")
+        os.replace(tmp, out)
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="FBReelz prefetch scheduler (sliding download window driven by playback)")
+    ap.add_argument("--data-dir", default=str(DEFAULT_DATA_DIR), help=f"Data directory (default: {DEFAULT_DATA_DIR})")
+    ap.add_argument("--access-log", default=str(DEFAULT_ACCESS_LOG), help=f"NGINX access log (default: {DEFAULT_ACCESS_LOG})")
+    ap.add_argument("--from-start", action="store_true", help="Replay the access log from the beginning")
+    ap.add_argument("--window", type=int, default=5, help="Items ahead of each viewer to keep downloaded (default: 5)")
+    ap.add_argument("--behind", type=int, default=1, help="Items behind each viewer to keep (default: 1)")
+    ap.add_argument("--idle", type=int, default=1800, help="Forget a viewer after this many idle seconds (default: 1800)")
+    ap.add_argument("--workers", type=int, default=2, help="Parallel prefetch downloads (default: 2)")
+    ap.add_argument("--evict", action="store_true", help="Delete cached files outside every active window")
+    ap.add_argument("--base-url", default=None, help="Write fbreelz_prefetch.m3u with this base, e.g. http://YOUR_SERVER_IP")
+    ap.add_argument("--playlist-title", default="FBReelz (Prefetch)", help="Playlist title")
+    ap.add_argument("--user-agent", default=None, help="User-Agent to pass to yt-dlp")
+    args = ap.parse_args()
+
+    if not phase2._yt_dlp_exists():
+        raise SystemExit("[ERR] yt-dlp not available")
+
+    # Prefetch fetches what a viewer is about to play; holding it back would cause the stalls the governor avoids.
+    governor.configure(bg_kbps=0)
+    pf = Prefetcher(args)
+    with pf.lock:
+        pf._reload()
+        pf._write_playlist()
+    print(f"[OK] Following {args.access_log} (window={args.window}, evict={args.evict})")
+    try:
+        for line in _follow(Path(args.access_log), args.from_start):
+            hit = _parse_access_line(line)
+            if hit:
+                pf.on_play(*hit)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        pf.pool.shutdown(wait=False, cancel_futures=True)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,305 @@
+## version 1
+"""FBReelz resolve-on-play server: /r/<reel-id> -> 302 to a fresh signed CDN URL.
+
+Purpose
+- resolved_url values in fbreelz.m3u are signed and expire within hours, so a
+  direct (non-downloaded) playlist is dead by the next morning.
+- Phase 2 --resolve-base makes the direct playlist point here instead; each
+  request is resolved on demand with yt-dlp and answered with a redirect.
+- Signed URLs are cached until shortly before they expire (Facebook's "oe"
+  query parameter), and concurrent requests for the same ID share a single
+  in-flight yt-dlp call.
+
+Usage (inside container)
+  python /app/fbreelz_resolve_server.py --port 8082
+  python /app/fbreelz_phase2_resolve.py --no-ytdlp --resolve-base http://YOUR_SERVER_IP
+
+Head-cache media endpoint
+- /m/<reel-id> serves the reel itself with HTTP Range support. Byte ranges held
+  in the head cache (cache/head/, filled by Phase 2 --head-cache) come from local
+  disk; the rest is fetched from the signed URL on demand and written back.
+- If upstream now reports a different file size than the cached head, the head
+  is dropped and the request is answered with a 302 to the CDN instead.
+
+NGINX proxies /r/ and /m/ to this server (see nginx/fbreelz.conf).
+"""
+
+from __future__ import annotations
+
+import argparse
+import re
+import threading
+import time
+from concurrent.futures import Future
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Callable, Dict, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+import fbreelz_cookies as fbcookies
+import fbreelz_phase2_resolve as phase2
+from fbreelz_headcache import DEFAULT_HEAD_BYTES, HeadCache, UpstreamChanged
+
+
+DEFAULT_RESOLVED = Path("/app/data/resolved_items.json")
+DEFAULT_CACHE_DIR = Path("/app/data/cache")
+DEFAULT_TTL = 30 * 60  # used when the signed URL carries no expiry
+EXPIRY_MARGIN = 5 * 60  # stop handing out a URL this long before it expires
+
+_ID_RE = re.compile(r"^/r/(\d+)/?$")
+_MEDIA_RE = re.compile(r"^/m/(\d+)(?:\.mp4)?/?$")
+_RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def _url_expiry(url: str, now: float) -> float:
+    """Best-effort expiry (epoch seconds) of a signed CDN URL."""
+    qs = parse_qs(urlparse(url).query)
+    oe = (qs.get("oe") or [""])[0]
+    if oe:
+        try:
+            return float(int(oe, 16))
+        except ValueError:
+            pass
+    for key in ("expires", "Expires", "expire"):
+        v = (qs.get(key) or [""])[0]
+        if v.isdigit():
+            return float(v)
+    return now + DEFAULT_TTL
+
+
+@dataclass
+class _Entry:
+    url: str
+    fresh_until: float
+
+
+class Resolver:
+    """ID -> signed URL with an expiry-aware cache and single-flight resolution."""
+
+    def __init__(
+        self,
+        resolve: Callable[[str], str],
+        source_for: Callable[[str], str],
+        margin: float = EXPIRY_MARGIN,
+    ) -> None:
+        self._resolve = resolve
+        self._source_for = source_for
+        self._margin = margin
+        self._lock = threading.Lock()
+        self._cache: Dict[str, _Entry] = {}
+        self._inflight: Dict[str, Future] = {}
+
+    def get(self, reel_id: str) -> Tuple[str, bool]:
+        """Return (signed_url, from_cache). Raises RuntimeError if resolution fails."""
+        now = time.time()
+        with self._lock:
+            entry = self._cache.get(reel_id)
+            if entry and entry.fresh_until > now:
+                return entry.url, True
+            fut = self._inflight.get(reel_id)
+            owner = fut is None
+            if owner:
+                fut = Future()
+                self._inflight[reel_id] = fut
+
+        if not owner:
+            return fut.result(), False
+
+        try:
+            url = self._resolve(self._source_for(reel_id))
+            fresh_until = _url_expiry(url, now) - self._margin
+            with self._lock:
+                if fresh_until > now:
+                    self._cache[reel_id] = _Entry(url, fresh_until)
+            fut.set_result(url)
+            return url, False
+        except BaseException as e:
+            fut.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(reel_id, None)
+
+    def invalidate(self, reel_id: str) -> None:
+        with self._lock:
+            self._cache.pop(reel_id, None)
+
+
+class SourceIndex:
+    """reel-id -> source_url from resolved_items.json, reloaded when the file changes."""
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self._mtime: Optional[float] = None
+        self._map: Dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, reel_id: str) -> str:
+        with self._lock:
+            try:
+                mtime = self.path.stat().st_mtime
+            except OSError:
+                mtime = None
+            if mtime != self._mtime:
+                self._map = {}
+                if mtime is not None:
+                    for it in phase2._load_items(self.path):
+                        rid = phase2._reel_id(it.source_url)
+                        if rid:
+                            self._map[rid] = it.source_url
+                self._mtime = mtime
+            return self._map.get(reel_id) or f"https://www.facebook.com/reel/{reel_id}"
+
+
+def _parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """[start, end) for a single "bytes=" range; None when absent or unsatisfiable."""
+    m = _RANGE_RE.match((header or "").strip())
+    if not m or not (m.group(1) or m.group(2)):
+        return None
+    if not m.group(1):
+        n = int(m.group(2))
+        return (max(0, size - n), size) if n else None
+    start = int(m.group(1))
+    end = min(size, int(m.group(2)) + 1) if m.group(2) else size
+    return (start, end) if start < end else None
+
+
+def _make_handler(resolver: Resolver, heads: HeadCache, head_bytes: int):
+    class Handler(BaseHTTPRequestHandler):
+        server_version = "FBReelzResolve/1"
+        protocol_version = "HTTP/1.1"
+
+        def _media(self, reel_id: str, head_only: bool) -> None:
+            def url_for(refresh: bool) -> str:
+                if refresh:
+                    resolver.invalidate(reel_id)
+                return resolver.get(reel_id)[0]
+
+            meta = heads.meta(reel_id)
+            try:
+                if not meta or not meta.get("size"):
+                    meta = heads.prime(reel_id, url_for(False), head_bytes)
+            except Exception as e:
+                self.log_message("head fetch failed for %s: %s", reel_id, str(e)[:300])
+                self.send_error(502, "could not fetch media")
+                return
+            size = int(meta.get("size") or 0)
+            if not size:
+                self.send_error(502, "upstream size unknown")
+                return
+
+            rng_header = self.headers.get("Range")
+            rng = _parse_range(rng_header, size)
+            if rng_header and rng is None:
+                self.send_response(416)
+                self.send_header("Content-Range", f"bytes */{size}")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+            start, end = rng or (0, size)
+            sent = []
+
+            def begin() -> None:
+                self.send_response(206 if rng else 200)
+                self.send_header("Content-Type", "video/mp4")
+                self.send_header("Accept-Ranges", "bytes")
+                self.send_header("Content-Length", str(end - start))
+                if rng:
+                    self.send_header("Content-Range", f"bytes {start}-{end - 1}/{size}")
+                self.end_headers()
+                sent.append(True)
+
+            if head_only:
+                begin()
+                return
+            try:
+                heads.serve(reel_id, start, end, url_for, self.wfile.write, begin)
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+            except UpstreamChanged as e:
+                # The head cache was dropped; play this request straight from the CDN.
+                self.log_message("%s for %s", e, reel_id)
+                if sent:
+                    self.close_connection = True
+                else:
+                    self._redirect(reel_id)
+            except Exception as e:
+                self.log_message("media fetch failed for %s: %s", reel_id, str(e)[:300])
+                if sent:
+                    # Headers are out; all we can do is drop the connection.
+                    self.close_connection = True
+                else:
+                    self.send_error(502, "could not fetch media")
+
+        def _redirect(self, reel_id: str) -> None:
+            try:
+                url, cached = resolver.get(reel_id)
+            except Exception as e:
+                self.log_message("resolve failed for %s: %s", reel_id, str(e)[:300])
+                self.send_error(502, "could not resolve media URL")
+                return
+            self.send_response(302)
+            self.send_header("Location", url)
+            self.send_header("Cache-Control", "no-store")
+            self.send_header("X-FBReelz-Cache", "hit" if cached else "miss")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+
+        def _handle(self, head_only: bool) -> None:
+            path = urlparse(self.path).path
+            mm = _MEDIA_RE.match(path)
+            if mm:
+                self._media(mm.group(1), head_only)
+                return
+            m = _ID_RE.match(path)
+            if not m:
+                self.send_error(404, "expected /r/<reel-id> or /m/<reel-id>")
+                return
+            self._redirect(m.group(1))
+
+        def do_GET(self) -> None:  # noqa: N802
+            self._handle(head_only=False)
+
+        def do_HEAD(self) -> None:  # noqa: N802
+            self._handle(head_only=True)
+
+    return Handler
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="FBReelz resolve-on-play redirect server (/r/<reel-id>)")
+    ap.add_argument("--bind", default="0.0.0.0", help="Bind address (default: 0.0.0.0)")
+    ap.add_argument("--port", type=int, default=8082, help="Port (default: 8082)")
+    ap.add_argument("--resolved", default=str(DEFAULT_RESOLVED), help=f"resolved_items.json (default: {DEFAULT_RESOLVED})")
+    ap.add_argument("--format", default="b", help="yt-dlp format; must be a single progressive file (default: b)")
+    ap.add_argument("--user-agent", default=None, help="User-Agent to pass to yt-dlp")
+    ap.add_argument("--cache-dir", default=str(DEFAULT_CACHE_DIR), help=f"Cache directory (default: {DEFAULT_CACHE_DIR}; head cache in <cache>/head)")
+    ap.add_argument("--head-bytes", type=int, default=DEFAULT_HEAD_BYTES,
+                    help=f"Bytes to cache when /m/ sees an item for the first time (default: {DEFAULT_HEAD_BYTES})")
+    args = ap.parse_args()
+
+    if not phase2._yt_dlp_exists():
+        raise SystemExit("[ERR] yt-dlp not available")
+
+    cookies = fbcookies.runtime_file(phase2.DEFAULT_SECRETS_COOKIES, phase2.DEFAULT_RUNTIME_COOKIES)
+
+    def resolve(source_url: str) -> str:
+        resolved_url, _, _, _ = phase2._yt_dlp_info(source_url, cookies=cookies, user_agent=args.user_agent, fmt=args.format)
+        if not resolved_url:
+            raise RuntimeError("yt-dlp returned no media URL")
+        return resolved_url
+
+    resolver = Resolver(resolve, SourceIndex(Path(args.resolved)))
+    heads = HeadCache(Path(args.cache_dir) / "head")
+    httpd = ThreadingHTTPServer((args.bind, args.port), _make_handler(resolver, heads, args.head_bytes))
+    print(f"[OK] Resolve-on-play server on http://{args.bind}:{args.port}/r/<reel-id> and /m/<reel-id>")
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,208 @@
+## version 1
+"""FBReelz flight recorder: per-item spans written as a Chrome/Perfetto trace.
+
+Purpose
+- A slow Phase 2 run only showed gaps between [DL] lines. With --trace every
+  item gets its own track, with spans for each stage:
+  - resolve: yt-dlp spawn, metadata extraction, JSON parse,
+  - download: spawn + extraction, transfer, post-processing (merge/move),
+    manifest hashing and the playlist rewrite,
+  - Phase 1: browser launch, navigation and link extraction per Saved page.
+- yt-dlp stage boundaries come from --print markers (before_dl, post_process,
+  after_move) read as they arrive on stdout, so the transfer is timed by yt-dlp
+  itself rather than guessed.
+- --cprofile additionally dumps cProfile stats of the Python side. Every thread
+  that enters profiled() gets its own profiler; the stats are merged on save.
+
+Usage
+  python /app/fbreelz_phase2_resolve.py --download --trace /app/data/trace_phase2.json --cprofile /app/data/phase2.prof
+  Open the trace in https://ui.perfetto.dev (or chrome://tracing);
+  python -m pstats /app/data/phase2.prof for the profile.
+
+Disabled by default: span() is then a no-op and yt-dlp runs exactly as before.
+"""
+
+from __future__ import annotations
+
+import contextlib
+import cProfile
+import json
+import os
+import pstats
+import subprocess
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple, Union
+
+MARKER = "FBREELZ_STAGE "
+# yt-dlp --print hooks, in the order they fire for one download.
+DOWNLOAD_STAGES = (("before_dl", "transfer"), ("post_process", "postprocess"), ("after_move", "finish"))
+
+Track = Union[int, str]
+
+
+class Tracer:
+    """Collects complete ("X") events; tracks map to trace thread rows."""
+
+    def __init__(self) -> None:
+        self.enabled = False
+        self._events: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+        self._tids: Dict[Track, int] = {}
+        self._local = threading.local()
+        self._t0 = time.perf_counter()
+        self._pid = os.getpid()
+
+    def enable(self) -> None:
+        self.enabled = True
+        self._t0 = time.perf_counter()
+
+    def _tid(self, track: Optional[Track]) -> int:
+        track = track if track is not None else getattr(self._local, "track", "main")
+        with self._lock:
+            tid = self._tids.get(track)
+            if tid is None:
+                tid = self._tids[track] = len(self._tids) + 1
+                name = track if isinstance(track, str) else f"item {track}"
+                self._events.append({"name": "thread_name", "ph": "M", "pid": self._pid, "tid": tid, "args": {"name": name}})
+            return tid
+
+    def name_track(self, track: Track, name: str) -> None:
+        if not self.enabled:
+            return
+        tid = self._tid(track)
+        with self._lock:
+            self._events.append({"name": "thread_name", "ph": "M", "pid": self._pid, "tid": tid, "args": {"name": name}})
+
+    @contextlib.contextmanager
+    def track(self, track: Track) -> Iterator[None]:
+        """Spans without an explicit track in this thread go to `track`."""
+        prev = getattr(self._local, "track", None)
+        self._local.track = track
+        try:
+            yield
+        finally:
+            self._local.track = prev if prev is not None else "main"
+
+    def complete(self, name: str, start: float, end: float, track: Optional[Track] = None, **args: Any) -> None:
+        """Record a span from perf_counter() timestamps."""
+        if not self.enabled:
+            return
+        ev = {
+            "name": name,
+            "cat": args.pop("cat", "fbreelz"),
+            "ph": "X",
+            "pid": self._pid,
+            "tid": self._tid(track),
+            "ts": round((start - self._t0) * 1e6, 1),
+            "dur": round(max(0.0, end - start) * 1e6, 1),
+        }
+        if args:
+            ev["args"] = {k: v for k, v in args.items() if v is not None}
+        with self._lock:
+            self._events.append(ev)
+
+    @contextlib.contextmanager
+    def span(self, name: str, track: Optional[Track] = None, **args: Any) -> Iterator[None]:
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.complete(name, start, time.perf_counter(), track, **args)
+
+    def write(self, path: Path) -> None:
+        with self._lock:
+            events = list(self._events)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(path.name + ".tmp")
+        tmp.write_text(json.dumps({"traceEvents": events, "displayTimeUnit": "ms"}), encoding="utf-8")
+        os.replace(tmp, path)
+        print(f"[OK] Wrote trace ({sum(1 for e in events if e['ph'] == 'X')} spans) to {path}")
+
+
+TRACER = Tracer()
+span = TRACER.span
+complete = TRACER.complete
+track = TRACER.track
+
+
+def stage_args(stages: Tuple[Tuple[str, str], ...] = DOWNLOAD_STAGES) -> List[str]:
+    """yt-dlp arguments that print a marker line when each stage starts."""
+    out: List[str] = []
+    for when, label in stages:
+        out += ["--print", f"{when}:{MARKER}{label}"]
+    return out
+
+
+def run_staged(cmd: List[str], first: str = "extract") -> subprocess.CompletedProcess:
+    """subprocess.run(capture_output=True, text=True) that turns marker lines into spans.
+
+    The time up to the first marker is `first` (process start + extraction); marker
+    lines are removed from the returned stdout.
+    """
+    t_spawn = time.perf_counter()
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    complete("spawn", t_spawn, time.perf_counter(), cat="subprocess")
+    err: List[str] = []
+    reader = threading.Thread(target=lambda: err.append(proc.stderr.read()), daemon=True)
+    reader.start()
+    out: List[str] = []
+    stage, since = first, t_spawn
+    for line in proc.stdout:
+        if line.startswith(MARKER):
+            now = time.perf_counter()
+            complete(stage, since, now, cat="yt-dlp")
+            stage, since = line[len(MARKER):].strip(), now
+        else:
+            out.append(line)
+    rc = proc.wait()
+    reader.join()
+    complete(stage, since, time.perf_counter(), cat="yt-dlp", exit=rc)
+    return subprocess.CompletedProcess(cmd, rc, "".join(out), "".join(err))
+
+
+class Profiler:
+    """cProfile for every thread that enters profiled(); save() merges them."""
+
+    def __init__(self) -> None:
+        self.enabled = False
+        self._profiles: List[cProfile.Profile] = []
+        self._lock = threading.Lock()
+
+    @contextlib.contextmanager
+    def profiled(self) -> Iterator[None]:
+        if not self.enabled:
+            yield
+            return
+        prof = cProfile.Profile()
+        try:
+            prof.enable()
+        except ValueError:
+            # Python 3.12+ profiles all threads from one active profiler already.
+            yield
+            return
+        with self._lock:
+            self._profiles.append(prof)
+        try:
+            yield
+        finally:
+            prof.disable()
+
+    def save(self, path: Path) -> None:
+        with self._lock:
+            profiles = list(self._profiles)
+        if not profiles:
+            return
+        stats = pstats.Stats(profiles[0])
+        for p in profiles[1:]:
+            stats.add(p)
+        stats.dump_stats(str(path))
+        print(f"[OK] Wrote cProfile stats ({len(profiles)} thread profile(s)) to {path}")
+
+
+PROFILER = Profiler()
+profiled = PROFILER.profiled
@@ -21,7 +21,11 @@ Usage examples:
   # 2) Create a playlist with FULL URL entries (recommended for remote streaming)
   python3 make_cache_playlist_v2.py --base-url http://YOUR_SERVER_IP:8081
 
-  # 3) Custom paths
+  # 3) Large library: also write 500-entry parts, per-day "new saves" and a daily shuffle,
+  #    listed in fbreelz_cache_http.index.m3u (unchanged parts are not rewritten)
+  python3 make_cache_playlist_v2.py --base-url http://YOUR_SERVER_IP:8081 --playlist-chunk 500
+
+  # 4) Custom paths
   python3 make_cache_playlist_v2.py --cache-dir /opt/fbreelz/data/cache --output /opt/fbreelz/data/fbreelz_cache_http.m3u --base-url http://YOUR_SERVER_IP:8081
 
 Then:
@@ -34,17 +38,40 @@ On your Windows VLC:
 """
 
 import argparse
-import json
+import os
 import re
+import sys
 from pathlib import Path
 from urllib.parse import urljoin
 
+# Shared helpers live next to the phase scripts (scripts/ in the Docker bundle,
+# alongside this file in the non-Docker bundle).
+sys.path.insert(0, str(Path(__file__).resolve().parent / "scripts"))
+
+from fbreelz_cachelayout import find, load_manifest, rel_path  # noqa: E402
+from fbreelz_integrity import media_files, validate  # noqa: E402
+from fbreelz_jsonstream import iter_array  # noqa: E402
+from fbreelz_mp4info import fill_duration  # noqa: E402
+from fbreelz_playlists import Entry, write_set  # noqa: E402
+
 def _safe_title(s: str) -> str:
     s = (s or "").strip().replace("\n", " ")
     s = re.sub(r"\s+", " ", s)
     s = s.replace(",", " ")
     return s[:220] if len(s) > 220 else s
 
+def _cached_name(it: dict, cache_dir: Path, manifest: dict) -> str:
+    """Cache-relative path of the item's file: facebook_<id>.mp4 or <shard>/facebook_<id>.mp4."""
+    cached = it.get("downloaded_path") or it.get("downloaded_file") or it.get("cached_file") or ""
+    if cached:
+        return rel_path(cached)
+    src = (it.get("source_url") or "").strip()
+    m = re.search(r"/reel/(\d+)", src) or re.search(r"[?&]v=(\d+)", src)
+    if not m:
+        return ""
+    found = find(cache_dir, m.group(1), manifest)
+    return found.relative_to(cache_dir).as_posix() if found else f"facebook_{m.group(1)}.mp4"
+
 def main() -> int:
     ap = argparse.ArgumentParser(description="Generate an M3U playlist for cached FBReelz MP4s.")
     ap.add_argument("--resolved", default="/opt/fbreelz/data/resolved_items.json",
@@ -57,6 +84,12 @@ def main() -> int:
                     help="If set, write full URLs like http://host:8081/cache/file.mp4")
     ap.add_argument("--playlist-title", default="FBReelz (Cache)",
                     help="Playlist title (default: FBReelz (Cache))")
+    ap.add_argument("--playlist-chunk", type=int, default=0, metavar="N",
+                    help="Also write N-entry parts, per-day and shuffle playlists and <name>.index.m3u (default: 0 = off)")
+    ap.add_argument("--shuffle-seed", default=None,
+                    help="Seed for the shuffle playlist (default: today's UTC date, so the mix changes daily)")
+    ap.add_argument("--no-validate", action="store_true",
+                    help="Skip the integrity check (ffprobe) and list every file that exists")
     args = ap.parse_args()
 
     resolved_path = Path(args.resolved)
@@ -68,50 +101,64 @@ def main() -> int:
     if not cache_dir.exists():
         raise SystemExit(f"[ERR] cache dir not found: {cache_dir}")
 
-    data = json.loads(resolved_path.read_text(encoding="utf-8"))
-    items = data.get("items", []) or []
-
-    playable: list[tuple[dict, str]] = []
-    for it in items:
-        cached = it.get("downloaded_file") or it.get("cached_file") or ""
-        if cached:
-            fname = Path(cached).name
-        else:
-            src = (it.get("source_url") or "").strip()
-            m = re.search(r"/reel/(\d+)", src) or re.search(r"[?&]v=(\d+)", src)
-            fname = f"facebook_{m.group(1)}.mp4" if m else ""
-
-        if not fname:
-            continue
-
-        fpath = cache_dir / fname
-        if fpath.exists() and fpath.is_file():
-            playable.append((it, fname))
-
-    if not playable:
-        raise SystemExit("[ERR] No cached MP4s found. Check /opt/fbreelz/data/cache and your resolved_items.json")
-
     base_url = args.base_url.strip()
     if base_url and not base_url.endswith("/"):
         base_url += "/"
 
-    lines: list[str] = ["#EXTM3U", f"#PLAYLIST:{args.playlist_title}"]
-
-    for it, fname in playable:
-        title = _safe_title(it.get("title") or "Video")
-        dur = it.get("duration")
-        dur = int(dur) if isinstance(dur, (int, float)) else -1
-        lines.append(f"#EXTINF:{dur},{title}")
-
-        if base_url:
-            lines.append(urljoin(base_url, f"cache/{fname}"))
-        else:
-            # Relative path (NO leading slash) so VLC requests /cache/<fname>
-            lines.append(f"cache/{fname}")
+    # Only validated media is listed; results are cached per (inode, size, mtime)
+    # and bad files are moved to cache/.quarantine/.
+    valid = None
+    if not args.no_validate:
+        valid = {p.relative_to(cache_dir).as_posix() for p, res in validate(media_files(cache_dir), cache_dir).items() if res.ok}
+    manifest = load_manifest(cache_dir)
+
+    # Stream items straight from resolved_items.json into a temp playlist so
+    # memory stays flat however large the library gets.
+    tmp_path = out_path.with_name(out_path.name + ".tmp")
+    count = 0
+    entries = []  # only kept for --playlist-chunk
+    with resolved_path.open("r", encoding="utf-8") as src, tmp_path.open("w", encoding="utf-8") as out:
+        out.write(f"#EXTM3U\n#PLAYLIST:{args.playlist_title}\n")
+        for _, it in iter_array(src, [("items",)]):
+            if not isinstance(it, dict) or it.get("cleanup") or it.get("hidden"):
+                continue
+            fname = _cached_name(it, cache_dir, manifest)
+            if not fname:
+                continue
+
+            fpath = cache_dir / fname
+            if not (fpath.exists() and fpath.is_file()):
+                continue
+            if valid is not None and fname not in valid:
+                continue
+
+            title = _safe_title(it.get("title") or "Video")
+            # Missing durations come from the file's moov box (no ffprobe, no network).
+            dur = fill_duration(it.get("duration"), fpath)
+            dur = int(dur) if isinstance(dur, (int, float)) else -1
+            out.write(f"#EXTINF:{dur},{title}\n")
+
+            if base_url:
+                uri = urljoin(base_url, f"cache/{fname}")
+            else:
+                # Relative path (NO leading slash) so VLC requests /cache/<fname>
+                uri = f"cache/{fname}"
+            out.write(uri + "\n")
+            if args.playlist_chunk > 0:
+                entries.append(Entry(title, dur, uri, it.get("first_seen_utc")))
+            count += 1
+
+    if not count:
+        tmp_path.unlink(missing_ok=True)
+        raise SystemExit("[ERR] No cached MP4s found. Check /opt/fbreelz/data/cache and your resolved_items.json")
 
-    out_path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+    os.replace(tmp_path, out_path)
     print(f"[OK] Wrote: {out_path}")
-    print(f"[OK] Items: {len(playable)}")
+    print(f"[OK] Items: {count}")
+    if args.playlist_chunk > 0:
+        written, total = write_set(out_path, args.playlist_title, entries, args.playlist_chunk, seed=args.shuffle_seed)
+        index_name = out_path.name[: -len(out_path.suffix)] + ".index.m3u"
+        print(f"[OK] Playlist set: {total} file(s), {written} rewritten; open {index_name}")
     if base_url:
         print(f"[TIP] Open in VLC (network): {urljoin(base_url, out_path.name)}")
     else:
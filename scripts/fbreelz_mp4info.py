@@ -0,0 +1,151 @@
+## version 1
+"""FBReelz MP4 info: duration, resolution and faststart straight from the moov box.
+
+Purpose
+- Many playlist entries had #EXTINF:-1 because yt-dlp did not report a duration,
+  and the only ways to get it back were another yt-dlp round-trip or spawning
+  ffprobe per file.
+- probe() memory-maps a cached MP4/M4A/MOV and walks its ISO-BMFF boxes. It reads:
+  - mvhd for the duration (mehd for fragmented files),
+  - tkhd of every track for the largest width x height,
+  - the top-level order of moov and mdat for faststart.
+  Only the pages holding box headers and moov are touched, never the media
+  itself, so a file takes tens of microseconds.
+- Anything that does not parse (truncated box, no moov, not an MP4) returns None;
+  fbreelz_integrity.py decides whether such a file is bad.
+- Phase 2 and make_cache_playlist.py use fill_duration() for items whose duration
+  is missing, and the integrity check uses probe() for the duration when ffprobe
+  is not installed.
+
+Usage
+  python fbreelz_mp4info.py                         # summarize /app/data/cache
+  python fbreelz_mp4info.py cache/facebook_123.mp4  # one line per file
+"""
+
+from __future__ import annotations
+
+import argparse
+import mmap
+import struct
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterator, List, Optional, Tuple
+
+from fbreelz_cachelayout import iter_media
+
+
+DEFAULT_CACHE_DIR = Path("/app/data/cache")
+MP4_SUFFIXES = (".mp4", ".m4a", ".mov")
+_CONTAINERS = (b"trak", b"mvex")
+
+
+@dataclass
+class Info:
+    duration: Optional[float]  # seconds
+    width: int = 0
+    height: int = 0
+    faststart: bool = False  # moov before mdat
+
+
+def _boxes(buf, start: int, end: int) -> Iterator[Tuple[bytes, int, int]]:
+    """(type, payload offset, box end) of the boxes in buf[start:end]; stops at the first bad header."""
+    off = start
+    while off + 8 <= end:
+        size, kind = struct.unpack_from(">I4s", buf, off)
+        hdr = 8
+        if size == 1:
+            if off + 16 > end:
+                return
+            size = struct.unpack_from(">Q", buf, off + 8)[0]
+            hdr = 16
+        elif size == 0:
+            size = end - off
+        if size < hdr or off + size > end:
+            return
+        yield kind, off + hdr, off + size
+        off += size
+
+
+def _full_box(buf, off: int, v0: str, v1: str) -> Tuple:
+    """Fields after a full box's version/flags, using the v0 or v1 layout."""
+    fmt = v1 if buf[off] == 1 else v0
+    return struct.unpack_from(fmt, buf, off + 4)
+
+
+def _moov(buf, start: int, end: int) -> Info:
+    info = Info(None)
+    timescale = 0
+    for kind, off, box_end in _boxes(buf, start, end):
+        if kind == b"mvhd" and box_end - off >= 32:
+            _, _, timescale, dur = _full_box(buf, off, ">IIII", ">QQIQ")
+            if timescale and dur not in (0, 0xFFFFFFFF, 0xFFFFFFFFFFFFFFFF):
+                info.duration = dur / timescale
+        elif kind in _CONTAINERS:
+            for sub, soff, send in _boxes(buf, off, box_end):
+                if sub == b"tkhd" and send - soff >= 84:
+                    # width/height are 16.16 fixed point at the end of the box
+                    w, h = struct.unpack_from(">II", buf, send - 8)
+                    if (w >> 16) * (h >> 16) > info.width * info.height:
+                        info.width, info.height = w >> 16, h >> 16
+                elif sub == b"mehd" and info.duration is None and timescale:
+                    (frag,) = _full_box(buf, soff, ">I", ">Q")
+                    info.duration = frag / timescale or None
+    return info
+
+
+def probe(path: Path) -> Optional[Info]:
+    """Info for an MP4/M4A/MOV file, or None when it has no readable moov."""
+    if Path(path).suffix.lower() not in MP4_SUFFIXES:
+        return None
+    try:
+        with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+            size = len(buf)
+            mdat_at = None
+            for kind, off, end in _boxes(buf, 0, size):
+                if kind == b"mdat" and mdat_at is None:
+                    mdat_at = off
+                elif kind == b"moov":
+                    info = _moov(buf, off, end)
+                    info.faststart = mdat_at is None
+                    return info
+    except (OSError, ValueError, struct.error):  # ValueError: empty file (mmap of length 0)
+        return None
+    return None
+
+
+def fill_duration(duration: Optional[int], path: Optional[Path]) -> Optional[int]:
+    """`duration` if known, else whole seconds from the cached file's moov (None if unreadable)."""
+    if isinstance(duration, (int, float)) or not path:
+        return duration
+    info = probe(path)
+    return int(round(info.duration)) if info and info.duration else None
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="Read duration/resolution/faststart from cached MP4s without ffprobe")
+    ap.add_argument("paths", nargs="*", type=Path, help="Files to read (default: every MP4 in --cache-dir)")
+    ap.add_argument("--cache-dir", type=Path, default=DEFAULT_CACHE_DIR, help=f"Cache directory (default: {DEFAULT_CACHE_DIR})")
+    args = ap.parse_args()
+
+    paths: List[Path] = args.paths or list(iter_media(args.cache_dir, MP4_SUFFIXES))
+    ok = slow = 0
+    t0 = time.perf_counter()
+    for p in paths:
+        info = probe(p)
+        if info is None:
+            print(f"[WARN] {p}: no readable moov")
+            continue
+        ok += 1
+        slow += not info.faststart
+        if args.paths:
+            dur = f"{info.duration:.2f}s" if info.duration else "?"
+            print(f"[OK] {p}: {dur} {info.width}x{info.height} {'faststart' if info.faststart else 'moov after mdat'}")
+    took = time.perf_counter() - t0
+    per = took / len(paths) * 1e6 if paths else 0.0
+    print(f"[OK] {ok}/{len(paths)} file(s) read in {took * 1000:.1f} ms ({per:.0f} us/file); {slow} not faststart")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
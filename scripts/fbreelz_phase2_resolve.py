@@ -12,20 +12,75 @@ Usage (inside container)
 
 Example (HTTP playlist for remote streaming)
   python /app/fbreelz_phase2_resolve.py --download --http-base http://YOUR_SERVER_IP:8081
+
+Example (only process what Phase 1 saw change since last run)
+  python /app/fbreelz_phase2_resolve.py --download --delta /app/data/saved_delta.json
+  New items are prepended to the existing resolved_items.json; removed saves are
+  kept but flagged "cleanup": true and left out of every playlist.
+
+Example (stream without downloading; URLs resolved when played, see fbreelz_resolve_server.py)
+  python /app/fbreelz_phase2_resolve.py --no-ytdlp --resolve-base http://YOUR_SERVER_IP
+
+Example (phone-sized downloads: byte-budget format policy; choice + sizes recorded per item)
+  python /app/fbreelz_phase2_resolve.py --download --max-height 720 --prefer-codec h264 --max-bytes 50000000
+
+Example (head-of-file cache: first ~2 MB of every reel on disk, rest streamed via /m/<id>)
+  python /app/fbreelz_phase2_resolve.py --download --head-cache 2097152 --http-base http://YOUR_SERVER_IP
+
+Example (most wanted first: playlists are rewritten as each item lands)
+  python /app/fbreelz_phase2_resolve.py --download --order shortest --resolve-workers 4
+
+Example (time/byte budget: stop starting downloads that will not fit, resume next run)
+  python /app/fbreelz_phase2_resolve.py --download --deadline 06:30 --byte-budget 20G
+  Unfinished items are listed in /app/data/phase2_resume.json; the next run reuses
+  finished items from resolved_items.json and only works on the rest (--no-resume
+  to start over).
+
+Example (large libraries: 500-entry parts, per-day and shuffle playlists, <name>.index.m3u)
+  python /app/fbreelz_phase2_resolve.py --download --http-base http://YOUR_SERVER_IP --playlist-chunk 500
+  Only parts whose content changed are rewritten (see fbreelz_playlists.py).
+
+Example (playback-aware downloads: held to 1.5 Mbit/s while someone streams from /cache/)
+  python /app/fbreelz_phase2_resolve.py --download --bg-kbps 1500
+  Full speed returns shortly after playback stops (see fbreelz_governor.py).
+
+Example (near-duplicate re-uploads: see fbreelz_dedupe.py)
+  Items listed in /app/data/duplicates.json keep their duplicate_of/hidden flags on
+  full runs, and copies it deleted are not downloaded again.
+
+Example (where does the time go? per-item stage spans + Python profile)
+  python /app/fbreelz_phase2_resolve.py --download --trace /app/data/trace_phase2.json --cprofile /app/data/phase2.prof
+
+Every run also writes the static feed to /app/data/catalog/ (content-hashed,
+gzip-precompressed pages served by NGINX at /catalog/; --no-catalog to skip).
 """
 
 from __future__ import annotations
 
 import argparse
+import heapq
 import json
 import re
-import shutil
 import subprocess
 import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass, asdict
 from datetime import datetime, timezone
 from pathlib import Path
-from typing import Any, Dict, List, Optional, Tuple
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+import fbreelz_cachelayout as cachelayout
+import fbreelz_cookies as fbcookies
+import fbreelz_governor as governor
+import fbreelz_playlists as playlists
+import fbreelz_trace as trace
+from fbreelz_headcache import HeadCache
+from fbreelz_integrity import validate
+from fbreelz_jsonstream import iter_saved_rows
+from fbreelz_mp4info import fill_duration
+from fbreelz_shards import DEFAULT_CATALOG_DIR, DEFAULT_PAGE_SIZE, write_catalog
 
 
 DEFAULT_INPUT = Path("/app/data/saved_items.json")
@@ -36,6 +91,8 @@ DEFAULT_HTTP_M3U = Path("/app/data/fbreelz_cache_http.m3u")
 DEFAULT_CACHE_DIR = Path("/app/data/cache")
 DEFAULT_SECRETS_COOKIES = Path("/app/secrets/cookies.txt")
 DEFAULT_RUNTIME_COOKIES = Path("/app/data/cookies_runtime.txt")
+RESUME_FILE_NAME = "phase2_resume.json"
+DUPLICATES_FILE_NAME = "duplicates.json"  # written by fbreelz_dedupe.py
 
 
 @dataclass
@@ -45,10 +102,20 @@ class ItemOut:
     resolved_url: Optional[str] = None
     title: str = ""
     duration: Optional[int] = None
+    thumbnail: Optional[str] = None
     extractor: Optional[str] = None
-    status: str = "ok"  # ok | error
+    status: str = "ok"  # ok | error | deferred (budget ran out before it was resolved)
     error: Optional[str] = None
     downloaded_path: Optional[str] = None
+    head_cached_path: Optional[str] = None  # only the head is on disk; served via /m/<id>
+    format_id: Optional[str] = None  # chosen by the format policy (None = yt-dlp default)
+    format_note: Optional[str] = None
+    est_bytes: Optional[int] = None
+    best_bytes: Optional[int] = None  # estimated size of yt-dlp's default (best) pick
+    first_seen_utc: Optional[str] = None
+    cleanup: bool = False  # save was removed on Facebook; cached file can go
+    duplicate_of: Optional[str] = None  # reel id this is a near-duplicate of (fbreelz_dedupe.py)
+    hidden: bool = False  # near-duplicate left out of playlists and the catalog (fbreelz_dedupe.py --hide)
 
 
 def _utc_now_iso() -> str:
@@ -64,6 +131,40 @@ def _load_json(path: Path) -> Dict[str, Any]:
         return json.load(f)
 
 
+def _known_duplicates(path: Path) -> Dict[str, Tuple[str, bool, bool]]:
+    """reel id -> (kept id, hidden, file deleted) from fbreelz_dedupe.py's duplicates.json."""
+    try:
+        data = _load_json(path)
+    except (OSError, ValueError):
+        return {}
+    out: Dict[str, Tuple[str, bool, bool]] = {}
+    for g in data.get("groups") or []:
+        for d in g.get("duplicates") or []:
+            if d.get("id") and g.get("keep"):
+                out[str(d["id"])] = (str(g["keep"]), bool(data.get("hidden") or d.get("deleted")), bool(d.get("deleted")))
+    return out
+
+
+def _load_items(path: Path) -> List[ItemOut]:
+    """Load a previous resolved_items.json back into ItemOut rows (unknown keys ignored)."""
+    if not path.exists():
+        return []
+    fields = set(ItemOut.__dataclass_fields__)
+    data = _load_json(path)
+    return [ItemOut(**{k: v for k, v in r.items() if k in fields}) for r in data.get("items", []) if isinstance(r, dict)]
+
+
+def _first_seen_by_url(detected_format: str, rows: List[Dict[str, Any]]) -> Dict[str, str]:
+    out: Dict[str, str] = {}
+    if detected_format == "graphql_edges":
+        for e in rows:
+            savable = ((e or {}).get("node") or {}).get("savable") or {}
+            url = savable.get("savable_permalink") or savable.get("url") or ""
+            if url and (e or {}).get("first_seen_utc"):
+                out[url] = e["first_seen_utc"]
+    return out
+
+
 def _detect_edges(payload: Dict[str, Any]) -> Tuple[str, List[Dict[str, Any]]]:
     if isinstance(payload.get("items"), list):
         return "mbasic_items", payload.get("items") or []
@@ -81,42 +182,69 @@ def _detect_edges(payload: Dict[str, Any]) -> Tuple[str, List[Dict[str, Any]]]:
     return "unknown", []
 
 
-def _extract_source_urls(detected_format: str, rows: List[Dict[str, Any]]) -> List[Tuple[str, str, Optional[int]]]:
-    out: List[Tuple[str, str, Optional[int]]] = []
-
+def _source_from_row(detected_format: str, row: Dict[str, Any]) -> Optional[Tuple[str, str, Optional[int]]]:
     if detected_format == "mbasic_items":
-        for r in rows:
-            url = (r or {}).get("url") or ""
-            title = (r or {}).get("title") or ""
-            dur = (r or {}).get("duration")
-            if url:
-                out.append((url, title, dur if isinstance(dur, int) else None))
-        return out
+        url = (row or {}).get("url") or ""
+        title = (row or {}).get("title") or ""
+        dur = (row or {}).get("duration")
+        if url:
+            return url, title, dur if isinstance(dur, int) else None
+        return None
 
     if detected_format == "graphql_edges":
-        for e in rows:
-            node = (e or {}).get("node") or {}
-            savable = node.get("savable") or {}
-            url = savable.get("savable_permalink") or savable.get("url") or ""
+        node = (row or {}).get("node") or {}
+        savable = node.get("savable") or {}
+        url = savable.get("savable_permalink") or savable.get("url") or ""
+
+        title = ""
+        st = savable.get("savable_title") or {}
+        if isinstance(st, dict):
+            title = st.get("text") or ""
+        if not title:
+            t = savable.get("title")
+            if isinstance(t, dict):
+                title = t.get("text") or ""
+            elif isinstance(t, str):
+                title = t
+
+        dur = savable.get("playable_duration")
+        return url, title or "", dur if isinstance(dur, int) else None
 
-            title = ""
-            st = savable.get("savable_title") or {}
-            if isinstance(st, dict):
-                title = st.get("text") or ""
-            if not title:
-                t = savable.get("title")
-                if isinstance(t, dict):
-                    title = t.get("text") or ""
-                elif isinstance(t, str):
-                    title = t
-
-            dur = savable.get("playable_duration")
-            out.append((url, title or "", dur if isinstance(dur, int) else None))
-        return out
+    return None
 
+
+def _extract_source_urls(detected_format: str, rows: List[Dict[str, Any]]) -> List[Tuple[str, str, Optional[int]]]:
+    out: List[Tuple[str, str, Optional[int]]] = []
+    for r in rows:
+        src = _source_from_row(detected_format, r)
+        if src:
+            out.append(src)
     return out
 
 
+def _stream_source_rows(path: Path, limit: int) -> Tuple[str, List[Tuple[str, str, Optional[int]]], Dict[str, str]]:
+    """Stream a Phase-1 payload, stopping as soon as `limit` rows have been taken.
+
+    Returns (detected_format, rows, first_seen_by_url) without ever loading the whole file.
+    """
+    detected_format = "unknown"
+    out: List[Tuple[str, str, Optional[int]]] = []
+    first_seen: Dict[str, str] = {}
+    if limit <= 0:
+        return detected_format, out, first_seen
+    for fmt, row in iter_saved_rows(path):
+        detected_format = fmt
+        src = _source_from_row(fmt, row)
+        if not src:
+            continue
+        out.append(src)
+        if isinstance(row, dict) and row.get("first_seen_utc") and src[0]:
+            first_seen[src[0]] = row["first_seen_utc"]
+        if len(out) >= limit:
+            break
+    return detected_format, out, first_seen
+
+
 def _yt_dlp_exists() -> bool:
     try:
         subprocess.run(["yt-dlp", "--version"], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
@@ -125,32 +253,24 @@ def _yt_dlp_exists() -> bool:
         return False
 
 
-def _ensure_runtime_cookies(secrets_cookies: Path, runtime_cookies: Path) -> Optional[Path]:
-    if not secrets_cookies.exists():
-        return None
-    runtime_cookies.parent.mkdir(parents=True, exist_ok=True)
-    try:
-        shutil.copyfile(secrets_cookies, runtime_cookies)
-        return runtime_cookies
-    except Exception:
-        return secrets_cookies
-
-
-def _yt_dlp_info(url: str, cookies: Optional[Path], user_agent: Optional[str]) -> Tuple[Optional[str], Optional[int], Optional[str], Optional[str]]:
+def _yt_dlp_json(url: str, cookies: Optional[Path], user_agent: Optional[str], fmt: Optional[str] = None) -> Dict[str, Any]:
     cmd = ["yt-dlp", "-J", "--no-playlist", url]
+    if fmt:
+        cmd += ["-f", fmt]
     if user_agent:
         cmd += ["--user-agent", user_agent]
     if cookies and cookies.exists():
         cmd += ["--cookies", str(cookies)]
 
     try:
-        p = subprocess.run(cmd, capture_output=True, text=True, check=True)
-        data = json.loads(p.stdout or "{}")
-        resolved_url = data.get("url") or None
-        duration = data.get("duration") if isinstance(data.get("duration"), int) else None
-        title = data.get("title") or None
-        extractor = data.get("extractor_key") or data.get("extractor") or None
-        return resolved_url, duration, title, extractor
+        if trace.TRACER.enabled:
+            p = trace.run_staged(cmd)
+            if p.returncode != 0:
+                raise subprocess.CalledProcessError(p.returncode, cmd, p.stdout, p.stderr)
+        else:
+            p = subprocess.run(cmd, capture_output=True, text=True, check=True)
+        with trace.span("parse json"):
+            return json.loads(p.stdout or "{}")
     except subprocess.CalledProcessError as e:
         err = (e.stderr or e.stdout or "").strip()
         raise RuntimeError(err[:3000] if err else "yt-dlp failed")
@@ -158,78 +278,622 @@ def _yt_dlp_info(url: str, cookies: Optional[Path], user_agent: Optional[str]) -
         raise RuntimeError(str(e)[:3000])
 
 
-def _yt_dlp_download(url: str, cache_dir: Path, cookies: Optional[Path], user_agent: Optional[str]) -> str:
+def _info_fields(data: Dict[str, Any]) -> Tuple[Optional[str], Optional[int], Optional[str], Optional[str]]:
+    resolved_url = data.get("url") or None
+    duration = data.get("duration") if isinstance(data.get("duration"), int) else None
+    title = data.get("title") or None
+    extractor = data.get("extractor_key") or data.get("extractor") or None
+    return resolved_url, duration, title, extractor
+
+
+def _yt_dlp_info(
+    url: str, cookies: Optional[Path], user_agent: Optional[str], fmt: Optional[str] = None
+) -> Tuple[Optional[str], Optional[int], Optional[str], Optional[str]]:
+    return _info_fields(_yt_dlp_json(url, cookies=cookies, user_agent=user_agent, fmt=fmt))
+
+
+@dataclass
+class FormatPolicy:
+    """Byte-budget format selection applied to yt-dlp's format list (all limits optional)."""
+
+    max_height: Optional[int] = None
+    max_kbps: Optional[float] = None
+    max_bytes: Optional[int] = None
+    codecs: Tuple[str, ...] = ()  # preference order, e.g. ("h264", "vp9")
+    audio_only_over: Optional[int] = None  # seconds
+
+    def active(self) -> bool:
+        return any(v for v in (self.max_height, self.max_kbps, self.max_bytes, self.codecs, self.audio_only_over))
+
+
+_CODEC_PREFIXES = {
+    "h264": ("avc1", "avc", "h264"),
+    "avc": ("avc1", "avc", "h264"),
+    "h265": ("hvc1", "hev1", "hevc", "h265"),
+    "hevc": ("hvc1", "hev1", "hevc", "h265"),
+    "vp9": ("vp09", "vp9"),
+    "av1": ("av01", "av1"),
+}
+
+
+def _fmt_bytes(f: Dict[str, Any], duration: Optional[float]) -> Optional[int]:
+    size = f.get("filesize") or f.get("filesize_approx")
+    if size:
+        return int(size)
+    tbr = f.get("tbr")
+    return int(tbr * 125 * duration) if tbr and duration else None  # kbit/s -> bytes
+
+
+def _has_video(f: Dict[str, Any]) -> bool:
+    return (f.get("vcodec") or "none") != "none"
+
+
+def _has_audio(f: Dict[str, Any]) -> bool:
+    return (f.get("acodec") or "none") != "none"
+
+
+def _choose_format(data: Dict[str, Any], policy: FormatPolicy) -> Tuple[Optional[str], Optional[int], Optional[int], str]:
+    """Pick a yt-dlp format spec under the policy.
+
+    Returns (format_spec, est_bytes, best_bytes, note); format_spec None means "leave yt-dlp's default".
+    """
+    formats = [f for f in (data.get("formats") or []) if f.get("format_id")]
+    duration = data.get("duration") if isinstance(data.get("duration"), (int, float)) else None
+
+    default = data.get("requested_formats") or [data]
+    best_sizes = [_fmt_bytes(f, duration) for f in default]
+    best_bytes = sum(best_sizes) if best_sizes and all(best_sizes) else None
+    if not formats:
+        return None, best_bytes, best_bytes, "no format list"
+
+    audios = sorted([f for f in formats if _has_audio(f) and not _has_video(f)], key=lambda f: f.get("abr") or f.get("tbr") or 0)
+
+    if policy.audio_only_over and duration and duration > policy.audio_only_over and audios:
+        fits = [a for a in audios if not policy.max_bytes or (_fmt_bytes(a, duration) or 0) <= policy.max_bytes]
+        a = (fits or audios[:1])[-1]
+        return a["format_id"], _fmt_bytes(a, duration), best_bytes, f"audio-only {a.get('acodec')}"
+
+    # Candidates: progressive formats, and video-only + the best audio that fits.
+    candidates: List[Tuple[str, Dict[str, Any], Optional[int], float]] = []
+    audio = audios[-1] if audios else None
+    for f in formats:
+        if not _has_video(f):
+            continue
+        vbytes = _fmt_bytes(f, duration)
+        if _has_audio(f):
+            candidates.append((f["format_id"], f, vbytes, f.get("tbr") or 0))
+        elif audio:
+            abytes = _fmt_bytes(audio, duration)
+            total = vbytes + abytes if vbytes and abytes else None
+            kbps = (f.get("tbr") or 0) + (audio.get("tbr") or audio.get("abr") or 0)
+            candidates.append((f"{f['format_id']}+{audio['format_id']}", f, total, kbps))
+    if not candidates:
+        return None, best_bytes, best_bytes, "no video formats"
+
+    def codec_rank(f: Dict[str, Any]) -> int:
+        vc = (f.get("vcodec") or "").lower()
+        for i, name in enumerate(policy.codecs):
+            if vc.startswith(_CODEC_PREFIXES.get(name.lower(), (name.lower(),))):
+                return i
+        return len(policy.codecs)
+
+    def fits(c) -> bool:
+        _, f, size, kbps = c
+        if policy.max_height and (f.get("height") or 0) > policy.max_height:
+            return False
+        if policy.max_kbps and kbps and kbps > policy.max_kbps:
+            return False
+        if policy.max_bytes and size and size > policy.max_bytes:
+            return False
+        return True
+
+    ok = [c for c in candidates if fits(c)]
+    if ok:
+        spec, f, size, _ = min(ok, key=lambda c: (codec_rank(c[1]), -(c[1].get("height") or 0), -(c[3] or 0)))
+        note = f"{f.get('height') or '?'}p {f.get('vcodec')}"
+    else:
+        # Nothing meets the budget: take the smallest rendition rather than the largest.
+        spec, f, size, _ = min(candidates, key=lambda c: (c[2] or float("inf"), c[1].get("height") or 0))
+        note = f"{f.get('height') or '?'}p {f.get('vcodec')} (smallest; nothing met the policy)"
+    return spec, size, best_bytes, note
+
+
+def _yt_dlp_download(
+    url: str, cache_dir: Path, cookies: Optional[Path], user_agent: Optional[str], fmt: Optional[str] = None
+) -> str:
     cache_dir.mkdir(parents=True, exist_ok=True)
 
-    outtmpl = str(cache_dir / "facebook_%(id)s.%(ext)s")
-    cmd = ["yt-dlp", "--no-playlist", "-o", outtmpl, url]
+    # Sharded caches put the file in its bucket; the reel ID is known from the URL up front.
+    out_dir = cachelayout.target_dir(cache_dir, _reel_id(url))
+    outtmpl = str(out_dir / "facebook_%(id)s.%(ext)s")
+    # Ask yt-dlp for the final path instead of guessing the newest file in the cache.
+    # --no-mtime: the file's mtime is when it was cached, not the server's Last-Modified
+    # (fbreelz_archive.py reads cache age from it).
+    cmd = ["yt-dlp", "--no-playlist", "--no-simulate", "--no-mtime", "--print", "after_move:filepath", "-o", outtmpl, url]
+    if fmt:
+        cmd += ["-f", fmt]
     if user_agent:
         cmd += ["--user-agent", user_agent]
     if cookies and cookies.exists():
         cmd += ["--cookies", str(cookies)]
+    # Held back while someone is streaming from the cache (fbreelz_governor.py).
+    cmd += governor.ytdlp_args()
 
-    p = subprocess.run(cmd, capture_output=True, text=True)
+    with governor.lease():
+        if trace.TRACER.enabled:
+            # Stage markers on stdout split the run into extraction, transfer and post-processing.
+            p = trace.run_staged(cmd + trace.stage_args())
+        else:
+            p = subprocess.run(cmd, capture_output=True, text=True)
     if p.returncode != 0:
         err = (p.stderr or p.stdout or "").strip()
         raise RuntimeError(err[:3000] if err else "yt-dlp download failed")
 
-    # Best-effort: newest facebook_*.mp4
-    candidates = sorted(cache_dir.glob("facebook_*.mp4"), key=lambda x: x.stat().st_mtime, reverse=True)
-    if candidates:
-        return str(candidates[0])
+    lines = [ln.strip() for ln in (p.stdout or "").splitlines() if ln.strip()]
+    path = Path(lines[-1]) if lines else None
+    if not (path and path.is_file()):
+        rid = _reel_id(url)
+        path = cachelayout.find(cache_dir, rid) if rid else None
+    if not path:
+        raise RuntimeError("download succeeded but no file found in cache_dir")
+    with trace.span("manifest"):
+        cachelayout.record(cache_dir, path)
+    return str(path)
+
+
+def _reel_id(url: str) -> Optional[str]:
+    m = (
+        re.search(r"/reel/(\d+)", url or "")
+        or re.search(r"[?&]v=(\d+)", url or "")
+        or re.search(r"/videos/(?:[^/?#]+/)?(\d+)", url or "")
+    )
+    return m.group(1) if m else None
+
+
+def _entry(it: ItemOut, uri: str) -> playlists.Entry:
+    dur = it.duration if isinstance(it.duration, int) else -1
+    return playlists.Entry(_strip_newlines(it.title) or it.source_url, dur, uri, it.first_seen_utc)
 
-    any_files = sorted([x for x in cache_dir.iterdir() if x.is_file()], key=lambda x: x.stat().st_mtime, reverse=True)
-    if any_files:
-        return str(any_files[0])
 
-    raise RuntimeError("download succeeded but no file found in cache_dir")
+def _write_playlist(path: Path, title: str, entries: List[playlists.Entry], chunk: int = 0) -> None:
+    """Full playlist, plus the chunked set next to it (fbreelz_playlists.py) when chunk > 0."""
+    _write_text_atomic(path, playlists.render(title, entries))
+    if chunk > 0:
+        playlists.write_set(path, title, entries, chunk)
 
 
-def _write_m3u(path: Path, title: str, items: List[ItemOut]) -> None:
-    lines: List[str] = ["#EXTM3U", f"#PLAYLIST:{title}"]
+def _write_m3u(
+    path: Path, title: str, items: List[ItemOut], resolve_base: Optional[str] = None, chunk: int = 0
+) -> None:
+    """Direct playlist. With resolve_base, entries point at the resolve-on-play
+    server (/r/<id>) instead of baking in signed CDN URLs that expire."""
+    base = resolve_base.rstrip("/") if resolve_base else None
+    entries: List[playlists.Entry] = []
 
     for it in items:
-        t = _strip_newlines(it.title) or it.source_url
-        dur = it.duration if isinstance(it.duration, int) else -1
-        lines.append(f"#EXTINF:{dur},{t}")
-        lines.append(it.resolved_url or it.source_url)
+        if it.cleanup or it.hidden:
+            continue
+        rid = _reel_id(it.source_url) if base else None
+        entries.append(_entry(it, f"{base}/r/{rid}" if rid else (it.resolved_url or it.source_url)))
+
+    _write_playlist(path, title, entries, chunk)
+
 
-    path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+def _write_text_atomic(path: Path, text: str) -> None:
+    """Playlists are rewritten while players may be reading them: never expose a half-written file."""
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_text(text, encoding="utf-8")
+    tmp.replace(path)
 
 
-def _write_cache_m3u(path: Path, title: str, items: List[ItemOut], cache_dir: Path) -> None:
-    lines: List[str] = ["#EXTM3U", f"#PLAYLIST:{title}"]
+def _write_cache_m3u(path: Path, title: str, items: List[ItemOut], cache_dir: Path, chunk: int = 0) -> None:
+    entries: List[playlists.Entry] = []
     for it in items:
+        if not (it.downloaded_path or it.head_cached_path) or it.cleanup or it.hidden:
+            continue
         if not it.downloaded_path:
+            # Relative to the playlist, like cache/: NGINX proxies /m/ to the resolve server.
+            entries.append(_entry(it, f"m/{_reel_id(it.source_url)}"))
             continue
-        t = _strip_newlines(it.title) or it.source_url
-        dur = it.duration if isinstance(it.duration, int) else -1
-        lines.append(f"#EXTINF:{dur},{t}")
         try:
-            p = Path(it.downloaded_path)
-            rel = p.relative_to(cache_dir)
-            lines.append(str(Path("cache") / rel.name))
+            rel = Path(it.downloaded_path).relative_to(cache_dir)
+            entries.append(_entry(it, (Path("cache") / rel).as_posix()))
         except Exception:
-            lines.append(it.downloaded_path)
+            entries.append(_entry(it, it.downloaded_path))
 
-    path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+    _write_playlist(path, title, entries, chunk)
 
 
-def _write_http_m3u(path: Path, title: str, items: List[ItemOut], http_base: str) -> None:
+def _write_http_m3u(path: Path, title: str, items: List[ItemOut], http_base: str, chunk: int = 0) -> None:
     base = http_base.rstrip("/")
-    lines: List[str] = ["#EXTM3U", f"#PLAYLIST:{title}"]
+    entries: List[playlists.Entry] = []
     for it in items:
+        if not (it.downloaded_path or it.head_cached_path) or it.cleanup or it.hidden:
+            continue
         if not it.downloaded_path:
+            entries.append(_entry(it, f"{base}/m/{_reel_id(it.source_url)}"))
             continue
-        t = _strip_newlines(it.title) or it.source_url
-        dur = it.duration if isinstance(it.duration, int) else -1
-        lines.append(f"#EXTINF:{dur},{t}")
         # The file will be served from /app/data (host: /opt/fbreelz/data)
-        # So cache files are under /cache/<filename>
-        fname = Path(it.downloaded_path).name
-        lines.append(f"{base}/cache/{fname}")
+        # So cache files are under /cache/<filename> (or /cache/<shard>/<filename>)
+        entries.append(_entry(it, f"{base}/cache/{cachelayout.rel_path(it.downloaded_path)}"))
 
-    path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+    _write_playlist(path, title, entries, chunk)
+
+
+def _resolve_item(
+    it: ItemOut,
+    cookies: Optional[Path],
+    user_agent: Optional[str],
+    fmt: Optional[str] = None,
+    policy: Optional[FormatPolicy] = None,
+) -> None:
+    try:
+        data = _yt_dlp_json(it.source_url, cookies=cookies, user_agent=user_agent, fmt=fmt)
+        resolved_url, duration, title, extractor = _info_fields(data)
+        if policy and policy.active():
+            it.format_id, it.est_bytes, it.best_bytes, it.format_note = _choose_format(data, policy)
+            chosen = {f.get("format_id"): f for f in data.get("formats") or []}.get(it.format_id)
+            if chosen and chosen.get("url"):
+                resolved_url = chosen["url"]
+        elif it.est_bytes is None:
+            it.est_bytes = _fmt_bytes(data, duration)  # top level describes yt-dlp's default pick
+        it.resolved_url = resolved_url
+        it.duration = duration if duration is not None else it.duration
+        it.title = _strip_newlines(title) if title else (it.title or "")
+        it.extractor = extractor
+        it.thumbnail = data.get("thumbnail") or it.thumbnail
+        it.status = "ok"
+    except Exception as e:
+        it.status = "error"
+        it.error = str(e)
+
+
+def _download_item(it: ItemOut, cache_dir: Path, cookies: Optional[Path], user_agent: Optional[str]) -> bool:
+    try:
+        it.downloaded_path = _yt_dlp_download(
+            it.source_url, cache_dir=cache_dir, cookies=cookies, user_agent=user_agent, fmt=it.format_id
+        )
+        return True
+    except Exception as e:
+        it.status = "error"
+        it.error = (it.error or "") + f"\ndownload_error: {e}"
+        return False
+
+
+def _head_cache_item(it: ItemOut, cache_dir: Path, head_bytes: int) -> bool:
+    """Cache only the head (and moov) of the reel; the resolve server streams the rest."""
+    rid = _reel_id(it.source_url)
+    try:
+        if not rid or not it.resolved_url:
+            raise RuntimeError("no reel id or resolved URL")
+        heads = HeadCache(cache_dir / "head")
+        meta = heads.prime(rid, it.resolved_url, head_bytes)
+        it.head_cached_path = str(heads.media_path(rid))
+        if not meta.get("faststart"):
+            print(f"[INFO] {rid} is not faststart; cached its moov box as well")
+        return True
+    except Exception as e:
+        it.status = "error"
+        it.error = (it.error or "") + f"\nhead_cache_error: {e}"
+        return False
+
+
+def _fill_durations(items: List[ItemOut], cache_dir: Path) -> None:
+    """Missing durations from the cached file's moov box (fbreelz_mp4info.py); no network, no ffprobe."""
+    manifest = cachelayout.load_manifest(cache_dir)
+    filled = 0
+    for it in items:
+        if it.duration is not None or it.cleanup:
+            continue
+        path = Path(it.downloaded_path) if it.downloaded_path else None
+        if path is None:
+            rid = _reel_id(it.source_url)
+            path = cachelayout.find(cache_dir, rid, manifest) if rid else None
+        it.duration = fill_duration(None, path)
+        filled += it.duration is not None
+    if filled:
+        print(f"[OK] Filled {filled} missing duration(s) from cached files")
+
+
+def _drop_invalid_downloads(items: List[ItemOut], cache_dir: Path) -> None:
+    """Validate downloaded files (cached ffprobe results); bad ones are quarantined and unlisted."""
+    paths = {Path(it.downloaded_path) for it in items if it.downloaded_path and not it.cleanup}
+    results = validate(sorted(p for p in paths if p.exists()), cache_dir)
+    for it in items:
+        if not it.downloaded_path or it.cleanup:
+            continue
+        res = results.get(Path(it.downloaded_path))
+        if res is None or not res.ok:
+            reason = res.reason if res else "file missing"
+            it.downloaded_path = None
+            it.status = "error"
+            it.error = (it.error or "") + f"\nintegrity_error: {reason}"
+
+
+ORDER_POLICIES = ("saved", "newest", "shortest", "smallest")
+
+
+def _order_key(policy: str) -> Callable[[int, ItemOut], Tuple]:
+    """Download priority (lower first); ties keep Saved order."""
+    inf = float("inf")
+
+    def seen(it: ItemOut) -> float:
+        try:
+            return datetime.fromisoformat((it.first_seen_utc or "").replace("Z", "+00:00")).timestamp()
+        except ValueError:
+            return 0.0
+
+    return {
+        "saved": lambda i, it: (i,),
+        "newest": lambda i, it: (-seen(it), i),
+        "shortest": lambda i, it: (it.duration if it.duration is not None else inf, i),
+        "smallest": lambda i, it: (it.est_bytes or inf, i),
+    }[policy]
+
+
+class _DownloadScheduler:
+    """Resolved items wait in a priority heap; the downloader always takes the most wanted one."""
+
+    def __init__(self, key: Callable[[int, ItemOut], Tuple], expected: int) -> None:
+        self._key = key
+        self._heap: List[Tuple[Tuple, int, ItemOut]] = []
+        self._cond = threading.Condition()
+        self._expected = expected
+
+    def push(self, i: int, it: ItemOut) -> None:
+        with self._cond:
+            heapq.heappush(self._heap, (self._key(i, it), i, it))
+            self._cond.notify()
+
+    def skip(self) -> None:
+        """An item that will never be pushed (resolution failed)."""
+        with self._cond:
+            self._expected -= 1
+            self._cond.notify()
+
+    def pop(self) -> Optional[Tuple[int, ItemOut]]:
+        with self._cond:
+            while not self._heap and self._expected > 0:
+                self._cond.wait()
+            if not self._heap:
+                return None
+            self._expected -= 1
+            _, i, it = heapq.heappop(self._heap)
+            return i, it
+
+
+def _bytes_fetched(it: ItemOut) -> int:
+    """Bytes actually transferred for an item (head-cache files are sparse: count cached ranges)."""
+    try:
+        if it.downloaded_path:
+            return Path(it.downloaded_path).stat().st_size
+        if it.head_cached_path:
+            rid = _reel_id(it.source_url) or ""
+            meta = HeadCache(Path(it.head_cached_path).parent).meta(rid) or {}
+            return sum(e - s for s, e in meta.get("ranges") or [])
+    except OSError:
+        pass
+    return 0
+
+
+class _Throughput:
+    """ETA from measured bytes/second over finished downloads (not from item counts)."""
+
+    def __init__(self) -> None:
+        self.seconds = 0.0
+        self.bytes = 0
+        self.items = 0
+
+    def add(self, nbytes: int, seconds: float) -> None:
+        self.bytes += nbytes
+        self.seconds += seconds
+        self.items += 1
+
+    @property
+    def rate(self) -> float:
+        return self.bytes / max(1e-6, self.seconds)
+
+    def describe(self, remaining: List[ItemOut]) -> str:
+        if not self.items:
+            return "ETA: measuring"
+        rate = self.rate
+        avg = self.bytes / self.items
+        left = sum(it.est_bytes or avg for it in remaining)
+        eta = int(left / rate) if rate else 0
+        return f"{rate / 1e6:.1f} MB/s, ETA {eta // 60}m{eta % 60:02d}s for ~{left / 1e6:.0f} MB"
+
+
+def _parse_deadline(value: str) -> float:
+    """--deadline as epoch seconds: a duration (90m, 2h, 3600), a local clock time
+    (06:30; tomorrow if already past) or an ISO timestamp."""
+    v = value.strip()
+    m = re.fullmatch(r"(\d+(?:\.\d+)?)([smh]?)", v)
+    if m:
+        return time.time() + float(m.group(1)) * {"": 1, "s": 1, "m": 60, "h": 3600}[m.group(2)]
+    m = re.fullmatch(r"(\d{1,2}):(\d{2})", v)
+    if m:
+        now = datetime.now().astimezone()
+        at = now.replace(hour=int(m.group(1)), minute=int(m.group(2)), second=0, microsecond=0)
+        ts = at.timestamp()
+        return ts if ts > now.timestamp() else ts + 86400
+    try:
+        return datetime.fromisoformat(v.replace("Z", "+00:00")).timestamp()
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid deadline: {value!r} (use 90m, 2h, 06:30 or an ISO timestamp)")
+
+
+def _parse_bytes(value: str) -> int:
+    """--byte-budget: plain bytes or a K/M/G/T suffix (powers of 1024)."""
+    m = re.fullmatch(r"(\d+(?:\.\d+)?)\s*([kmgt]?)i?b?", value.strip().lower())
+    if not m:
+        raise argparse.ArgumentTypeError(f"invalid size: {value!r} (use e.g. 500M or 20G)")
+    return int(float(m.group(1)) * 1024 ** " kmgt".index(m.group(2) or " "))
+
+
+class _Budget:
+    """--deadline / --byte-budget: stop taking on downloads that would not fit."""
+
+    MARGIN = 1.25  # estimates are rough; leave headroom for the final writes
+
+    def __init__(self, deadline: Optional[float], byte_budget: Optional[int]) -> None:
+        self.deadline = deadline
+        self.byte_budget = byte_budget
+
+    def active(self) -> bool:
+        return self.deadline is not None or self.byte_budget is not None
+
+    def expired(self) -> bool:
+        return self.deadline is not None and time.time() >= self.deadline
+
+    def stop_reason(self, it: ItemOut, meter: _Throughput) -> Optional[str]:
+        """Why the next item should not be started, or None if it fits."""
+        est = it.est_bytes or (meter.bytes / meter.items if meter.items else None)
+        if self.byte_budget is not None:
+            if meter.bytes >= self.byte_budget:
+                return "byte budget used up"
+            if est and meter.bytes + est > self.byte_budget:
+                return f"byte budget: next item (~{est / 1e6:.1f} MB) would exceed it"
+        if self.deadline is not None:
+            left = self.deadline - time.time()
+            if left <= 0:
+                return "deadline reached"
+            if est and meter.items and est / meter.rate * self.MARGIN > left:
+                return f"deadline: next item (~{est / meter.rate:.0f}s) would not finish in the {left:.0f}s left"
+        return None
+
+
+def _load_resume(path: Path) -> Optional[Dict[str, Any]]:
+    try:
+        data = _load_json(path)
+    except (OSError, ValueError):
+        return None
+    return data if isinstance(data.get("pending"), list) else None
+
+
+def _pending_item(url: str, row: Dict[str, Any]) -> ItemOut:
+    """ItemOut for a phase2_resume.json pending row."""
+    return ItemOut(
+        source_url=url,
+        title=_strip_newlines(row.get("title") or ""),
+        duration=row.get("duration") if isinstance(row.get("duration"), int) else None,
+        first_seen_utc=row.get("first_seen_utc"),
+    )
+
+
+def _write_resume(path: Path, pending: List[ItemOut], reason: Optional[str]) -> None:
+    """Resume cursor: the items this run did not finish, in the order they were scheduled."""
+    if not pending:
+        path.unlink(missing_ok=True)
+        return
+    payload = {
+        "generated_at_utc": _utc_now_iso(),
+        "stopped": reason,
+        "pending": [
+            {"source_url": it.source_url, "title": it.title, "duration": it.duration, "first_seen_utc": it.first_seen_utc}
+            for it in pending
+        ],
+    }
+    _write_text_atomic(path, json.dumps(payload, indent=2, ensure_ascii=False))
+
+
+def _print_format_summary(items: List[ItemOut]) -> None:
+    picked = [it for it in items if it.format_id]
+    # Compare like with like: only items where both sizes are known.
+    sized = [it for it in picked if it.est_bytes and it.best_bytes]
+    est = sum(it.est_bytes for it in sized)
+    best = sum(it.best_bytes for it in sized)
+    print(f"[OK] Format policy applied to {len(picked)} item(s): ~{est / 1e6:.1f} MB vs ~{best / 1e6:.1f} MB best-quality"
+          + (f" ({len(sized)} with both sizes known)" if len(sized) != len(picked) else ""))
+    if best and est:
+        print(f"[OK] Estimated bytes saved: ~{max(0, best - est) / 1e6:.1f} MB ({100 * (1 - est / best):.0f}%)")
+
+
+def _write_outputs(
+    items_out: List[ItemOut],
+    *,
+    input_path: Path,
+    detected_format: str,
+    input_count: int,
+    out_path: Path,
+    m3u_path: Path,
+    cache_m3u_path: Path,
+    http_m3u_path: Path,
+    playlist_title: str,
+    download: bool,
+    http_base: Optional[str],
+    cache_dir: Path = DEFAULT_CACHE_DIR,
+    resolve_base: Optional[str] = None,
+    catalog_dir: Optional[Path] = DEFAULT_CATALOG_DIR,
+    catalog_page_size: int = DEFAULT_PAGE_SIZE,
+    playlist_chunk: int = 0,
+) -> None:
+    if download:
+        with trace.span("validate downloads"):
+            _drop_invalid_downloads(items_out, cache_dir)
+    with trace.span("fill durations"):
+        _fill_durations(items_out, cache_dir)
+
+    out_payload = {
+        "generated_at_utc": _utc_now_iso(),
+        "input": str(input_path),
+        "detected_format": detected_format,
+        "input_count": input_count,
+        "processed_count": input_count,
+        "resolved_count": len(items_out),
+        "items": [asdict(x) for x in items_out],
+    }
+
+    with trace.span("write resolved_items.json"):
+        # The catalog service and the watch daemon re-read this file on change.
+        _write_text_atomic(out_path, json.dumps(out_payload, indent=2, ensure_ascii=False))
+    _publish(
+        items_out,
+        m3u_path=m3u_path,
+        cache_m3u_path=cache_m3u_path,
+        http_m3u_path=http_m3u_path,
+        playlist_title=playlist_title,
+        download=download,
+        http_base=http_base,
+        cache_dir=cache_dir,
+        resolve_base=resolve_base,
+        catalog_dir=catalog_dir,
+        catalog_page_size=catalog_page_size,
+        playlist_chunk=playlist_chunk,
+    )
+
+
+def _publish(
+    items_out: List[ItemOut],
+    *,
+    m3u_path: Path,
+    cache_m3u_path: Path,
+    http_m3u_path: Path,
+    playlist_title: str,
+    download: bool,
+    http_base: Optional[str],
+    cache_dir: Path = DEFAULT_CACHE_DIR,
+    resolve_base: Optional[str] = None,
+    catalog_dir: Optional[Path] = DEFAULT_CATALOG_DIR,
+    catalog_page_size: int = DEFAULT_PAGE_SIZE,
+    playlist_chunk: int = 0,
+) -> None:
+    """Playlists and catalog shards for items_out (also used by fbreelz_dedupe.py after flagging)."""
+    with trace.span("write playlists"):
+        _write_m3u(m3u_path, playlist_title, items_out, resolve_base=resolve_base, chunk=playlist_chunk)
+        if download:
+            _write_cache_m3u(cache_m3u_path, f"{playlist_title} (Cache)", items_out, cache_dir=cache_dir, chunk=playlist_chunk)
+            if http_base:
+                _write_http_m3u(
+                    http_m3u_path, f"{playlist_title} (Cache HTTP)", items_out, http_base=str(http_base), chunk=playlist_chunk
+                )
+
+    if catalog_dir is not None:
+        rows = [(rid, asdict(x)) for x in items_out if not (x.cleanup or x.hidden) and (rid := _reel_id(x.source_url))]
+        try:
+            with trace.span("write catalog"):
+                write_catalog(rows, catalog_dir, page_size=catalog_page_size)
+        except OSError as e:
+            print(f"[WARN] Could not write catalog shards: {e}")
 
 
 def main() -> int:
@@ -245,19 +909,92 @@ def main() -> int:
     ap.add_argument("--download", action="store_true", help="Download media to /app/data/cache")
     ap.add_argument("--playlist-title", default="FBReelz", help="Playlist title")
     ap.add_argument("--user-agent", default=None, help="User-Agent to pass to yt-dlp")
+    ap.add_argument("--resolve-base", default=None,
+                    help="Point the direct playlist at the resolve-on-play server, e.g. http://YOUR_SERVER_IP (serves /r/<id>)")
+    ap.add_argument("--head-cache", type=int, default=0, metavar="BYTES",
+                    help="With --download, cache only the first BYTES of each reel (served via /m/<id>; 0 = full download)")
+    ap.add_argument("--max-height", type=int, default=None, help="Format policy: max video height, e.g. 720")
+    ap.add_argument("--max-kbps", type=float, default=None, help="Format policy: max total bitrate in kbit/s")
+    ap.add_argument("--max-bytes", type=int, default=None, help="Format policy: max estimated bytes per item")
+    ap.add_argument("--prefer-codec", default=None, help="Format policy: preferred video codecs in order, e.g. h264,vp9")
+    ap.add_argument("--audio-only-over", type=int, default=None, metavar="SECONDS",
+                    help="Format policy: download audio only for videos longer than this")
+    ap.add_argument("--delta", default=None,
+                    help="Phase-1 saved_delta.json: process only added items and merge into the existing --output")
+    ap.add_argument("--order", choices=ORDER_POLICIES, default="saved",
+                    help="Download priority: saved (list order), newest save, shortest duration or smallest estimated size first")
+    ap.add_argument("--resolve-workers", type=int, default=1,
+                    help="Parallel yt-dlp metadata lookups feeding the download scheduler (default: 1)")
+    ap.add_argument("--catalog-dir", default=str(DEFAULT_CATALOG_DIR),
+                    help=f"Write static feed shards here for NGINX (default: {DEFAULT_CATALOG_DIR})")
+    ap.add_argument("--catalog-page-size", type=int, default=DEFAULT_PAGE_SIZE, help=f"Items per catalog page (default: {DEFAULT_PAGE_SIZE})")
+    ap.add_argument("--no-catalog", action="store_true", help="Do not write catalog shards")
+    ap.add_argument("--playlist-chunk", type=int, default=0, metavar="N",
+                    help="Also write N-entry part playlists, per-day and shuffle playlists and <name>.index.m3u (0 = off)")
+    ap.add_argument("--deadline", type=_parse_deadline, default=None,
+                    help="Stop starting new work that will not finish by then: 90m, 2h, 06:30 or an ISO timestamp")
+    ap.add_argument("--byte-budget", type=_parse_bytes, default=None,
+                    help="Stop starting downloads once this much would be fetched this run, e.g. 20G")
+    ap.add_argument("--no-resume", action="store_true",
+                    help=f"Ignore {RESUME_FILE_NAME} left by a run that ran out of budget and process everything")
+    ap.add_argument("--bg-kbps", type=float, default=governor.DEFAULT_BG_KBPS,
+                    help=f"Download limit in kbit/s while someone is playing from the cache (default: {governor.DEFAULT_BG_KBPS:.0f}; 0 = off)")
+    ap.add_argument("--access-log", default=str(governor.DEFAULT_ACCESS_LOG),
+                    help=f"NGINX access log used to detect playback (default: {governor.DEFAULT_ACCESS_LOG})")
+    ap.add_argument("--trace", default=None, metavar="PATH",
+                    help="Record per-item stage spans as a Chrome/Perfetto trace JSON (see fbreelz_trace.py)")
+    ap.add_argument("--cprofile", default=None, metavar="PATH", help="Dump cProfile stats of the Python side here")
     args = ap.parse_args()
 
+    if args.trace:
+        trace.TRACER.enable()
+    trace.PROFILER.enabled = bool(args.cprofile)
+    try:
+        with trace.profiled():
+            return _run(args)
+    finally:
+        if args.trace:
+            trace.TRACER.write(Path(args.trace))
+        if args.cprofile:
+            trace.PROFILER.save(Path(args.cprofile))
+
+
+def _run(args: argparse.Namespace) -> int:
+    governor.configure(Path(args.access_log), args.bg_kbps)
+
     input_path = Path(args.input)
     out_path = Path(args.output)
     m3u_path = Path(args.m3u)
     cache_m3u_path = Path(args.cache_m3u)
     http_m3u_path = Path(args.http_m3u)
-
-    payload = _load_json(input_path)
-    detected_format, rows = _detect_edges(payload)
-
-    src_rows = _extract_source_urls(detected_format, rows)
-    src_rows = src_rows[: max(0, int(args.max))]
+    resume_path = out_path.with_name(RESUME_FILE_NAME)
+    budget = _Budget(args.deadline, args.byte_budget)
+    if args.deadline is not None:
+        print(f"[OK] Deadline: {datetime.fromtimestamp(args.deadline).astimezone().isoformat(timespec='minutes')}")
+
+    resume = None if args.no_resume else _load_resume(resume_path)
+    pending_rows: Dict[str, Dict[str, Any]] = {
+        r["source_url"]: r for r in (resume or {}).get("pending") or [] if isinstance(r, dict) and r.get("source_url")
+    }
+    if resume:
+        print(f"[OK] Resuming: {len(pending_rows)} item(s) left by the previous run ({resume.get('stopped') or 'stopped early'})")
+
+    previous: List[ItemOut] = []
+    removed: List[str] = []
+    if args.delta:
+        input_path = Path(args.delta)
+        delta = _load_json(input_path)
+        detected_format, rows = "graphql_edges", delta.get("added") or []
+        removed = [u for u in (delta.get("removed") or []) if isinstance(u, str)]
+        previous = _load_items(out_path)
+        print(f"[OK] Delta: {len(rows)} added, {len(removed)} removed (merging into {len(previous)} existing items)")
+        first_seen = _first_seen_by_url(detected_format, rows)
+        src_rows = _extract_source_urls(detected_format, rows)
+        src_rows = src_rows[: max(0, int(args.max))]
+    else:
+        # Stream the payload: --max stops parsing early instead of slicing afterwards.
+        with trace.span("read input"):
+            detected_format, src_rows, first_seen = _stream_source_rows(input_path, max(0, int(args.max)))
 
     use_ytdlp = (not args.no_ytdlp) and _yt_dlp_exists()
     if use_ytdlp:
@@ -268,71 +1005,201 @@ def main() -> int:
         else:
             print("[WARN] yt-dlp not available; will write playlists using source URLs.")
 
-    runtime_cookies = _ensure_runtime_cookies(DEFAULT_SECRETS_COOKIES, DEFAULT_RUNTIME_COOKIES)
-
-    items_out: List[ItemOut] = []
-
-    total = len(src_rows)
-    downloads_done = 0
-
-    for i, (url, title_hint, dur_hint) in enumerate(src_rows, 1):
-        title_hint = title_hint or ""
-        dur_hint = dur_hint if isinstance(dur_hint, int) else None
-
-        it = ItemOut(source_url=url, title=_strip_newlines(title_hint), duration=dur_hint)
-
-        if use_ytdlp:
-            try:
-                resolved_url, duration, title, extractor = _yt_dlp_info(url, cookies=runtime_cookies, user_agent=args.user_agent)
-                it.resolved_url = resolved_url
-                it.duration = duration if duration is not None else it.duration
-                it.title = _strip_newlines(title) if title else (it.title or "")
-                it.extractor = extractor
-                it.status = "ok"
-            except Exception as e:
-                it.status = "error"
-                it.error = str(e)
-
-        if args.download:
-            # download only if yt-dlp is available
-            if use_ytdlp:
-                try:
-                    # print progress before download starts
-                    label = it.title or it.source_url
-                    print(f"[DL] Downloaded {downloads_done} / {total}: (next) {label}")
-
-                    downloaded = _yt_dlp_download(url, cache_dir=DEFAULT_CACHE_DIR, cookies=runtime_cookies, user_agent=args.user_agent)
-                    it.downloaded_path = downloaded
-                    downloads_done += 1
-
-                    label2 = it.title or it.source_url
-                    print(f"[OK] Downloaded {downloads_done} / {total}: {label2}")
-                except Exception as e:
-                    it.status = "error"
-                    it.error = (it.error or "") + f"\ndownload_error: {e}"
-            else:
-                it.status = "error"
-                it.error = (it.error or "") + "\ndownload_error: yt-dlp not available"
-
-        items_out.append(it)
-
-    out_payload = {
-        "generated_at_utc": _utc_now_iso(),
-        "input": str(input_path),
-        "detected_format": detected_format,
-        "input_count": len(src_rows),
-        "processed_count": len(src_rows),
-        "resolved_count": len(items_out),
-        "items": [asdict(x) for x in items_out],
-    }
-
-    out_path.write_text(json.dumps(out_payload, indent=2, ensure_ascii=False), encoding="utf-8")
-    _write_m3u(m3u_path, args.playlist_title, items_out)
+    runtime_cookies = fbcookies.runtime_file(DEFAULT_SECRETS_COOKIES, DEFAULT_RUNTIME_COOKIES)
+    if use_ytdlp and runtime_cookies:
+        missing = fbcookies.load(DEFAULT_SECRETS_COOKIES).missing_auth()
+        if missing:
+            print(f"[WARN] {', '.join(missing)} missing or expired in {DEFAULT_SECRETS_COOKIES}; private reels will fail.")
+
+    policy = FormatPolicy(
+        max_height=args.max_height,
+        max_kbps=args.max_kbps,
+        max_bytes=args.max_bytes,
+        codecs=tuple(c.strip() for c in (args.prefer_codec or "").split(",") if c.strip()),
+        audio_only_over=args.audio_only_over,
+    )
 
-    if args.download:
-        _write_cache_m3u(cache_m3u_path, f"{args.playlist_title} (Cache)", items_out, cache_dir=DEFAULT_CACHE_DIR)
+    new_items = [
+        ItemOut(
+            source_url=url,
+            title=_strip_newlines(title_hint or ""),
+            duration=dur_hint if isinstance(dur_hint, int) else None,
+            first_seen_utc=first_seen.get(url),
+        )
+        for url, title_hint, dur_hint in src_rows
+    ]
+    if resume and not args.delta:
+        # Newer saves can push the previous run's pending items past the first --max rows.
+        # Merge them in (they are older, so they go last), then apply --max to the merged
+        # list, trimming the listed rows rather than the unfinished work.
+        cap = max(0, int(args.max))
+        listed = {it.source_url for it in new_items}
+        carried = [_pending_item(url, r) for url, r in pending_rows.items() if url not in listed][:cap]
+        new_items = new_items[: cap - len(carried)] + carried
+    items_out: List[ItemOut] = list(new_items)
+    # Keep fbreelz_dedupe.py's verdicts across full runs; deleted copies are not fetched again.
+    dupes = _known_duplicates(out_path.parent / DUPLICATES_FILE_NAME)
+    skip_download: Set[str] = set()
+    for it in new_items:
+        known = dupes.get(_reel_id(it.source_url) or "")
+        if known:
+            it.duplicate_of, it.hidden = known[0], known[1]
+            if known[2]:
+                skip_download.add(it.source_url)
+
+    if args.delta:
+        # Merge up front so progressive playlists already include the existing library.
+        fresh = {it.source_url for it in new_items}
+        gone = set(removed)
+        # Items a budgeted run left unfinished are redone in place.
+        resumed = {
+            url: _pending_item(url, r) for url, r in pending_rows.items() if url not in fresh and url not in gone
+        }
+        new_items.extend(resumed.values())
+        marked = 0
+        for it in previous:
+            if it.source_url in fresh:
+                continue
+            if it.source_url in gone and not it.cleanup:
+                it.cleanup = True
+                marked += 1
+            items_out.append(resumed.pop(it.source_url, it))
+        items_out.extend(resumed.values())
+        if marked:
+            print(f"[OK] Marked {marked} removed item(s) for cache cleanup")
+    elif resume:
+        # Reuse what the interrupted run finished; redo its pending items and anything new.
+        done = {it.source_url: it for it in _load_items(out_path) if it.status == "ok" and it.source_url not in pending_rows}
+        items_out = [done.get(it.source_url, it) for it in new_items]
+        new_items = [it for it in new_items if it.source_url not in done]
+        print(f"[OK] Reusing {len(items_out) - len(new_items)} finished item(s); {len(new_items)} to process")
+
+    total = len(new_items)
+    downloading = args.download and use_ytdlp
+    if args.download and not use_ytdlp:
+        for it in new_items:
+            it.status = "error"
+            it.error = (it.error or "") + "\ndownload_error: yt-dlp not available"
+
+    sched = _DownloadScheduler(_order_key(args.order), total) if downloading else None
+    stopped: Optional[str] = None
+
+    def resolve(i: int, it: ItemOut) -> None:
+        try:
+            if stopped or budget.expired():
+                it.status = "deferred"
+            elif use_ytdlp:
+                trace.TRACER.name_track(i + 1, f"{i + 1}: {it.title or it.source_url}")
+                # Head caching needs one progressive file URL ("b"), not separate video/audio.
+                with trace.track(i + 1), trace.profiled(), trace.span("resolve", url=it.source_url):
+                    _resolve_item(
+                        it,
+                        cookies=runtime_cookies,
+                        user_agent=args.user_agent,
+                        fmt="b" if args.head_cache else None,
+                        policy=None if args.head_cache else policy,
+                    )
+        finally:
+            if sched is not None:
+                # A failed `yt-dlp -J` still gets a download attempt (as before the scheduler):
+                # the download can succeed where the metadata call did not. Head caching
+                # needs the resolved URL, so it only takes resolved items.
+                attempt = it.status == "ok" or (it.status == "error" and not args.head_cache)
+                if attempt and it.source_url not in skip_download:
+                    sched.push(i, it)
+                else:
+                    sched.skip()
+
+    def publish_progress() -> None:
+        """Rewrite the cache playlists so finished items are playable straight away."""
+        chunk = args.playlist_chunk
+        _write_cache_m3u(cache_m3u_path, f"{args.playlist_title} (Cache)", items_out, cache_dir=DEFAULT_CACHE_DIR, chunk=chunk)
         if args.http_base:
-            _write_http_m3u(http_m3u_path, f"{args.playlist_title} (Cache HTTP)", items_out, http_base=str(args.http_base))
+            _write_http_m3u(
+                http_m3u_path, f"{args.playlist_title} (Cache HTTP)", items_out, http_base=str(args.http_base), chunk=chunk
+            )
+
+    # Resolution runs ahead in the background; downloads follow --order over whatever is resolved.
+    pool = ThreadPoolExecutor(max_workers=max(1, args.resolve_workers))
+    futures = [pool.submit(resolve, i, it) for i, it in enumerate(new_items)]
+
+    if downloading:
+        if args.order != "saved":
+            print(f"[OK] Download order: {args.order} first")
+        meter = _Throughput()
+        downloads_done = 0
+        attempted = 0
+        while True:
+            nxt = sched.pop()
+            if nxt is None:
+                break
+            i, it = nxt
+            label = it.title or it.source_url
+            why = budget.stop_reason(it, meter) if budget.active() else None
+            if why:
+                # Stop taking on work; items still resolving see `stopped` and defer themselves.
+                stopped = why
+                print(f"[INFO] Stopping downloads: {why}")
+                break
+            attempted += 1
+            remaining = [x for x in new_items if x.status == "ok" and not (x.downloaded_path or x.head_cached_path)]
+            print(f"[DL] Downloaded {downloads_done} / {total} ({meter.describe(remaining)}): (next) {label}")
+
+            t0 = time.monotonic()
+            with trace.track(i + 1):
+                with trace.span("download"):
+                    if args.head_cache:
+                        ok = _head_cache_item(it, cache_dir=DEFAULT_CACHE_DIR, head_bytes=args.head_cache)
+                    else:
+                        ok = _download_item(it, cache_dir=DEFAULT_CACHE_DIR, cookies=runtime_cookies, user_agent=args.user_agent)
+                if ok:
+                    downloads_done += 1
+                    meter.add(_bytes_fetched(it), time.monotonic() - t0)
+                    verb = "Head-cached" if args.head_cache else "Downloaded"
+                    print(f"[OK] {verb} {downloads_done} / {total}: {label}")
+                    with trace.span("playlist write"):
+                        publish_progress()
+
+    for f in futures:
+        f.result()
+    pool.shutdown()
+
+    if stopped is None and budget.expired():
+        stopped = "deadline reached"
+    pending = [
+        it for it in new_items
+        if it.status == "deferred"
+        or (
+            downloading and it.status == "ok" and it.source_url not in skip_download
+            and not (it.downloaded_path or it.head_cached_path)
+        )
+    ]
+    _write_resume(resume_path, pending, stopped)
+    if pending:
+        print(f"[INFO] {len(pending)} item(s) left for the next run ({stopped or 'not finished'}): {resume_path}")
+    elif resume:
+        print("[OK] Resume cursor cleared: previous run's work is complete")
+
+    if policy.active():
+        _print_format_summary(items_out)
+
+    _write_outputs(
+        items_out,
+        input_path=input_path,
+        detected_format=detected_format,
+        input_count=len(src_rows),
+        out_path=out_path,
+        m3u_path=m3u_path,
+        cache_m3u_path=cache_m3u_path,
+        http_m3u_path=http_m3u_path,
+        playlist_title=args.playlist_title,
+        download=args.download,
+        http_base=args.http_base,
+        resolve_base=args.resolve_base,
+        catalog_dir=None if args.no_catalog else Path(args.catalog_dir),
+        catalog_page_size=args.catalog_page_size,
+        playlist_chunk=args.playlist_chunk,
+    )
 
     print(f"[OK] Wrote resolved items to: {out_path}")
     print(f"[OK] Wrote VLC playlist to: {m3u_path}")
@@ -0,0 +1,474 @@
+## version 1
+"""FBReelz job queue: durable resolve/download/post-process jobs drained by any number of workers.
+
+Purpose
+- Phase 2 does every resolve and download in one process on one box.
+- With the queue, Phase 1 (--enqueue) only records jobs in a SQLite database on
+  the data volume; worker processes on this host or on other hosts sharing the
+  volume claim jobs with a lease, run them, and hand the result to the next stage:
+    resolve (yt-dlp metadata) -> download -> postprocess (integrity check) -> publish
+- A worker that dies simply lets its lease expire and the job is picked up again.
+  Failed jobs are retried with exponential backoff, up to 4 attempts per job.
+- "publish" is a singleton job: one worker at a time rebuilds resolved_items.json,
+  the playlists and the catalog shards from the finished items (debounced).
+
+Usage
+  python fbreelz_queue.py --enqueue /app/data/saved_items.json --download   # seed from an existing Phase-1 run
+  python fbreelz_queue.py --download --http-base http://YOUR_SERVER_IP       # run a worker (start several)
+  python fbreelz_queue.py --status
+
+Database: <data>/jobs.sqlite (tables: jobs, items)
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+import fbreelz_cookies as fbcookies
+import fbreelz_phase2_resolve as phase2
+
+
+DEFAULT_DATA_DIR = Path(os.environ.get("FBREELZ_DATA_DIR", "/app/data"))
+DB_NAME = "jobs.sqlite"
+KINDS = ("resolve", "download", "postprocess", "publish")
+DEFAULT_LEASE = 15 * 60
+DEFAULT_MAX_ATTEMPTS = 4
+RETRY_BASE = 60  # seconds; doubled per failed attempt
+PUBLISH_DEBOUNCE = 10
+MAX_REDOWNLOADS = 2
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY,
+    kind TEXT NOT NULL,
+    key TEXT NOT NULL,
+    payload TEXT NOT NULL DEFAULT '{}',
+    state TEXT NOT NULL DEFAULT 'queued',   -- queued | leased | done | failed
+    priority INTEGER NOT NULL DEFAULT 0,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL DEFAULT 4,
+    not_before REAL NOT NULL DEFAULT 0,     -- while leased with rerun = 1: the rerun's delay in seconds
+    lease_owner TEXT,
+    lease_until REAL,
+    rerun INTEGER NOT NULL DEFAULT 0,       -- re-queued while leased: run again after this one
+    error TEXT,
+    updated REAL NOT NULL,
+    UNIQUE (kind, key)
+);
+CREATE INDEX IF NOT EXISTS jobs_ready ON jobs (state, kind, priority DESC, id);
+CREATE TABLE IF NOT EXISTS items (
+    url TEXT PRIMARY KEY,
+    position INTEGER NOT NULL DEFAULT 0,    -- Saved order, newest first
+    data TEXT,                              -- ItemOut as JSON once resolved
+    updated REAL NOT NULL
+);
+"""
+
+
+@dataclass
+class Job:
+    id: int
+    kind: str
+    key: str
+    payload: Dict[str, Any]
+    attempts: int
+    max_attempts: int
+
+
+class JobQueue:
+    """SQLite-backed queue. One instance per thread (sqlite connections are not shared)."""
+
+    def __init__(self, path: Path) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.path = path
+        # Rollback journal (not WAL): WAL needs shared memory, which breaks on network volumes.
+        self.db = sqlite3.connect(str(path), timeout=60, isolation_level=None)
+        self.db.execute("PRAGMA busy_timeout = 60000")
+        self.db.executescript(_SCHEMA)
+
+    def _tx(self):
+        return _Tx(self.db)
+
+    def enqueue(
+        self,
+        kind: str,
+        key: str,
+        payload: Optional[Dict[str, Any]] = None,
+        priority: int = 0,
+        requeue: bool = False,
+        delay: float = 0,
+        max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+    ) -> None:
+        """Add a job; an existing (kind, key) is left alone unless requeue=True."""
+        now = time.time()
+        body = json.dumps(payload or {}, ensure_ascii=False)
+        with self._tx():
+            row = self.db.execute("SELECT state FROM jobs WHERE kind = ? AND key = ?", (kind, key)).fetchone()
+            if row is None:
+                self.db.execute(
+                    "INSERT INTO jobs (kind, key, payload, priority, max_attempts, not_before, updated) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (kind, key, body, priority, max_attempts, now + delay, now),
+                )
+            elif requeue and row[0] == "leased":
+                # not_before is unused while leased; keep the delay for complete()/fail().
+                self.db.execute(
+                    "UPDATE jobs SET rerun = 1, payload = ?, not_before = ? WHERE kind = ? AND key = ?", (body, delay, kind, key)
+                )
+            elif requeue and row[0] in ("done", "failed"):
+                self.db.execute(
+                    "UPDATE jobs SET state = 'queued', payload = ?, attempts = 0, error = NULL, not_before = ?, updated = ? "
+                    "WHERE kind = ? AND key = ?",
+                    (body, now + delay, now, kind, key),
+                )
+
+    def claim(self, kinds: Iterable[str], owner: str, lease: float = DEFAULT_LEASE) -> Optional[Job]:
+        """Lease the next runnable job (queued, or leased by a worker whose lease ran out)."""
+        kinds = list(kinds)
+        now = time.time()
+        marks = ",".join("?" * len(kinds))
+        with self._tx():
+            row = self.db.execute(
+                f"SELECT id, kind, key, payload, attempts, max_attempts FROM jobs "
+                f"WHERE kind IN ({marks}) AND ((state = 'queued' AND not_before <= ?) OR (state = 'leased' AND lease_until < ?)) "
+                f"ORDER BY priority DESC, id LIMIT 1",
+                (*kinds, now, now),
+            ).fetchone()
+            if row is None:
+                return None
+            self.db.execute(
+                "UPDATE jobs SET state = 'leased', lease_owner = ?, lease_until = ?, attempts = attempts + 1, updated = ? WHERE id = ?",
+                (owner, now + lease, now, row[0]),
+            )
+        return Job(row[0], row[1], row[2], json.loads(row[3] or "{}"), row[4] + 1, row[5])
+
+    def heartbeat(self, job: Job, owner: str, lease: float = DEFAULT_LEASE) -> bool:
+        cur = self.db.execute(
+            "UPDATE jobs SET lease_until = ? WHERE id = ? AND state = 'leased' AND lease_owner = ?",
+            (time.time() + lease, job.id, owner),
+        )
+        return cur.rowcount == 1
+
+    def complete(self, job: Job, owner: str) -> bool:
+        """Mark done. False if the lease was lost (another worker owns the job now)."""
+        now = time.time()
+        with self._tx():
+            cur = self.db.execute(
+                "UPDATE jobs SET state = CASE rerun WHEN 1 THEN 'queued' ELSE 'done' END, "
+                "not_before = CASE rerun WHEN 1 THEN ? + not_before ELSE not_before END, rerun = 0, attempts = 0, "
+                "error = NULL, lease_owner = NULL, lease_until = NULL, updated = ? WHERE id = ? AND lease_owner = ?",
+                (now, now, job.id, owner),
+            )
+        return cur.rowcount == 1
+
+    def fail(self, job: Job, owner: str, error: str) -> str:
+        """Schedule a retry with backoff, or give up after max_attempts. Returns the new state.
+
+        A job re-queued while it ran is queued again as a fresh request (attempts reset).
+        """
+        now = time.time()
+        state = "failed" if job.attempts >= job.max_attempts else "queued"
+        with self._tx():
+            row = self.db.execute(
+                "SELECT rerun, not_before FROM jobs WHERE id = ? AND lease_owner = ?", (job.id, owner)
+            ).fetchone()
+            if row is None:
+                return state
+            if row[0]:
+                state = "queued"
+                self.db.execute(
+                    "UPDATE jobs SET state = 'queued', rerun = 0, attempts = 0, error = ?, not_before = ?, "
+                    "lease_owner = NULL, lease_until = NULL, updated = ? WHERE id = ?",
+                    (error[:2000], now + max(row[1], RETRY_BASE), now, job.id),
+                )
+            else:
+                self.db.execute(
+                    "UPDATE jobs SET state = ?, error = ?, not_before = ?, lease_owner = NULL, lease_until = NULL, updated = ? "
+                    "WHERE id = ?",
+                    (state, error[:2000], now + RETRY_BASE * 2 ** (job.attempts - 1), now, job.id),
+                )
+        return state
+
+    def stats(self) -> Dict[Tuple[str, str], int]:
+        return {(k, s): n for k, s, n in self.db.execute("SELECT kind, state, COUNT(*) FROM jobs GROUP BY kind, state")}
+
+    def pending(self, kinds: Iterable[str]) -> int:
+        kinds = list(kinds)
+        marks = ",".join("?" * len(kinds))
+        return self.db.execute(
+            f"SELECT COUNT(*) FROM jobs WHERE kind IN ({marks}) AND state IN ('queued', 'leased')", kinds
+        ).fetchone()[0]
+
+    # -- items ------------------------------------------------------------
+    def set_order(self, urls: List[str]) -> None:
+        """Record Saved order (newest first) for every URL in a snapshot."""
+        now = time.time()
+        with self._tx():
+            self.db.executemany(
+                "INSERT INTO items (url, position, updated) VALUES (?, ?, ?) "
+                "ON CONFLICT (url) DO UPDATE SET position = excluded.position",
+                [(u, i, now) for i, u in enumerate(urls)],
+            )
+
+    def load_item(self, url: str) -> Optional[phase2.ItemOut]:
+        row = self.db.execute("SELECT data FROM items WHERE url = ?", (url,)).fetchone()
+        if not row or not row[0]:
+            return None
+        fields = set(phase2.ItemOut.__dataclass_fields__)
+        return phase2.ItemOut(**{k: v for k, v in json.loads(row[0]).items() if k in fields})
+
+    def save_item(self, it: phase2.ItemOut) -> None:
+        now = time.time()
+        body = json.dumps(asdict(it), ensure_ascii=False)
+        with self._tx():
+            self.db.execute(
+                "INSERT INTO items (url, position, data, updated) VALUES (?, (SELECT COALESCE(MAX(position), -1) + 1 FROM items), ?, ?) "
+                "ON CONFLICT (url) DO UPDATE SET data = excluded.data, updated = excluded.updated",
+                (it.source_url, body, now),
+            )
+
+    def mark_removed(self, urls: Iterable[str]) -> int:
+        marked = 0
+        for url in urls:
+            it = self.load_item(url)
+            if it and not it.cleanup:
+                it.cleanup = True
+                self.save_item(it)
+                marked += 1
+        return marked
+
+    def finished_items(self) -> List[phase2.ItemOut]:
+        fields = set(phase2.ItemOut.__dataclass_fields__)
+        out: List[phase2.ItemOut] = []
+        for (data,) in self.db.execute("SELECT data FROM items WHERE data IS NOT NULL ORDER BY position, url"):
+            out.append(phase2.ItemOut(**{k: v for k, v in json.loads(data).items() if k in fields}))
+        return out
+
+
+class _Tx:
+    """BEGIN IMMEDIATE ... COMMIT: take the write lock up front so claims never race."""
+
+    def __init__(self, db: sqlite3.Connection) -> None:
+        self.db = db
+
+    def __enter__(self) -> None:
+        self.db.execute("BEGIN IMMEDIATE")
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.db.execute("ROLLBACK" if exc_type else "COMMIT")
+
+
+def enqueue_snapshot(
+    q: JobQueue,
+    rows: List[Tuple[str, str, Optional[int]]],
+    first_seen: Dict[str, str],
+    order: Optional[List[str]] = None,
+    removed: Iterable[str] = (),
+    download: bool = False,
+) -> int:
+    """Queue a resolve job per (url, title_hint, duration_hint) row; Phase 1 --enqueue calls this."""
+    if order:
+        q.set_order(order)
+    for url, title, dur in rows:
+        q.enqueue("resolve", url, {"title": title or "", "duration": dur, "first_seen_utc": first_seen.get(url), "download": download})
+    marked = q.mark_removed(removed)
+    if marked or rows:
+        q.enqueue("publish", "all", requeue=True, delay=PUBLISH_DEBOUNCE)
+    return len(rows)
+
+
+class Worker:
+    def __init__(self, args: argparse.Namespace, owner: str) -> None:
+        self.args = args
+        self.owner = owner
+        self.data_dir = Path(args.data_dir)
+        self.cache_dir = self.data_dir / "cache"
+        self.q = JobQueue(self.data_dir / DB_NAME)
+        self.cookies = fbcookies.runtime_file(phase2.DEFAULT_SECRETS_COOKIES, phase2.DEFAULT_RUNTIME_COOKIES)
+        self.handlers: Dict[str, Callable[[Job], None]] = {
+            "resolve": self._resolve,
+            "download": self._download,
+            "postprocess": self._postprocess,
+            "publish": self._publish,
+        }
+
+    def _item(self, job: Job) -> phase2.ItemOut:
+        it = self.q.load_item(job.key)
+        if it is None:
+            p = job.payload
+            it = phase2.ItemOut(
+                source_url=job.key,
+                title=phase2._strip_newlines(p.get("title") or ""),
+                duration=p.get("duration") if isinstance(p.get("duration"), int) else None,
+                first_seen_utc=p.get("first_seen_utc"),
+            )
+        return it
+
+    def _publish_soon(self) -> None:
+        self.q.enqueue("publish", "all", requeue=True, delay=PUBLISH_DEBOUNCE)
+
+    def _resolve(self, job: Job) -> None:
+        it = self._item(job)
+        it.status, it.error = "ok", None
+        phase2._resolve_item(it, cookies=self.cookies, user_agent=self.args.user_agent)
+        self.q.save_item(it)
+        if it.status != "ok":
+            raise RuntimeError(it.error or "resolve failed")
+        if job.payload.get("download") or self.args.download:
+            self.q.enqueue("download", job.key, requeue=True)
+        self._publish_soon()
+
+    def _download(self, job: Job) -> None:
+        it = self._item(job)
+        it.status, it.error = "ok", None
+        if not phase2._download_item(it, cache_dir=self.cache_dir, cookies=self.cookies, user_agent=self.args.user_agent):
+            self.q.save_item(it)
+            raise RuntimeError(it.error or "download failed")
+        self.q.save_item(it)
+        self.q.enqueue("postprocess", job.key, job.payload, requeue=True)
+
+    def _postprocess(self, job: Job) -> None:
+        it = self._item(job)
+        if it.downloaded_path:
+            phase2._drop_invalid_downloads([it], self.cache_dir)
+            self.q.save_item(it)
+            if not it.downloaded_path:
+                # Quarantined as corrupt: fetch it again, a limited number of times.
+                n = int(job.payload.get("redownloads") or 0)
+                if n < MAX_REDOWNLOADS:
+                    self.q.enqueue("download", job.key, {"redownloads": n + 1}, requeue=True)
+                    return
+                it.status, it.error = "error", f"download_error: still corrupt after {n} re-downloads"
+                self.q.save_item(it)
+        self._publish_soon()
+
+    def _publish(self, job: Job) -> None:
+        items = self.q.finished_items()
+        d = self.data_dir
+        phase2._write_outputs(
+            items,
+            input_path=d / DB_NAME,
+            detected_format="queue",
+            input_count=len(items),
+            out_path=d / "resolved_items.json",
+            m3u_path=d / "fbreelz.m3u",
+            cache_m3u_path=d / "fbreelz_cache.m3u",
+            http_m3u_path=d / "fbreelz_cache_http.m3u",
+            playlist_title=self.args.playlist_title,
+            download=any(it.downloaded_path for it in items),
+            http_base=self.args.http_base,
+            cache_dir=self.cache_dir,
+            resolve_base=self.args.resolve_base,
+            catalog_dir=d / "catalog",
+        )
+        print(f"[OK] Published {len(items)} item(s) to {d}")
+
+    def run_one(self, job: Job) -> None:
+        stop = threading.Event()
+
+        def beat() -> None:
+            hq = JobQueue(self.q.path)
+            while not stop.wait(self.args.lease / 3):
+                if not hq.heartbeat(job, self.owner, self.args.lease):
+                    print(f"[WARN] Lost lease on {job.kind} {job.key}")
+                    return
+
+        hb = threading.Thread(target=beat, daemon=True)
+        hb.start()
+        try:
+            self.handlers[job.kind](job)
+        except Exception as e:
+            state = self.q.fail(job, self.owner, str(e))
+            verb = "giving up" if state == "failed" else "will retry"
+            print(f"[WARN] {job.kind} failed (attempt {job.attempts}/{job.max_attempts}, {verb}): {job.key}: {str(e)[:300]}")
+            if state == "failed" and job.kind != "publish":
+                self._publish_soon()  # list the item with its error
+            return
+        finally:
+            stop.set()
+        if self.q.complete(job, self.owner):
+            print(f"[OK] {job.kind} done: {job.key}")
+
+    def loop(self, kinds: List[str]) -> None:
+        while True:
+            job = self.q.claim(kinds, self.owner, self.args.lease)
+            if job is None:
+                if self.args.drain and not self.q.pending(kinds):
+                    return
+                time.sleep(self.args.poll)
+                continue
+            print(f"[JOB] {job.kind} (attempt {job.attempts}): {job.key}")
+            self.run_one(job)
+
+
+def _print_status(q: JobQueue) -> None:
+    stats = q.stats()
+    states = ("queued", "leased", "done", "failed")
+    print(f"{'kind':<12}" + "".join(f"{s:>8}" for s in states))
+    for kind in KINDS:
+        print(f"{kind:<12}" + "".join(f"{stats.get((kind, s), 0):>8}" for s in states))
+    for kind, key, err in q.db.execute("SELECT kind, key, error FROM jobs WHERE state = 'failed' ORDER BY updated DESC LIMIT 10"):
+        print(f"[FAILED] {kind} {key}: {(err or '').splitlines()[0][:200] if err else ''}")
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="FBReelz durable job queue worker (resolve/download/postprocess/publish)")
+    ap.add_argument("--data-dir", default=str(DEFAULT_DATA_DIR), help=f"Shared data directory (default: {DEFAULT_DATA_DIR})")
+    ap.add_argument("--enqueue", default=None, metavar="SAVED_JSON", help="Queue resolve jobs for a Phase-1 JSON, then exit")
+    ap.add_argument("--status", action="store_true", help="Print queue counts and recent failures, then exit")
+    ap.add_argument("--kinds", default=",".join(KINDS), help=f"Job kinds this worker runs (default: {','.join(KINDS)})")
+    ap.add_argument("--threads", type=int, default=1, help="Worker threads in this process (default: 1)")
+    ap.add_argument("--lease", type=float, default=DEFAULT_LEASE, help=f"Lease seconds, renewed while a job runs (default: {DEFAULT_LEASE})")
+    ap.add_argument("--poll", type=float, default=5.0, help="Idle poll interval in seconds (default: 5)")
+    ap.add_argument("--drain", action="store_true", help="Exit once no runnable or running jobs are left")
+    ap.add_argument("--download", action="store_true", help="Download every resolved item (also settable per job at enqueue time)")
+    ap.add_argument("--http-base", default=None, help="Base URL for the HTTP cache playlist, e.g. http://YOUR_SERVER_IP")
+    ap.add_argument("--resolve-base", default=None, help="Point the direct playlist at the resolve-on-play server")
+    ap.add_argument("--playlist-title", default="FBReelz", help="Playlist title")
+    ap.add_argument("--user-agent", default=None, help="User-Agent to pass to yt-dlp")
+    args = ap.parse_args()
+
+    data_dir = Path(args.data_dir)
+    q = JobQueue(data_dir / DB_NAME)
+
+    if args.status:
+        _print_status(q)
+        return 0
+
+    if args.enqueue:
+        fmt, rows, first_seen = phase2._stream_source_rows(Path(args.enqueue), 1 << 30)
+        n = enqueue_snapshot(q, rows, first_seen, order=[u for u, _, _ in rows], download=args.download)
+        print(f"[OK] Queued {n} resolve job(s) from {args.enqueue} ({fmt})")
+        return 0
+
+    kinds = [k.strip() for k in args.kinds.split(",") if k.strip() in KINDS]
+    if not phase2._yt_dlp_exists() and set(kinds) & {"resolve", "download"}:
+        raise SystemExit("[ERR] yt-dlp not available (run with --kinds postprocess,publish on hosts without it)")
+
+    owner = f"{socket.gethostname()}:{os.getpid()}"
+    print(f"[OK] Worker {owner} on {data_dir / DB_NAME} (kinds={','.join(kinds)}, threads={args.threads})")
+    # Each thread builds its own Worker: sqlite connections stay on the thread that opened them.
+    threads = [
+        threading.Thread(target=lambda i=i: Worker(args, f"{owner}/{i}").loop(kinds), daemon=True)
+        for i in range(max(1, args.threads))
+    ]
+    for t in threads:
+        t.start()
+    try:
+        for t in threads:
+            t.join()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,395 @@
+## version 1
+"""FBReelz cache replication: one primary scrapes and downloads, edge boxes mirror it.
+
+Purpose
+- Every playback location ran its own Phase 1 + Phase 2, doubling the scraping
+  load and the downloads from Facebook.
+- The primary publishes replica_manifest.json: size + sha256 of every cached media
+  file, cache/.layout, resolved_items.json and the playlists. Hashes are reused
+  from the previous manifest (and the cache manifest) while size and mtime match.
+- A replica compares the manifest with its own files and fetches only what is
+  missing or changed. Large files are split into parallel HTTP range requests
+  written straight into place (pwrite), and each file is checked against its sha256.
+- Media lands first. resolved_items.json and the playlists are swapped in
+  (os.replace) only once every media file they reference is on disk; if anything
+  failed, the replica keeps its previous playlists.
+
+Usage
+  Primary, after Phase 2 (NGINX serves it under /replica/):
+    python fbreelz_replicate.py --publish
+  Replica:
+    python fbreelz_replicate.py --pull http://PRIMARY_IP/replica/ --http-base http://REPLICA_IP --delete
+  Local test with two data directories (--serve speaks HTTP Range; python -m http.server does not):
+    python fbreelz_replicate.py --data-dir /tmp/primary --publish --serve --port 8084
+    python fbreelz_replicate.py --data-dir /tmp/replica --pull http://127.0.0.1:8084/
+
+Outputs (under --data-dir, default FBREELZ_DATA_DIR or /app/data)
+- replica_manifest.json (primary)
+- replica_state.json (replica: local hashes keyed by size + mtime)
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import re
+import time
+import urllib.request
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import fbreelz_cachelayout as cachelayout
+import fbreelz_governor as governor
+
+
+DEFAULT_DATA_DIR = Path(os.environ.get("FBREELZ_DATA_DIR", "/app/data"))
+MANIFEST_NAME = "replica_manifest.json"
+STATE_NAME = "replica_state.json"
+# Swapped in this order once the media is complete: items first, then the playlists.
+META_FILES = ("resolved_items.json", "fbreelz.m3u", "fbreelz_cache.m3u", "fbreelz_cache_http.m3u", "fbreelz_prefetch.m3u")
+DEFAULT_CHUNK = 8 << 20
+DEFAULT_JOBS = 8
+RETRIES = 3
+UA = "FBReelzReplica/1"
+
+_REL_RE = re.compile(r"^cache/(?:[0-9a-f]{2}/)?[^/]+$")
+
+
+def _allowed(rel: str) -> bool:
+    """Only cache files and the known top-level files; never cookies or anything outside data/."""
+    return rel in META_FILES or (bool(_REL_RE.match(rel)) and ".." not in rel and not rel.endswith(".json"))
+
+
+def _write_json_atomic(path: Path, data: Dict[str, Any]) -> None:
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_text(json.dumps(data, indent=1, sort_keys=True), encoding="utf-8")
+    os.replace(tmp, path)
+
+
+def _load_json(path: Path) -> Dict[str, Any]:
+    try:
+        data = json.loads(path.read_text(encoding="utf-8"))
+        return data if isinstance(data, dict) else {}
+    except (OSError, ValueError):
+        return {}
+
+
+def _hashed(path: Path, old: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    st = path.stat()
+    if old and old.get("size") == st.st_size and old.get("mtime_ns") == st.st_mtime_ns and old.get("sha256"):
+        return {"size": st.st_size, "mtime_ns": st.st_mtime_ns, "sha256": old["sha256"]}
+    return {"size": st.st_size, "mtime_ns": st.st_mtime_ns, "sha256": cachelayout._sha256(path)}
+
+
+def _verified(path: Path, sha256: str) -> Dict[str, Any]:
+    """State entry for a file whose hash was just checked (no second read)."""
+    st = path.stat()
+    return {"size": st.st_size, "mtime_ns": st.st_mtime_ns, "sha256": sha256}
+
+
+# -- primary ------------------------------------------------------------------
+def _published(data_dir: Path) -> Iterator[Tuple[str, Path]]:
+    cache_dir = data_dir / "cache"
+    for p in cachelayout.iter_media(cache_dir):
+        yield f"cache/{p.relative_to(cache_dir).as_posix()}", p
+    if (cache_dir / cachelayout.LAYOUT_FILE).exists():
+        yield f"cache/{cachelayout.LAYOUT_FILE}", cache_dir / cachelayout.LAYOUT_FILE
+    for name in META_FILES:
+        if (data_dir / name).exists():
+            yield name, data_dir / name
+
+
+def publish(data_dir: Path) -> Dict[str, Any]:
+    """Write replica_manifest.json for data_dir; unchanged files are not re-hashed."""
+    old = _load_json(data_dir / MANIFEST_NAME).get("files") or {}
+    # Phase 2 already hashed downloads into the cache manifest; reuse those too.
+    for e in cachelayout.load_manifest(data_dir / "cache")["items"].values():
+        old.setdefault(f"cache/{e.get('path')}", e)
+    files = {rel: _hashed(p, old.get(rel)) for rel, p in _published(data_dir)}
+    manifest = {"version": 1, "generated_at_utc": datetime.now(timezone.utc).isoformat(), "files": files}
+    _write_json_atomic(data_dir / MANIFEST_NAME, manifest)
+    total = sum(e["size"] for e in files.values())
+    print(f"[OK] Published {len(files)} file(s), {total / 1e6:.1f} MB -> {data_dir / MANIFEST_NAME}")
+    return manifest
+
+
+# -- replica ------------------------------------------------------------------
+class _NoRanges(Exception):
+    pass
+
+
+def _fetch_range(url: str, part: Path, start: int, end: int) -> None:
+    """Fetch bytes start..end (inclusive) of url into the same offsets of `part`."""
+    headers = {"User-Agent": UA, "Range": f"bytes={start}-{end}"}
+    with urllib.request.urlopen(urllib.request.Request(url, headers=headers), timeout=60) as resp:
+        if resp.status != 206 and start != 0:
+            raise _NoRanges(url)
+        fd = os.open(part, os.O_WRONLY)
+        try:
+            off = start
+            while off <= end:
+                buf = resp.read(min(1 << 20, end + 1 - off))
+                if not buf:
+                    break
+                os.pwrite(fd, buf, off)
+                off += len(buf)
+                governor.throttle(len(buf))
+        finally:
+            os.close(fd)
+    if off != end + 1:
+        if resp.status == 200:
+            raise _NoRanges(url)
+        raise OSError(f"short read at {off} of {url}")
+
+
+def _fetch_range_retrying(url: str, part: Path, start: int, end: int) -> None:
+    for attempt in range(RETRIES):
+        try:
+            return _fetch_range(url, part, start, end)
+        except _NoRanges:
+            raise
+        except OSError:
+            if attempt == RETRIES - 1:
+                raise
+            time.sleep(2 ** attempt)
+
+
+class _Fetch:
+    """One file being fetched as parallel ranges into <name>.part."""
+
+    def __init__(self, rel: str, entry: Dict[str, Any], url: str, dest: Path) -> None:
+        self.rel = rel
+        self.entry = entry
+        self.url = url
+        self.dest = dest
+        self.part = dest.with_name(dest.name + ".part")
+        self.futures: List[Future] = []
+
+    def start(self, pool: ThreadPoolExecutor, chunk: int) -> None:
+        self.dest.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.part, "wb") as f:
+            f.truncate(self.entry["size"])
+        size = self.entry["size"]
+        for s in range(0, size, chunk):
+            self.futures.append(pool.submit(_fetch_range_retrying, self.url, self.part, s, min(size, s + chunk) - 1))
+
+    def finish(self) -> Optional[str]:
+        """Wait for the ranges and verify; returns an error or None (the .part is then ready)."""
+        try:
+            for f in self.futures:
+                f.result()
+        except _NoRanges:
+            # The server ignored Range: fall back to one plain GET.
+            try:
+                _fetch_range(self.url, self.part, 0, self.entry["size"] - 1)
+            except (OSError, _NoRanges) as e:
+                return str(e)
+        except OSError as e:
+            return str(e)
+        got = cachelayout._sha256(self.part)
+        if got != self.entry["sha256"]:
+            return f"sha256 mismatch ({got[:12]} != {self.entry['sha256'][:12]})"
+        return None
+
+
+def _is_current(path: Path, entry: Dict[str, Any], state: Dict[str, Any], rel: str) -> bool:
+    try:
+        if path.stat().st_size != entry["size"]:
+            return False
+        state[rel] = _hashed(path, state.get(rel))
+    except OSError:
+        return False
+    return state[rel]["sha256"] == entry["sha256"]
+
+
+def pull(
+    source: str,
+    data_dir: Path,
+    jobs: int = DEFAULT_JOBS,
+    chunk: int = DEFAULT_CHUNK,
+    delete: bool = False,
+    http_base: Optional[str] = None,
+) -> int:
+    base = source.rstrip("/") + "/"
+    with urllib.request.urlopen(urllib.request.Request(base + MANIFEST_NAME, headers={"User-Agent": UA}), timeout=60) as resp:
+        remote = json.loads(resp.read().decode("utf-8")).get("files") or {}
+    state = _load_json(data_dir / STATE_NAME)
+    files = {rel: e for rel, e in remote.items() if _allowed(rel)}
+    if len(files) != len(remote):
+        print(f"[WARN] Ignoring {len(remote) - len(files)} manifest path(s) outside the replicated set")
+
+    todo = [(rel, e) for rel, e in files.items() if not _is_current(data_dir / rel, e, state, rel)]
+    need = sum(e["size"] for _, e in todo)
+    print(f"[OK] Manifest: {len(files)} file(s); fetching {len(todo)} ({need / 1e6:.1f} MB)")
+
+    t0 = time.monotonic()
+    fetches = [_Fetch(rel, e, base + rel, data_dir / rel) for rel, e in todo]
+    failed: List[str] = []
+    landed: List[_Fetch] = []
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as pool:
+        for f in fetches:
+            f.start(pool, max(1 << 16, chunk))
+        for f in fetches:
+            err = f.finish()
+            if err:
+                failed.append(f.rel)
+                f.part.unlink(missing_ok=True)
+                print(f"[ERR] {f.rel}: {err}")
+            elif f.rel.startswith("cache/"):
+                os.replace(f.part, f.dest)
+                landed.append(f)
+            else:
+                landed.append(f)  # top-level files wait for the swap below
+
+    cache_dir = data_dir / "cache"
+    media = [f for f in landed if cachelayout.media_id(f.dest)]
+    if media:
+        with cachelayout._locked(cache_dir):
+            cm = cachelayout.load_manifest(cache_dir)
+            for f in media:
+                entry = _verified(f.dest, f.entry["sha256"])
+                cm["items"][cachelayout.media_id(f.dest)] = dict(entry, path=f.dest.relative_to(cache_dir).as_posix())
+            cachelayout._save_manifest(cache_dir, cm)
+    for f in landed:
+        if f.rel.startswith("cache/"):
+            state[f.rel] = _verified(f.dest, f.entry["sha256"])
+
+    meta = sorted((f for f in landed if not f.rel.startswith("cache/")), key=lambda f: META_FILES.index(f.rel))
+    if failed:
+        for f in meta:
+            f.part.unlink(missing_ok=True)
+        _write_json_atomic(data_dir / STATE_NAME, state)
+        print(f"[ERR] {len(failed)} file(s) failed; kept the previous playlists (run again to retry)")
+        return 1
+    for f in meta:
+        os.replace(f.part, f.dest)
+        state[f.rel] = _verified(f.dest, f.entry["sha256"])
+
+    if http_base and (data_dir / "resolved_items.json").exists():
+        import fbreelz_phase2_resolve as phase2
+
+        items = phase2._load_items(data_dir / "resolved_items.json")
+        phase2._write_http_m3u(data_dir / "fbreelz_cache_http.m3u", "FBReelz (Cache HTTP)", items, http_base=http_base)
+        print(f"[OK] Rewrote fbreelz_cache_http.m3u for {http_base}")
+
+    if delete:
+        removed = 0
+        for p in list(cachelayout.iter_media(cache_dir)):
+            rel = f"cache/{p.relative_to(cache_dir).as_posix()}"
+            if rel not in files:
+                p.unlink(missing_ok=True)
+                state.pop(rel, None)
+                if cachelayout.media_id(p):
+                    cachelayout.forget(cache_dir, cachelayout.media_id(p))
+                removed += 1
+        if removed:
+            print(f"[OK] Deleted {removed} file(s) no longer on the primary")
+
+    state = {rel: e for rel, e in state.items() if rel in files}
+    _write_json_atomic(data_dir / STATE_NAME, state)
+    secs = time.monotonic() - t0
+    print(f"[OK] Replicated {len(landed)} file(s), {need / 1e6:.1f} MB in {secs:.0f}s ({need / 1e6 / max(secs, 1e-3):.1f} MB/s)")
+    return 0
+
+
+# -- serving (local testing; production uses NGINX /replica/) ------------------
+_RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def _make_handler(data_dir: Path):
+    class Handler(BaseHTTPRequestHandler):
+        server_version = "FBReelzReplica/1"
+
+        def do_HEAD(self) -> None:  # noqa: N802
+            self._serve(body=False)
+
+        def do_GET(self) -> None:  # noqa: N802
+            self._serve(body=True)
+
+        def _serve(self, body: bool) -> None:
+            rel = self.path.split("?", 1)[0].lstrip("/")
+            if rel != MANIFEST_NAME and not _allowed(rel):
+                self.send_error(404)
+                return
+            path = data_dir / rel
+            try:
+                size = path.stat().st_size
+            except OSError:
+                self.send_error(404)
+                return
+            start, end = 0, size - 1
+            m = _RANGE_RE.match(self.headers.get("Range") or "")
+            if m and (m.group(1) or m.group(2)):
+                if m.group(1):
+                    start, end = int(m.group(1)), min(size - 1, int(m.group(2) or size - 1))
+                else:
+                    start = max(0, size - int(m.group(2)))
+                if start > end:
+                    self.send_response(416)
+                    self.send_header("Content-Range", f"bytes */{size}")
+                    self.end_headers()
+                    return
+                self.send_response(206)
+                self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+            else:
+                self.send_response(200)
+            self.send_header("Accept-Ranges", "bytes")
+            self.send_header("Content-Length", str(end - start + 1))
+            self.end_headers()
+            if not body:
+                return
+            with open(path, "rb") as f:
+                f.seek(start)
+                left = end - start + 1
+                while left > 0:
+                    buf = f.read(min(1 << 20, left))
+                    if not buf:
+                        break
+                    self.wfile.write(buf)
+                    left -= len(buf)
+
+        def log_message(self, fmt: str, *args: Any) -> None:
+            pass
+
+    return Handler
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="Replicate the FBReelz cache and playlists from a primary to edge boxes")
+    ap.add_argument("--data-dir", default=str(DEFAULT_DATA_DIR), help=f"Data directory (default: {DEFAULT_DATA_DIR})")
+    ap.add_argument("--publish", action="store_true", help="Primary: write replica_manifest.json")
+    ap.add_argument("--pull", default=None, metavar="URL", help="Replica: mirror from this base URL, e.g. http://PRIMARY_IP/replica/")
+    ap.add_argument("--jobs", type=int, default=DEFAULT_JOBS, help=f"Parallel range requests (default: {DEFAULT_JOBS})")
+    ap.add_argument("--chunk", type=int, default=DEFAULT_CHUNK, help=f"Range size in bytes (default: {DEFAULT_CHUNK})")
+    ap.add_argument("--delete", action="store_true", help="Replica: delete cached media the primary no longer has")
+    ap.add_argument("--http-base", default=None, help="Replica: rewrite fbreelz_cache_http.m3u for this host, e.g. http://REPLICA_IP")
+    ap.add_argument("--serve", action="store_true", help="Serve the manifest and files with HTTP Range support (testing)")
+    ap.add_argument("--bind", default="0.0.0.0", help="--serve bind address (default: 0.0.0.0)")
+    ap.add_argument("--port", type=int, default=8084, help="--serve port (default: 8084)")
+    args = ap.parse_args()
+
+    data_dir = Path(args.data_dir)
+    if not (args.publish or args.pull or args.serve):
+        ap.error("one of --publish, --pull or --serve is required")
+    if args.publish:
+        publish(data_dir)
+    if args.pull:
+        rc = pull(args.pull, data_dir, jobs=args.jobs, chunk=args.chunk, delete=args.delete, http_base=args.http_base)
+        if rc:
+            return rc
+    if args.serve:
+        httpd = ThreadingHTTPServer((args.bind, args.port), _make_handler(data_dir))
+        print(f"[OK] Serving {data_dir} for replicas on http://{args.bind}:{args.port}/")
+        try:
+            httpd.serve_forever()
+        except KeyboardInterrupt:
+            pass
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,154 @@
+## version 1
+"""FBReelz static catalog shards: the feed as precompressed files NGINX serves directly.
+
+Purpose
+- The Node /api/videos endpoint readdir()s the whole cache on every feed load.
+- At the end of Phase 2 the catalog is written as paginated JSON pages under
+  <data>/catalog/, each with a .gz twin (NGINX gzip_static), so loading the feed
+  needs no application process at all.
+- Page names carry a content hash (page-0003.<hash>.json), so they can be cached
+  forever; only index.json (never cached) changes between runs. Unchanged pages
+  keep their name and are not rewritten.
+- Entries carry stable reel IDs, real titles, durations and thumbnails. Thumbnails
+  are copied to catalog/thumbs/ because the signed CDN thumbnail URLs expire.
+
+Layout
+  catalog/index.json(.gz)              {"generated_at_utc", "total", "page_size", "pages": [{"url", "count"}]}
+  catalog/page-0000.<hash>.json(.gz)   {"page": 0, "items": [...]}
+  catalog/thumbs/<id>.jpg
+"""
+
+from __future__ import annotations
+
+import gzip
+import hashlib
+import json
+import os
+import re
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+import fbreelz_cachelayout as cachelayout
+
+
+DEFAULT_CATALOG_DIR = Path("/app/data/catalog")
+DEFAULT_PAGE_SIZE = 100
+URL_PREFIX = "/catalog/"
+UA = "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36"
+
+_PAGE_RE = re.compile(r"^page-\d+\.[0-9a-f]{12}\.json(?:\.gz)?$")
+
+
+def entry(it: Dict[str, Any], rid: str, thumb: Optional[str] = None) -> Dict[str, Any]:
+    """Public catalog entry for a resolved item (also used by the catalog search API)."""
+    if it.get("downloaded_path"):
+        play = f"/cache/{cachelayout.rel_path(it['downloaded_path'])}"
+    elif it.get("head_cached_path"):
+        play = f"/m/{rid}"
+    else:
+        play = f"/r/{rid}"
+    return {
+        "id": rid,
+        "title": it.get("title") or "",
+        "duration": it.get("duration"),
+        "thumbnail": thumb or it.get("thumbnail"),
+        "first_seen_utc": it.get("first_seen_utc"),
+        "source_url": it.get("source_url"),
+        "url": play,
+    }
+
+
+def _write_atomic(path: Path, data: bytes) -> None:
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_bytes(data)
+    os.replace(tmp, path)
+
+
+def _write_pair(path: Path, data: bytes) -> None:
+    """Write `path` and its gzip_static twin; mtime=0 keeps the .gz byte-identical across runs."""
+    _write_atomic(path.with_name(path.name + ".gz"), gzip.compress(data, compresslevel=9, mtime=0))
+    _write_atomic(path, data)
+
+
+def _fetch_thumb(url: str, dest: Path) -> bool:
+    try:
+        req = urllib.request.Request(url, headers={"User-Agent": UA})
+        with urllib.request.urlopen(req, timeout=20) as resp:
+            data = resp.read()
+        if not data:
+            return False
+        _write_atomic(dest, data)
+        return True
+    except Exception:
+        return False
+
+
+def _local_thumbs(rows: List[Tuple[str, Dict[str, Any]]], thumbs_dir: Path, workers: int = 4) -> Dict[str, str]:
+    """reel-id -> /catalog/thumbs/<id>.jpg, fetching the ones not on disk yet."""
+    thumbs_dir.mkdir(parents=True, exist_ok=True)
+    out: Dict[str, str] = {}
+    todo: List[Tuple[str, str]] = []
+    for rid, it in rows:
+        if (thumbs_dir / f"{rid}.jpg").exists():
+            out[rid] = f"{URL_PREFIX}thumbs/{rid}.jpg"
+        elif it.get("thumbnail"):
+            todo.append((rid, it["thumbnail"]))
+    if todo:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            fetched = list(pool.map(lambda t: _fetch_thumb(t[1], thumbs_dir / f"{t[0]}.jpg"), todo))
+        for (rid, _), ok in zip(todo, fetched):
+            if ok:
+                out[rid] = f"{URL_PREFIX}thumbs/{rid}.jpg"
+        print(f"[OK] Catalog thumbnails: fetched {sum(fetched)} / {len(todo)}")
+    return out
+
+
+def _referenced(index_path: Path) -> Set[str]:
+    try:
+        index = json.loads(index_path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return set()
+    return {Path(p.get("url", "")).name for p in index.get("pages") or []}
+
+
+def write_catalog(
+    rows: List[Tuple[str, Dict[str, Any]]],
+    catalog_dir: Path = DEFAULT_CATALOG_DIR,
+    page_size: int = DEFAULT_PAGE_SIZE,
+    thumbs: bool = True,
+) -> Path:
+    """Write index.json + content-hashed pages for (reel_id, item) rows in feed order."""
+    catalog_dir.mkdir(parents=True, exist_ok=True)
+    local = _local_thumbs(rows, catalog_dir / "thumbs") if thumbs else {}
+    entries = [entry(it, rid, local.get(rid)) for rid, it in rows]
+
+    pages: List[Dict[str, Any]] = []
+    written = 0
+    for n, start in enumerate(range(0, len(entries), max(1, page_size))):
+        chunk = entries[start : start + page_size]
+        data = json.dumps({"page": n, "items": chunk}, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        name = f"page-{n:04d}.{hashlib.sha256(data).hexdigest()[:12]}.json"
+        if not (catalog_dir / name).exists() or not (catalog_dir / (name + ".gz")).exists():
+            _write_pair(catalog_dir / name, data)
+            written += 1
+        pages.append({"url": URL_PREFIX + name, "count": len(chunk)})
+
+    index_path = catalog_dir / "index.json"
+    # Keep the previous generation's pages so clients holding the old index can finish paging.
+    keep = {Path(p["url"]).name for p in pages} | _referenced(index_path)
+    index = {
+        "generated_at_utc": datetime.now(timezone.utc).isoformat(),
+        "total": len(entries),
+        "page_size": page_size,
+        "pages": pages,
+    }
+    _write_pair(index_path, json.dumps(index, ensure_ascii=False, separators=(",", ":")).encode("utf-8"))
+
+    for p in catalog_dir.iterdir():
+        if _PAGE_RE.match(p.name) and p.name.removesuffix(".gz") not in keep:
+            p.unlink(missing_ok=True)
+    print(f"[OK] Catalog: {len(entries)} items in {len(pages)} page(s), {written} rewritten -> {catalog_dir}")
+    return index_path
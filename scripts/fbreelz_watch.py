@@ -0,0 +1,212 @@
+## version 1
+"""FBReelz watch daemon: keep a warm browser and pick up new saves within minutes.
+
+Purpose
+- The daily timer pays a cold Chromium + interpreter start for every run, and
+  new saves wait up to 24 hours to reach the cache.
+- This daemon launches Chromium once, keeps one logged-in context open and
+  re-polls the Saved page every --interval seconds.
+- Scanning stops at the first item that is already known (Saved is newest
+  first), so a poll with no new saves is a single page load.
+- Only the new items are resolved/downloaded (Phase-2 helpers); they are
+  merged into the current resolved_items.json (re-read before every write, so
+  changes made by Phase 2, the queue or dedupe are kept) and the playlists are rewritten.
+
+Usage
+  python fbreelz_watch.py --interval 300 --download
+  python fbreelz_watch.py --once --download --http-base http://YOUR_SERVER_IP
+
+Outputs (under FBREELZ_DATA_DIR, default /opt/fbreelz/data)
+- resolved_items.json, fbreelz.m3u, fbreelz_cache.m3u, fbreelz_cache_http.m3u
+- catalog/ (static feed shards, see fbreelz_shards.py)
+- cache/facebook_<id>.<ext>
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import List, Optional, Set
+
+from playwright.async_api import async_playwright
+
+import fbreelz_cookies as fbcookies
+import fbreelz_phase1_playwright as phase1
+import fbreelz_phase2_resolve as phase2
+
+
+DATA_DIR = phase1.DATA_DIR
+RESOLVED_JSON = DATA_DIR / "resolved_items.json"
+CACHE_DIR = DATA_DIR / "cache"
+RUNTIME_COOKIES = DATA_DIR / "cookies_runtime.txt"
+
+
+def _load_resolved(path: Path) -> List[phase2.ItemOut]:
+    try:
+        return phase2._load_items(path)
+    except (OSError, json.JSONDecodeError) as e:
+        print(f"[WARN] Could not read {path}: {e} - starting with an empty list")
+        return []
+
+
+def _current_items(path: Path) -> List[phase2.ItemOut]:
+    """resolved_items.json as it is on disk right now; raises if it exists but cannot be read.
+
+    Phase 2, the pipeline, the queue workers and dedupe rewrite this file while the
+    daemon runs, so it is re-read before every write instead of trusting the copy
+    loaded at startup.
+    """
+    return phase2._load_items(path)
+
+
+def _known_urls(items: List[phase2.ItemOut]) -> Set[str]:
+    known = {it.source_url for it in items}
+    # Items captured by a normal Phase-1 run (saved_index.json) count as known too.
+    known.update(phase1._load_index(phase1.INDEX_JSON)["items"])
+    return known
+
+
+def _record_seen(urls: List[str]) -> None:
+    """Prepend new saves to Phase 1's seen-index so its next delta does not re-add them."""
+    index = phase1._load_index(phase1.INDEX_JSON)
+    now = datetime.now(timezone.utc).isoformat()
+    for u in urls:
+        index["items"].setdefault(u, {"first_seen_utc": now, "sources": ["default|saved"]})
+    new = set(urls)
+    index["order"] = urls + [u for u in index["order"] if u not in new]
+    phase1._save_index(phase1.INDEX_JSON, index)
+
+
+def _process_new(urls: List[str], args: argparse.Namespace, cookies: Optional[Path]) -> List[phase2.ItemOut]:
+    out: List[phase2.ItemOut] = []
+    for i, url in enumerate(urls, 1):
+        it = phase2.ItemOut(source_url=url, first_seen_utc=datetime.now(timezone.utc).isoformat())
+        if args.ytdlp:
+            phase2._resolve_item(it, cookies=cookies, user_agent=args.user_agent)
+            if args.download:
+                label = it.title or it.source_url
+                print(f"[DL] {i} / {len(urls)}: {label}")
+                if phase2._download_item(it, cache_dir=CACHE_DIR, cookies=cookies, user_agent=args.user_agent):
+                    print(f"[OK] Downloaded {i} / {len(urls)}: {label}")
+        out.append(it)
+    return out
+
+
+class Watcher:
+    def __init__(self, args: argparse.Namespace) -> None:
+        self.args = args
+        self.items = _load_resolved(RESOLVED_JSON)
+        self.known = _known_urls(self.items)
+        self.cookies_mtime: Optional[float] = None
+
+    async def _refresh_cookies(self, context) -> None:
+        """(Re)load cookies into the warm context whenever cookies.txt changes on disk."""
+        jar = fbcookies.load(phase1.DEFAULT_COOKIES)
+        if jar.mtime is None or jar.mtime == self.cookies_mtime:
+            return
+        if jar.cookies:
+            await context.clear_cookies()
+            await context.add_cookies(jar.playwright())
+            print(f"[OK] Loaded {len(jar)} cookies from {jar.path}")
+        self.cookies_mtime = jar.mtime
+
+    async def poll(self, context, page) -> int:
+        await self._refresh_cookies(context)
+        res = await phase1._load_saved_page(page, phase1.SAVED_URLS, "watch", "saved")
+        if not res.html:
+            print("[WARN] Could not load Saved page this round.")
+            return 0
+
+        links, reason = await phase1._collect_links(page, self.args.max, stop_at=self.known.__contains__)
+        new = [u for u in links if u not in self.known]
+        if not new:
+            print(f"[OK] No new saves ({len(self.known)} known).")
+            return 0
+
+        where = "reached a known item" if reason == "known" else "no known item found in range"
+        print(f"[OK] {len(new)} new save(s) ({where}).")
+        cookies = fbcookies.runtime_file(phase1.DEFAULT_COOKIES, RUNTIME_COOKIES)
+        fresh = await asyncio.to_thread(_process_new, new, self.args, cookies)
+
+        # Merge into the file as it is now (never over it); raises before anything is
+        # marked as seen if it cannot be read, so the next poll retries.
+        current = _current_items(RESOLVED_JSON)
+        on_disk = {it.source_url for it in current}
+        # Saved is newest first, so new items go to the front.
+        self.items = [it for it in fresh if it.source_url not in on_disk] + current
+        self.known.update(new)
+        self.known.update(on_disk)
+        _record_seen(new)
+        phase2._write_outputs(
+            self.items,
+            input_path=RESOLVED_JSON,
+            detected_format="watch",
+            input_count=len(self.items),
+            out_path=RESOLVED_JSON,
+            m3u_path=DATA_DIR / "fbreelz.m3u",
+            cache_m3u_path=DATA_DIR / "fbreelz_cache.m3u",
+            http_m3u_path=DATA_DIR / "fbreelz_cache_http.m3u",
+            playlist_title=self.args.playlist_title,
+            download=self.args.download,
+            http_base=self.args.http_base,
+            cache_dir=CACHE_DIR,
+            catalog_dir=DATA_DIR / "catalog",
+        )
+        print(f"[OK] Wrote resolved items to: {RESOLVED_JSON} ({len(self.items)} total)")
+        return len(new)
+
+
+async def _run(args: argparse.Namespace) -> int:
+    watcher = Watcher(args)
+    print(f"[OK] Watching Saved every {args.interval}s ({len(watcher.known)} known items).")
+
+    async with async_playwright() as p:
+        browser = await p.chromium.launch(headless=not args.headed)
+        context = await browser.new_context(user_agent=os.environ.get("FBREELZ_UA", phase1.DEFAULT_UA))
+        page = await context.new_page()
+        try:
+            while True:
+                started = time.monotonic()
+                try:
+                    await watcher.poll(context, page)
+                except Exception as e:  # keep the daemon alive across transient failures
+                    print(f"[WARN] Poll failed: {e}")
+                if args.once:
+                    break
+                await asyncio.sleep(max(0.0, args.interval - (time.monotonic() - started)))
+        finally:
+            await browser.close()
+    return 0
+
+
+def main() -> int:
+    ap = argparse.ArgumentParser(description="FBReelz watch daemon (warm browser, delta polling)")
+    ap.add_argument("--interval", type=int, default=300, help="Seconds between polls (default: 300)")
+    ap.add_argument("--max", type=int, default=50, help="Max new items to pick up per poll (default: 50)")
+    ap.add_argument("--once", action="store_true", help="Poll once and exit")
+    ap.add_argument("--headed", action="store_true", help="Run with a visible browser (requires DISPLAY or Xvfb)")
+    ap.add_argument("--no-ytdlp", dest="ytdlp", action="store_false", help="Skip yt-dlp resolution")
+    ap.add_argument("--download", action="store_true", help="Download new items to the cache")
+    ap.add_argument("--http-base", default=None, help="Base URL for HTTP playlist, e.g. http://YOUR_SERVER_IP")
+    ap.add_argument("--playlist-title", default="FBReelz", help="Playlist title")
+    ap.add_argument("--user-agent", default=None, help="User-Agent to pass to yt-dlp")
+    args = ap.parse_args()
+
+    DATA_DIR.mkdir(parents=True, exist_ok=True)
+    if args.ytdlp and not phase2._yt_dlp_exists():
+        print("[WARN] yt-dlp not available; new items will be listed with source URLs only.")
+        args.ytdlp = False
+
+    try:
+        return asyncio.run(_run(args))
+    except KeyboardInterrupt:
+        return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,84 @@
+## version 1
+"""Catalog cursor pagination (scripts/fbreelz_catalog.py).
+
+Usage
+  python -m pytest -q tests
+"""
+
+from __future__ import annotations
+
+import json
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "scripts"))
+
+from fbreelz_catalog import Catalog  # noqa: E402
+
+
+def _catalog(tmp: Path, n: int = 5) -> Catalog:
+    items = [
+        {
+            "source_url": f"https://www.facebook.com/reel/{100 + i}",
+            "title": f"reel {i}",
+            "duration": 10 + i,
+            "first_seen_utc": f"2026-01-0{1 + i}T00:00:00+00:00",
+        }
+        for i in range(n)
+    ]
+    path = tmp / "resolved_items.json"
+    path.write_text(json.dumps({"items": items}), encoding="utf-8")
+    catalog = Catalog(path)
+    catalog.maybe_reload()
+    return catalog
+
+
+class CursorTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self._tmp = tempfile.TemporaryDirectory()
+        self.catalog = _catalog(Path(self._tmp.name))
+
+    def tearDown(self) -> None:
+        self._tmp.cleanup()
+
+    def test_pages_cover_every_item_once(self) -> None:
+        for sort in ("saved", "duration"):
+            seen, cursor = [], None
+            while True:
+                res = self.catalog.search(sort=sort, limit=2, cursor=cursor)
+                seen += [it["id"] for it in res["items"]]
+                cursor = res["next_cursor"]
+                if not cursor:
+                    break
+            self.assertEqual(sorted(seen), [str(100 + i) for i in range(5)])
+
+    def test_cursor_from_another_sort_is_rejected(self) -> None:
+        by_duration = self.catalog.search(sort="duration", limit=2)["next_cursor"]
+        by_saved = self.catalog.search(sort="saved", limit=2)["next_cursor"]
+        with self.assertRaisesRegex(ValueError, "invalid cursor"):
+            self.catalog.search(sort="saved", cursor=by_duration)
+        with self.assertRaisesRegex(ValueError, "invalid cursor"):
+            self.catalog.search(sort="duration", cursor=by_saved)
+
+    def test_cursor_from_other_direction_or_garbage_is_rejected(self) -> None:
+        cursor = self.catalog.search(sort="saved", desc=True, limit=2)["next_cursor"]
+        for bad in (cursor, "not-a-cursor", "W10"):
+            with self.assertRaisesRegex(ValueError, "invalid cursor"):
+                self.catalog.search(sort="saved", desc=False, cursor=bad)
+
+
+class ReloadTest(unittest.TestCase):
+    def test_truncated_file_keeps_previous_index(self) -> None:
+        with tempfile.TemporaryDirectory() as tmp:
+            catalog = _catalog(Path(tmp))
+            catalog.path.write_text('{"items": [{"source_url": "https://www.facebook.com/reel/1', encoding="utf-8")
+            catalog._checked = 0.0
+            catalog._mtime = None  # force the re-read
+            catalog.maybe_reload()
+            self.assertEqual(len(catalog.search(limit=50)["items"]), 5)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,86 @@
+## version 1
+"""Head-of-file cache against a local Range server (scripts/fbreelz_headcache.py).
+
+Usage
+  python -m pytest -q tests
+"""
+
+from __future__ import annotations
+
+import re
+import sys
+import tempfile
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "scripts"))
+
+from fbreelz_headcache import HeadCache, UpstreamChanged  # noqa: E402
+
+
+class _Upstream(BaseHTTPRequestHandler):
+    body = b""
+    short = 0  # bytes to hold back from each response body
+
+    def do_GET(self) -> None:  # noqa: N802
+        m = re.match(r"bytes=(\d+)-(\d*)", self.headers.get("Range") or "")
+        start = int(m.group(1)) if m else 0
+        end = min(len(self.body), int(m.group(2)) + 1) if m and m.group(2) else len(self.body)
+        self.send_response(206)
+        self.send_header("Content-Range", f"bytes {start}-{end - 1}/{len(self.body)}")
+        self.send_header("Content-Length", str(end - start - self.short))
+        self.end_headers()
+        self.wfile.write(self.body[start : end - self.short])
+
+    def log_message(self, *args) -> None:
+        pass
+
+
+class HeadCacheTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self._tmp = tempfile.TemporaryDirectory()
+        self.cache = HeadCache(Path(self._tmp.name))
+        _Upstream.body, _Upstream.short = bytes(range(256)) * 64, 0
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), _Upstream)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f"http://127.0.0.1:{self.server.server_port}/v.mp4"
+
+    def tearDown(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+        self._tmp.cleanup()
+
+    def _serve(self, start: int, end: int) -> bytes:
+        out, begun = [], []
+        self.cache.serve("1", start, end, lambda refresh: self.url, out.append, lambda: begun.append(True))
+        self.assertEqual(begun, [True])
+        return b"".join(out)
+
+    def test_serves_head_from_disk_and_fills_the_rest(self) -> None:
+        self.cache.prime("1", self.url, 1000)
+        self.assertEqual(self._serve(500, 5000), _Upstream.body[500:5000])
+        self.assertEqual(self.cache.meta("1")["ranges"], [[0, 5000]])
+
+    def test_changed_upstream_raises_before_headers_and_drops_cache(self) -> None:
+        self.cache.prime("1", self.url, 1000)
+        _Upstream.body += b"x"
+        begun = []
+        with self.assertRaises(UpstreamChanged):
+            self.cache.serve("1", 0, 5000, lambda refresh: self.url, lambda b: None, lambda: begun.append(True))
+        self.assertEqual(begun, [])
+        self.assertIsNone(self.cache.meta("1"))
+        self.assertFalse(self.cache.media_path("1").exists())
+
+    def test_short_upstream_read_is_an_error(self) -> None:
+        self.cache.prime("1", self.url, 1000)
+        _Upstream.short = 10
+        with self.assertRaisesRegex(RuntimeError, "upstream ended after"):
+            self._serve(0, 5000)
+        # only what actually arrived is recorded as cached
+        self.assertEqual(self.cache.meta("1")["ranges"], [[0, 4990]])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,66 @@
+## version 1
+"""Phase 1 snapshot diff (scripts/fbreelz_phase1_playwright.py _diff_snapshot).
+
+Usage
+  python -m pytest -q tests
+"""
+
+from __future__ import annotations
+
+import importlib.util
+import sys
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "scripts"))
+
+HAVE_PLAYWRIGHT = importlib.util.find_spec("playwright") is not None
+if HAVE_PLAYWRIGHT:
+    from fbreelz_phase1_playwright import ScrapeResult, _diff_snapshot  # noqa: E402
+
+
+def _reel(n: int) -> str:
+    return f"https://www.facebook.com/reel/{n}"
+
+
+def _index(*lists: str) -> dict:
+    """Two items per list key: reel 1-2 for the first key, 3-4 for the second, ..."""
+    order, items = [], {}
+    for i, key in enumerate(lists):
+        for n in (2 * i + 1, 2 * i + 2):
+            order.append(_reel(n))
+            items[_reel(n)] = {"sources": [key]}
+    return {"order": order, "items": items}
+
+
+@unittest.skipUnless(HAVE_PLAYWRIGHT, "playwright not installed")
+class DiffSnapshotTest(unittest.TestCase):
+    def test_page_loaded_without_links_removes_nothing(self) -> None:
+        # e.g. a login or checkpoint page: HTML, no links, ran to the "end".
+        index = _index("a|saved")
+        res = ScrapeResult("a", "saved", html="<html>log in</html>", links=[], stop_reason="end")
+        order, sources, added, removed = _diff_snapshot(index, [res])
+        self.assertEqual(removed, [])
+        self.assertEqual(order, [_reel(1), _reel(2)])
+        self.assertEqual(sources[_reel(1)], ["a|saved"])
+
+    def test_one_bad_profile_does_not_wipe_its_list(self) -> None:
+        index = _index("a|saved", "b|saved")
+        good = ScrapeResult("a", "saved", html="<html/>", links=[_reel(1)], stop_reason="end")
+        bad = ScrapeResult("b", "saved", html="<html>checkpoint</html>", links=[], stop_reason="end")
+        order, _, added, removed = _diff_snapshot(index, [good, bad])
+        self.assertEqual(removed, [_reel(2)])
+        self.assertEqual(added, [])
+        self.assertEqual(set(order), {_reel(1), _reel(3), _reel(4)})
+
+    def test_full_scrape_still_removes_unsaved_items(self) -> None:
+        index = _index("a|saved")
+        res = ScrapeResult("a", "saved", html="<html/>", links=[_reel(2), _reel(9)], stop_reason="end")
+        order, _, added, removed = _diff_snapshot(index, [res])
+        self.assertEqual(removed, [_reel(1)])
+        self.assertEqual(added, [_reel(9)])
+        self.assertEqual(order, [_reel(2), _reel(9)])
+
+
+if __name__ == "__main__":
+    unittest.main()
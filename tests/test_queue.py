@@ -0,0 +1,62 @@
+## version 1
+"""Job queue re-runs (scripts/fbreelz_queue.py JobQueue).
+
+Usage
+  python -m pytest -q tests
+"""
+
+from __future__ import annotations
+
+import sys
+import tempfile
+import time
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "scripts"))
+
+from fbreelz_queue import RETRY_BASE, JobQueue  # noqa: E402
+
+
+class RerunTest(unittest.TestCase):
+    def setUp(self) -> None:
+        self._tmp = tempfile.TemporaryDirectory()
+        self.q = JobQueue(Path(self._tmp.name) / "queue.sqlite")
+
+    def tearDown(self) -> None:
+        self.q.db.close()
+        self._tmp.cleanup()
+
+    def _row(self):
+        return self.q.db.execute("SELECT state, not_before, rerun, attempts, payload FROM jobs").fetchone()
+
+    def test_rerun_after_complete_waits_for_the_debounce(self) -> None:
+        self.q.enqueue("publish", "all")
+        job = self.q.claim(["publish"], "w1")
+        self.q.enqueue("publish", "all", requeue=True, delay=10)
+        before = time.time()
+        self.assertTrue(self.q.complete(job, "w1"))
+        state, not_before, rerun, _, _ = self._row()
+        self.assertEqual((state, rerun), ("queued", 0))
+        self.assertGreaterEqual(not_before, before + 10)
+        self.assertIsNone(self.q.claim(["publish"], "w2"))
+
+    def test_fail_keeps_a_pending_rerun(self) -> None:
+        self.q.enqueue("download", "1", {"v": 1}, max_attempts=1)
+        job = self.q.claim(["download"], "w1")
+        self.q.enqueue("download", "1", {"v": 2}, requeue=True)
+        before = time.time()
+        self.assertEqual(self.q.fail(job, "w1", "boom"), "queued")
+        state, not_before, rerun, attempts, payload = self._row()
+        self.assertEqual((state, rerun, attempts, payload), ("queued", 0, 0, '{"v": 2}'))
+        self.assertGreaterEqual(not_before, before + RETRY_BASE)
+
+    def test_fail_without_rerun_gives_up_after_max_attempts(self) -> None:
+        self.q.enqueue("download", "1", max_attempts=1)
+        job = self.q.claim(["download"], "w1")
+        self.assertEqual(self.q.fail(job, "w1", "boom"), "failed")
+        self.assertEqual(self._row()[0], "failed")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -120,6 +120,7 @@ function FBReelsClone() {
     const [liked, setLiked] = useState({});
     const [loading, setLoading] = useState(true);
     const [error, setError] = useState(null);
+    const [total, setTotal] = useState(null);
     
     const videoRef = useRef(null);
     const containerRef = useRef(null);
@@ -132,8 +133,69 @@ function FBReelsClone() {
         loadVideos();
     }, []);
 
+    // Static feed written by Phase 2 (served by NGINX from /catalog/). Only index.json and the
+    // first page load up front; later pages are fetched as the viewer nears the end.
+    const catalogPages = useRef([]);
+    const nextPage = useRef(0);
+    const pageLoading = useRef(false);
+
+    const toVideo = item => ({
+        ...item,
+        filename: item.title || item.id,
+        url: `${API_BASE_URL}${item.url}`,
+        likes: 0,
+        comments: 0,
+        shares: 0
+    });
+
+    const fetchPage = async (n) => {
+        const res = await fetch(`${API_BASE_URL}${catalogPages.current[n].url}`);
+        if (!res.ok) throw new Error(`HTTP error! status: ${res.status}`);
+        const { items } = await res.json();
+        nextPage.current = n + 1;
+        return items.map(toVideo);
+    };
+
+    // First catalog page, or null if there is no catalog yet.
+    const loadCatalog = async () => {
+        const index = await fetch(`${API_BASE_URL}/catalog/index.json`);
+        if (!index.ok) return null;
+        const { pages, total } = await index.json();
+        if (!pages || pages.length === 0) return null;
+        catalogPages.current = pages;
+        nextPage.current = 0;
+        setTotal(total || null);
+        return fetchPage(0);
+    };
+
+    const loadMore = async () => {
+        if (pageLoading.current || nextPage.current >= catalogPages.current.length) return;
+        pageLoading.current = true;
+        try {
+            const more = await fetchPage(nextPage.current);
+            setVideos(prev => prev.concat(more));
+        } catch (err) {
+            console.error('Failed to load catalog page:', err);
+        } finally {
+            pageLoading.current = false;
+        }
+    };
+
+    useEffect(() => {
+        if (videos.length > 0 && currentIndex >= videos.length - 3) {
+            loadMore();
+        }
+    }, [currentIndex, videos.length]);
+
     const loadVideos = async () => {
         try {
+            const catalog = await loadCatalog().catch(() => null);
+            if (catalog && catalog.length > 0) {
+                setVideos(catalog);
+                setLoading(false);
+                return;
+            }
+
             const response = await fetch(`${API_BASE_URL}/api/videos`);
             
             if (!response.ok) {
@@ -284,6 +346,7 @@ function FBReelsClone() {
                     ref={videoRef}
                     key={videos[currentIndex]?.id}
                     src={videos[currentIndex]?.url}
+                    poster={videos[currentIndex]?.thumbnail || undefined}
                     className="w-full h-full object-contain"
                     loop
                     playsInline
@@ -300,7 +363,7 @@ function FBReelsClone() {
             <div className="absolute top-0 left-0 right-0 p-4 bg-gradient-to-b from-black/60 to-transparent z-10">
                 <div className="flex items-center justify-between text-white">
                     <div className="text-lg font-semibold">Reels</div>
-                    <div className="text-sm">{currentIndex + 1} / {videos.length}</div>
+                    <div className="text-sm">{currentIndex + 1} / {total || videos.length}</div>
                 </div>
             </div>
 
@@ -386,12 +449,27 @@ const VIDEO_DIR = '/opt/fbreelz/data/cache';
 app.use(cors());
 app.use(express.json());
 
-app.get('/api/videos', async (req, res) => {
+// Cache-relative paths of every MP4. A sharded cache (fbreelz_cachelayout.py) keeps
+// them in manifest.json, so the cache directory never has to be listed. A flat cache
+// may also have a manifest, but it only lists files downloaded since it was created,
+// so it is only trusted when cache/.layout says "sharded".
+async function listVideoFiles() {
   try {
+    const layout = (await fs.readFile(path.join(VIDEO_DIR, '.layout'), 'utf8')).trim();
+    if (layout !== 'sharded') throw new Error('flat cache');
+    const manifest = JSON.parse(await fs.readFile(path.join(VIDEO_DIR, 'manifest.json'), 'utf8'));
+    return Object.values(manifest.items || {})
+      .map(entry => entry.path)
+      .filter(p => p.toLowerCase().endsWith('.mp4'));
+  } catch (err) {
     const files = await fs.readdir(VIDEO_DIR);
-    const videoFiles = files.filter(file => 
-      file.toLowerCase().endsWith('.mp4')
-    );
+    return files.filter(file => file.toLowerCase().endsWith('.mp4'));
+  }
+}
+
+app.get('/api/videos', async (req, res) => {
+  try {
+    const videoFiles = await listVideoFiles();
 
     const videos = videoFiles.map((filename, index) => ({
       id: index + 1,